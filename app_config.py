@@ -0,0 +1,49 @@
+# Application-wide settings and locations for files the PAR Data Visualizer
+# writes on its own (caches, indexes, logs). Everything lives under a single
+# per-user folder. Settings are kept in a small JSON file in that folder:
+#
+# {
+#   "colormaps_path": "path/to/colormaps.mat",
+#   ...
+# }
+from pathlib import Path
+import json
+
+APP_DIR = Path.home() / '.pardataviz'
+CONFIG_PATH = APP_DIR / 'config.json'
+
+_settings = None
+
+def get_app_dir() -> Path:
+    APP_DIR.mkdir(parents=True, exist_ok=True)
+    return APP_DIR
+
+def get_cache_dir(*parts: str) -> Path:
+    """
+    Get (and create if needed) a cache folder under the application folder,
+    e.g. get_cache_dir('index').
+    """
+    cache_dir = get_app_dir().joinpath('cache', *parts)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+def _load_settings() -> dict:
+    global _settings
+    if _settings is None:
+        try:
+            with CONFIG_PATH.open("r") as config_file:
+                _settings = json.load(config_file)
+        except (OSError, ValueError):
+            _settings = {}
+    return _settings
+
+def get_setting(key: str, default=None):
+    return _load_settings().get(key, default)
+
+def set_setting(key: str, value) -> None:
+    """Change a setting and save the configuration file."""
+    settings = _load_settings()
+    settings[key] = value
+    get_app_dir()
+    with CONFIG_PATH.open("w") as config_file:
+        json.dump(settings, config_file, indent=4)
@@ -1,17 +1,57 @@
-from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal, Slot
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, QTimer, Signal, Slot
 from PySide6.QtWidgets import QApplication, QWidget
 from radar_volume import RadarVolume
+from product_statistics import compute_volume_statistics
+from tracing import tracer
 import threading
+import queue
+import time
+
+class LoadResult(object):
+    """
+    The outcome of loading a single volume file: the volume on success, or the
+    error class and message on failure, plus timings for triage.
+    """
+    def __init__(self, filename, index=None, attempt=0):
+        self.filename = filename
+        self.index = index
+        # Number of previous failed attempts at loading this file
+        self.attempt = attempt
+        self.volume = None
+        self.error_type = None
+        self.error_message = None
+        # time.perf_counter() timestamps
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+
+    def succeeded(self) -> bool:
+        return self.volume is not None
+
+    def get_queue_seconds(self) -> float:
+        """Time spent waiting for a worker."""
+        return (self.started_at or self.submitted_at) - self.submitted_at
+
+    def get_load_seconds(self) -> float:
+        """Time spent reading and decoding the file."""
+        return (self.finished_at or self.started_at or 0.0) - (self.started_at or 0.0)
+
+    def __repr__(self):
+        outcome = 'ok' if self.succeeded() else f'{self.error_type}: {self.error_message}'
+        return (f'LoadResult(index={self.index}, attempt={self.attempt}, {outcome}, '
+                f'queued {self.get_queue_seconds() * 1000:.0f} ms, loaded {self.get_load_seconds() * 1000:.0f} ms, "{self.filename}")')
 
 class VolumeLoaderTask(QRunnable):
     """
     QRunnable task for concurrent loading of volume data files.
     """
-    def __init__(self, filename, callback, stop_flag):
+    def __init__(self, result, callback, stop_flag, buffer_pool=None, storage_modes=None):
         super().__init__()
-        self.filename = filename
+        self.result = result
         self.callback = callback
         self.stop_flag = stop_flag
+        self.buffer_pool = buffer_pool
+        self.storage_modes = storage_modes
 
     def run(self):
         if self.stop_flag.is_set():
@@ -19,7 +59,20 @@ class VolumeLoaderTask(QRunnable):
             return
         
         # Load the volume
-        r_volume = RadarVolume.build_radar_volume_from_matlab_file(self.filename)
+        self.result.started_at = time.perf_counter()
+        tracer.complete('queued', self.result.submitted_at, self.result.started_at, 'loader', index=self.result.index)
+        with tracer.span('decode', 'loader', index=self.result.index, attempt=self.result.attempt, file=self.result.filename) as span:
+            try:
+                self.result.volume = RadarVolume.build_radar_volume_from_matlab_file(self.result.filename, self.buffer_pool, self.storage_modes)
+            except Exception as e:
+                self.result.error_type = type(e).__name__
+                self.result.error_message = str(e)
+                span.set(error=self.result.error_type)
+        if self.result.volume is not None:
+            # Histogram the products while the data is still hot, so nobody has to go over it again
+            with tracer.span('statistics', 'loader', index=self.result.index):
+                self.result.volume.statistics = compute_volume_statistics(self.result.volume)
+        self.result.finished_at = time.perf_counter()
         
         if self.stop_flag.is_set():
             # Exit early if the application is closing. 
@@ -27,31 +80,88 @@ class VolumeLoaderTask(QRunnable):
             return
         
         # Invoke the callback
-        self.callback(r_volume)
+        self.callback(self.result)
 
 class BackgroundLoader(QObject):
     """
     Background loader class. Can be used to submit volume file loading tasks to
     a thread pool. The thread pool saves on the cost of starting and stopping
     QThreads all the time.
+
+    Workers never touch Qt when they finish. They push their LoadResult onto a
+    completion queue, which the GUI thread drains in bounded batches (at most
+    `max_batch_size` results and `drain_budget_s` seconds per event-loop tick), so
+    a burst of finished prefetches can't freeze the UI.
     """
-    # Signal emitted when a volume is loaded
-    volume_loaded = Signal(RadarVolume)
+    # Signal emitted with a list of LoadResults (volumes which have been loaded or failed to load)
+    volumes_loaded = Signal(list)
 
-    def __init__(self):
+    # How often the completion queue is drained while loads are in flight
+    drain_interval_ms = 16
+
+    def __init__(self, buffer_pool=None, storage_modes=None):
         super().__init__()
         self.thread_pool = QThreadPool.globalInstance()
         self.thread_pool.setMaxThreadCount(5)
         self.stop_flag = threading.Event()
+        # Optional pool of recycled product buffers shared by all loading tasks
+        self.buffer_pool = buffer_pool
+        # Optional compact storage mode per product (see product_storage.py)
+        self.storage_modes = storage_modes
+
+        # Completed LoadResults, pushed by the workers and drained by the GUI thread
+        self.completed = queue.SimpleQueue()
+        self.max_batch_size = 4
+        self.drain_budget_s = 0.004
+        # Number of submitted tasks whose results haven't been drained yet (only touched on the GUI thread)
+        self.in_flight = 0
+        self.drain_timer = QTimer(self)
+        self.drain_timer.setInterval(self.drain_interval_ms)
+        self.drain_timer.timeout.connect(self.drain_completed)
 
-    def load_volume(self, filename):
+    def load_volume(self, filename, index=None, attempt=0):
         # Create a new VolumeLoaderTask for the file
-        task = VolumeLoaderTask(filename, self._on_volume_loaded, self.stop_flag)
+        result = LoadResult(filename, index, attempt)
+        task = VolumeLoaderTask(result, self.completed.put, self.stop_flag, self.buffer_pool, self.storage_modes)
+        self.in_flight += 1
+        if not self.drain_timer.isActive():
+            self.drain_timer.start()
         self.thread_pool.start(task)
-        
-    @Slot(RadarVolume)
-    def _on_volume_loaded(self, r_volume: RadarVolume):
-        self.volume_loaded.emit(r_volume)
+
+    def get_pending_count(self) -> int:
+        """Number of loads which are queued, running or waiting to be drained."""
+        return self.in_flight
+
+    def get_active_count(self) -> int:
+        """Number of workers currently loading a file."""
+        return self.thread_pool.activeThreadCount()
+
+    def get_queue_depth(self) -> int:
+        """Number of loads waiting for a worker."""
+        return max(0, self.in_flight - self.get_active_count() - self.completed.qsize())
+
+    @Slot()
+    def drain_completed(self):
+        """
+        Hand a bounded batch of completed loads to the GUI thread.
+        """
+        deadline = time.perf_counter() + self.drain_budget_s
+        batch = []
+        while len(batch) < self.max_batch_size and time.perf_counter() < deadline:
+            try:
+                batch.append(self.completed.get_nowait())
+            except queue.Empty:
+                break
+
+        self.in_flight -= len(batch)
+        if self.in_flight <= 0:
+            # Nothing left in flight, stop polling until the next load is submitted.
+            self.in_flight = 0
+            self.drain_timer.stop()
+
+        if batch:
+            with tracer.span('volumes_loaded', 'loader', count=len(batch), pending=self.in_flight):
+                self.volumes_loaded.emit(batch)
 
 
 # Test code:
@@ -62,15 +172,16 @@ if __name__ == "__main__":
     window = QWidget()
     window.setWindowTitle("Test Background Loader")
 
-    def on_volume_loaded(volume):
-        if volume is not None:
-            print(f"Volume loaded: {volume.filename} {volume.products['Z'].shape}")
-        else:
-            print("Failed to load volume.")
+    def on_volumes_loaded(results):
+        for result in results:
+            if result.succeeded():
+                print(f"Volume loaded: {result.volume.filename} {result.volume.products['Z'].shape}")
+            else:
+                print(f"Failed to load volume: {result}")
 
     # Create the background loader
     loader = BackgroundLoader()
-    loader.volume_loaded.connect(on_volume_loaded)
+    loader.volumes_loaded.connect(on_volumes_loaded)
 
     file_name = 'D:/cs5093/20240428/Scan 12/MATLAB/HRUS_240428_020051000_100.mat'
     # Queue up some loading tasks
@@ -0,0 +1,244 @@
+# Offline (headless) rendering of PPI/RHI/CAPPI image sequences.
+#
+#   python batch_render.py <scanset.json> <scan name> <output dir> --product Z --slice ppi --index 0 --gif
+#
+# Volumes are loaded and rendered to PNG in a pool of worker processes, using the
+# same polar mapping (see SlicePlot.build_polar_transform()) and colormaps as the
+# GUI. No display or OpenGL context is needed: images are rasterized with NumPy.
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+import multiprocessing
+import numpy as np
+import time
+
+RENDER_SLICE_TYPES = ('ppi', 'rhi', 'cappi')
+
+# Color of pixels outside the scan or without data (the GUI canvas background)
+BACKGROUND_RGBA = (0, 0, 0, 255)
+
+class PolarRasterizer(object):
+    """
+    Maps every pixel of an output frame to the (gate, radial) bin of a slice it
+    falls in, following the same polar transform as SlicePlot, so frames look like
+    the GUI's plots. The mapping only depends on the scan geometry, slice type and
+    frame width, so it's computed once and each slice is then rendered with a
+    single gather through the colormap's lookup table.
+    """
+    def __init__(self, geometry, slice_type, width_px):
+        self.slice_type = slice_type
+        is_plan_view = slice_type != 'rhi'
+        ranges_km = geometry.ranges_km
+        num_gates = len(ranges_km)
+        num_radials = len(geometry.elevations_rad) if slice_type == 'rhi' else len(geometry.azimuths_rad)
+        radial_swath = geometry.elevation_swath_rad if slice_type == 'rhi' else geometry.azimuth_swath_rad
+        y_start = np.floor(geometry.start_range_km / geometry.doppler_resolution_km)
+        km_per_pixel = ranges_km[-1] / (y_start + num_gates)
+
+        # Angle (radians, counterclockwise from +x) of image column x is theta = swath * loc0 -/+ swath * x / num_radials
+        loc0 = radial_swath if is_plan_view else geometry.elevations_rad[0]
+        direction = -1.0 if is_plan_view else 1.0
+        theta_origin = radial_swath * loc0
+        theta_lo = theta_origin - radial_swath if is_plan_view else theta_origin
+
+        # Frame extent: the bounding box of the annular sector covered by the slice
+        thetas = np.linspace(theta_lo, theta_lo + radial_swath, 64)
+        radii_km = np.array([y_start * km_per_pixel, ranges_km[-1]])
+        xs = np.outer(radii_km, np.cos(thetas))
+        ys = np.outer(radii_km, np.sin(thetas))
+        (x_min, x_max, y_min, y_max) = (xs.min(), xs.max(), ys.min(), ys.max())
+        height_px = max(int(round(width_px * (y_max - y_min) / (x_max - x_min))), 1)
+        self.extent_km = (x_min, x_max, y_min, y_max)
+        self.shape = (height_px, width_px)
+
+        # Pixel centers in km (image rows go top-down)
+        x_km = x_min + (np.arange(width_px) + 0.5) * (x_max - x_min) / width_px
+        y_km = y_max - (np.arange(height_px) + 0.5) * (y_max - y_min) / height_px
+        (x_km, y_km) = np.meshgrid(x_km, y_km)
+
+        # Invert the polar transform into (fractional) image pixel coordinates
+        theta = theta_lo + np.mod(np.arctan2(y_km, x_km) - theta_lo, 2.0 * np.pi)
+        columns = np.floor(direction * (theta - theta_origin) * num_radials / radial_swath).astype(np.intp)
+        rows = np.floor(np.hypot(x_km, y_km) / km_per_pixel - y_start).astype(np.intp)
+        inside = (columns >= 0) & (columns < num_radials) & (rows >= 0) & (rows < num_gates)
+
+        # Flat indices into the (gate x radial) slice of the pixels inside the scan
+        self.pixels = np.flatnonzero(inside)
+        self.bins = rows[inside] * num_radials + columns[inside]
+
+    def render(self, slice, lut, clims) -> np.ndarray:
+        """
+        Render a (gate x radial) slice into a (height x width x 4) RGBA uint8 frame,
+        coloring values through a (N x 4) float RGBA lookup table spanning `clims`.
+        """
+        lut_rgba = np.empty((len(lut) + 1, 4), dtype=np.uint8)
+        lut_rgba[:-1] = np.clip(np.rint(np.asarray(lut) * 255.0), 0, 255)
+        # The last entry is for NaN (no data)
+        lut_rgba[-1] = BACKGROUND_RGBA
+
+        values = np.asarray(slice, dtype=np.float32).reshape(-1)[self.bins]
+        (low, high) = clims
+        with np.errstate(invalid='ignore'):
+            indices = np.clip((values - low) * (len(lut) / (high - low)), 0, len(lut) - 1)
+        indices = np.where(np.isnan(values), len(lut), indices).astype(np.intp)
+
+        frame = np.empty((self.shape[0] * self.shape[1], 4), dtype=np.uint8)
+        frame[:] = BACKGROUND_RGBA
+        frame[self.pixels] = lut_rgba[indices]
+        return frame.reshape(self.shape + (4,))
+
+# Rasterizers built so far by this (worker) process
+_rasterizers = {}
+
+def get_rasterizer(geometry, slice_type, width_px) -> PolarRasterizer:
+    key = (geometry.geometry_hash, geometry.start_range_km, geometry.doppler_resolution_km, slice_type, width_px)
+    if key not in _rasterizers:
+        _rasterizers[key] = PolarRasterizer(geometry, slice_type, width_px)
+    return _rasterizers[key]
+
+def extract_slice(volume, product, slice_type, index, cappi_height_km=2.0) -> np.ndarray:
+    """
+    The (gate x radial) slice of a volume shown by a SlicePlot with the same
+    settings: tilt `index` for PPIs, azimuth `index` for RHIs, and the plan view of
+    derived products (e.g. 'CREF') whatever the index.
+    """
+    from derived_products import DERIVED_PRODUCT_NAMES, compute_derived_product
+    if product in DERIVED_PRODUCT_NAMES:
+        return compute_derived_product(volume, product).T
+    prod = volume.products[product]
+    if slice_type == 'cappi':
+        from cappi import get_cappi_interpolator
+        return get_cappi_interpolator(volume.geometry, cappi_height_km).apply(prod).T
+    if slice_type == 'rhi':
+        return np.asarray(prod[:, index, :]).T
+    return np.asarray(prod[index, :, :]).T
+
+def get_frame_label(volume, product, slice_type, index, cappi_height_km) -> str:
+    from derived_products import DERIVED_PRODUCT_NAMES
+    from scan_index import timestamp_from_matlab_datenum
+    if product in DERIVED_PRODUCT_NAMES:
+        location = ''
+    elif slice_type == 'cappi':
+        location = f' @ {cappi_height_km:g} km'
+    elif slice_type == 'rhi':
+        location = f' @ {np.degrees(volume.azimuths_rad[index]):.1f}° az'
+    else:
+        location = f' @ {np.degrees(volume.elevations_rad[index]):.1f}° el'
+    timestamp = timestamp_from_matlab_datenum(volume.time) if volume.time is not None else None
+    timestamp = f'  {timestamp.strftime("%m/%d/%Y %H:%M:%S")}' if timestamp is not None else ''
+    return f'{slice_type.upper()} ({product}){location}{timestamp}  {Path(volume.filename).name}'
+
+def render_frame(file_path, output_path, product, slice_type, index, width_px, cappi_height_km):
+    """
+    Load a volume and render one slice of it to a PNG. Runs in a worker process, so
+    only the output path goes back to the parent process.
+    """
+    from radar_volume import RadarVolume
+    from color_maps import get_color_maps
+    from PIL import Image, ImageDraw
+
+    volume = RadarVolume.build_radar_volume_from_matlab_file(file_path)
+    slice = extract_slice(volume, product, slice_type, index, cappi_height_km)
+    color_maps = get_color_maps()
+    (_, clims) = color_maps.get_cmap_and_clims_for_product(product)
+    frame = get_rasterizer(volume.geometry, slice_type, width_px).render(slice, color_maps.get_lut_for_product(product), clims)
+
+    image = Image.fromarray(frame)
+    ImageDraw.Draw(image).text((8, 8), get_frame_label(volume, product, slice_type, index, cappi_height_km), fill=(255, 255, 255, 255))
+    image.save(output_path)
+    return output_path
+
+def render_frames(file_paths, output_dir, product='Z', slice_type='ppi', index=0, width_px=800,
+                  cappi_height_km=2.0, max_workers=None, max_pending=None, progress=None) -> list[Path]:
+    """
+    Render every volume to a numbered PNG in `output_dir`, in a pool of worker
+    processes. At most `max_pending` volumes (twice the number of workers by
+    default) are in flight at once, so memory stays flat however long the scan is.
+    Returns the paths of the frames rendered, in order (frames which failed are
+    reported and left out).
+
+    `progress(num_done, num_total)` is called as frames are finished.
+    """
+    if slice_type not in RENDER_SLICE_TYPES:
+        raise ValueError(f'Unsupported slice type "{slice_type}", expected one of {RENDER_SLICE_TYPES}')
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    max_workers = max_workers or max(multiprocessing.cpu_count() - 1, 1)
+    max_pending = max_pending or 2 * max_workers
+
+    frame_paths = {}
+    pending = {}
+    jobs = iter(enumerate(file_paths))
+    num_total = len(file_paths)
+    num_done = 0
+    # Spawned (rather than forked) workers are safe to start from the GUI process too
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        while True:
+            # Keep the window of in-flight volumes full
+            for (frame_idx, file_path) in jobs:
+                output_path = output_dir / f'{product}_{slice_type}_{index:02d}_{frame_idx:05d}.png'
+                future = executor.submit(render_frame, str(file_path), str(output_path), product, slice_type, index, width_px, cappi_height_km)
+                pending[future] = (frame_idx, file_path)
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                break
+
+            (done, _) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (frame_idx, file_path) = pending.pop(future)
+                try:
+                    frame_paths[frame_idx] = Path(future.result())
+                except Exception as e:
+                    print(f'Failed to render "{file_path}": {e}')
+                num_done += 1
+                if progress is not None:
+                    progress(num_done, num_total)
+
+    return [frame_paths[frame_idx] for frame_idx in sorted(frame_paths)]
+
+def assemble_animation(frame_paths, animation_path, frame_duration_ms=250):
+    """
+    Assemble rendered frames into a looping animated GIF. Frames are read one at a
+    time as they're written out.
+    """
+    from PIL import Image
+    if not frame_paths:
+        return
+    frames = (Image.open(path).convert('RGB') for path in frame_paths[1:])
+    with Image.open(frame_paths[0]) as first_frame:
+        first_frame.convert('RGB').save(animation_path, save_all=True, append_images=frames, duration=frame_duration_ms, loop=0)
+
+if __name__ == "__main__":
+    import argparse
+    from scan_set import ScanSet
+    parser = argparse.ArgumentParser(description="Render a scan's volumes to PNG frames (and optionally an animated GIF) without a display.")
+    parser.add_argument("scanset", help="Scanset file (.json).")
+    parser.add_argument("scan", help="Name of the scan to render.")
+    parser.add_argument("output_dir", help="Directory the frames are written to.")
+    parser.add_argument("--product", default='Z', help="Product to render (e.g. Z, V, CREF).")
+    parser.add_argument("--slice", default='ppi', choices=RENDER_SLICE_TYPES, help="Slice type.")
+    parser.add_argument("--index", type=int, default=0, help="Tilt (PPI) or azimuth (RHI) index.")
+    parser.add_argument("--cappi-height", type=float, default=2.0, help="CAPPI height (km above the radar).")
+    parser.add_argument("--width", type=int, default=800, help="Frame width in pixels.")
+    parser.add_argument("--workers", type=int, help="Number of worker processes.")
+    parser.add_argument("--gif", action="store_true", help="Also assemble the frames into an animated GIF.")
+    parser.add_argument("--frame-ms", type=int, default=250, help="Duration of each GIF frame.")
+    args = parser.parse_args()
+
+    scanset = ScanSet.load_scanset(Path(args.scanset))
+    scans = [scan for scan in scanset.get_scans() if scan.get_name() == args.scan]
+    if not scans:
+        parser.error(f'No scan named "{args.scan}" in {args.scanset}')
+    file_paths = [scanset.get_base_dir() / Path(filename) for filename in scans[0].get_scan_files()]
+
+    def print_progress(num_done, num_total):
+        print(f'\r{num_done}/{num_total} frames', end='', flush=True)
+
+    start = time.perf_counter()
+    frame_paths = render_frames(file_paths, args.output_dir, args.product, args.slice, args.index, args.width,
+                                args.cappi_height, args.workers, progress=print_progress)
+    print(f'\nRendered {len(frame_paths)} frames in {time.perf_counter() - start:.1f} s')
+    if args.gif:
+        animation_path = Path(args.output_dir) / f'{args.product}_{args.slice}_{args.index:02d}.gif'
+        assemble_animation(frame_paths, animation_path, args.frame_ms)
+        print(f'Animation: {animation_path}')
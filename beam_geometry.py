@@ -0,0 +1,57 @@
+import numpy as np
+import threading
+
+# Standard (4/3 earth radius) refraction model
+EARTH_RADIUS_KM = 6371.0
+EFFECTIVE_EARTH_RADIUS_KM = 4.0 / 3.0 * EARTH_RADIUS_KM
+
+def beam_height_km(ranges_km, elevations_rad, radar_height_km=0.0):
+    """
+    Height of the beam center above the radar (plus `radar_height_km`) at each slant
+    range and elevation, using the 4/3 effective earth radius model. Broadcasts like
+    numpy, e.g. elevations_rad[:, None] and ranges_km[None, :] give an (el x range) table.
+    """
+    ranges_km = np.asarray(ranges_km, dtype=np.float64)
+    elevations_rad = np.asarray(elevations_rad, dtype=np.float64)
+    re = EFFECTIVE_EARTH_RADIUS_KM
+    return np.sqrt(ranges_km**2 + re**2 + 2.0 * ranges_km * re * np.sin(elevations_rad)) - re + radar_height_km
+
+def ground_range_km(ranges_km, elevations_rad):
+    """
+    Distance along the earth's surface to the point below the beam center at each
+    slant range and elevation (4/3 effective earth radius model).
+    """
+    ranges_km = np.asarray(ranges_km, dtype=np.float64)
+    elevations_rad = np.asarray(elevations_rad, dtype=np.float64)
+    re = EFFECTIVE_EARTH_RADIUS_KM
+    height_km = beam_height_km(ranges_km, elevations_rad)
+    return re * np.arcsin(ranges_km * np.cos(elevations_rad) / (re + height_km))
+
+class BeamGeometryTables(object):
+    """
+    Beam height and ground range tables (elevation x range) for one scan geometry,
+    computed once and shared by everything that needs them.
+    """
+    def __init__(self, elevations_rad, ranges_km):
+        self.elevations_rad = np.asarray(elevations_rad, dtype=np.float64)
+        self.ranges_km = np.asarray(ranges_km, dtype=np.float64)
+        self.heights_km = beam_height_km(self.ranges_km[None, :], self.elevations_rad[:, None]).astype(np.float32)
+        self.ground_ranges_km = ground_range_km(self.ranges_km[None, :], self.elevations_rad[:, None]).astype(np.float32)
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+def get_beam_geometry_tables(elevations_rad, ranges_km) -> BeamGeometryTables:
+    """
+    The (cached) beam geometry tables for a scan geometry. Safe to call from worker threads.
+    """
+    elevations_rad = np.ascontiguousarray(elevations_rad, dtype=np.float64)
+    ranges_km = np.ascontiguousarray(ranges_km, dtype=np.float64)
+    key = (elevations_rad.tobytes(), ranges_km.tobytes())
+    with _tables_lock:
+        tables = _tables.get(key)
+    if tables is None:
+        tables = BeamGeometryTables(elevations_rad, ranges_km)
+        with _tables_lock:
+            tables = _tables.setdefault(key, tables)
+    return tables
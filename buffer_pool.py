@@ -0,0 +1,120 @@
+from collections import defaultdict
+import numpy as np
+import threading
+import time
+import sys
+import os
+
+class BufferPool(object):
+    """
+    A pool of ndarray buffers keyed by (shape, dtype). Consecutive volumes in a PAR
+    scan almost always share the same scan geometry, so instead of allocating fresh
+    product cubes for every file (and dropping the old ones on the garbage collector)
+    evicted volumes give their buffers back to the pool and new loads fill the
+    recycled buffers in place. This avoids allocator churn and page faults during
+    continuous playback.
+
+    Buffers handed out by the pool are NOT zeroed, the caller is expected to overwrite
+    every element. Safe to use from multiple threads.
+    """
+    def __init__(self, max_buffers_per_key=16):
+        self.max_buffers_per_key = max_buffers_per_key
+        self.free_buffers = defaultdict(list)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, shape, dtype=np.float64) -> np.ndarray:
+        """
+        Get a buffer of the given shape and dtype, recycling a pooled buffer if one is available.
+        """
+        key = (tuple(shape), np.dtype(dtype))
+        with self.lock:
+            if self.free_buffers[key]:
+                self.hits += 1
+                return self.free_buffers[key].pop()
+            self.misses += 1
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, array: np.ndarray) -> None:
+        """
+        Give a buffer back to the pool. The caller must not use the buffer afterwards.
+        Views and arrays which don't own their memory are ignored.
+        """
+        # Compactly stored products (see product_storage.py) wrap their buffer.
+        array = getattr(array, 'buffer', array)
+        if not isinstance(array, np.ndarray) or array.base is not None or not array.flags.c_contiguous:
+            return
+        key = (array.shape, array.dtype)
+        with self.lock:
+            if len(self.free_buffers[key]) < self.max_buffers_per_key:
+                self.free_buffers[key].append(array)
+
+    def release_products(self, products: dict) -> None:
+        """Give every product cube of a volume back to the pool."""
+        for array in products.values():
+            self.release(array)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.free_buffers.clear()
+
+    def get_pooled_bytes(self) -> int:
+        """Number of bytes currently held (idle) by the pool."""
+        with self.lock:
+            return sum(array.nbytes for buffers in self.free_buffers.values() for array in buffers)
+
+def get_rss_bytes() -> int:
+    """
+    Current resident set size of this process in bytes (Linux), falling back on
+    the peak resident set size on other platforms.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and kilobytes on Linux.
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def simulate_playback(buffer_pool, num_steps=60, window=5, shape=(20, 90, 1000), num_products=6):
+    """
+    Simulate continuous playback: each step "loads" a volume (fills one cube per
+    product) and evicts the oldest volume outside a window of `window` volumes.
+    Returns a list of (seconds, rss_bytes) samples, one per step.
+    """
+    resident = []
+    samples = []
+    start = time.perf_counter()
+    for step in range(num_steps):
+        products = {}
+        for p in range(num_products):
+            if buffer_pool is not None:
+                cube = buffer_pool.acquire(shape)
+            else:
+                cube = np.zeros(shape)
+            # Touch every page, like copying the file's data into the cube does.
+            cube[...] = step
+            products[p] = cube
+        resident.append(products)
+
+        if len(resident) > window:
+            evicted = resident.pop(0)
+            if buffer_pool is not None:
+                buffer_pool.release_products(evicted)
+
+        samples.append((time.perf_counter() - start, get_rss_bytes()))
+    return samples
+
+# Benchmark code: RSS over time during simulated playback, with and without the pool.
+if __name__ == "__main__":
+    for (label, pool) in [("np.zeros per volume", None), ("BufferPool", BufferPool())]:
+        samples = simulate_playback(pool)
+        rss_mb = np.array([rss for (_, rss) in samples]) / 2**20
+        elapsed = samples[-1][0]
+        print(f'{label}: {len(samples)} volumes in {elapsed:.2f} s ({len(samples) / elapsed:.1f} volumes/s)')
+        print(f'    RSS (MiB) min {rss_mb.min():.0f} / max {rss_mb.max():.0f} / final {rss_mb[-1]:.0f}')
+        print('    RSS over time (MiB): ' + ' '.join(f'{mb:.0f}' for mb in rss_mb[::5]))
+        if pool is not None:
+            print(f'    Pool hits {pool.hits} / misses {pool.misses}')
@@ -0,0 +1,113 @@
+from beam_geometry import get_beam_geometry_tables
+import numpy as np
+import threading
+
+# Heights (km above the radar) offered for CAPPI views
+CAPPI_HEIGHTS_KM = [0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0]
+
+class CappiInterpolator(object):
+    """
+    Resamples (elevation x azimuth x range) product cubes onto a constant altitude
+    plane (CAPPI), on the same azimuths and with the range axis reinterpreted as
+    ground distance, so the result can be displayed exactly like a PPI.
+
+    For every ground distance the two beams bracketing the height are found, along
+    with the nearest gate of each beam and the linear weight between them (by
+    height). All of that only depends on the scan geometry, so it's computed once
+    and each volume is then resampled with a single gather and blend. Ground
+    distances where the height isn't between two beams are NaN.
+    """
+    def __init__(self, elevations_rad, ranges_km, height_km):
+        self.height_km = height_km
+        elevations_rad = np.asarray(elevations_rad, dtype=np.float64)
+        ranges_km = np.asarray(ranges_km, dtype=np.float64)
+        self.num_ranges = len(ranges_km)
+
+        # Beams in ascending elevation, as indices into the volume's elevations
+        order = np.argsort(elevations_rad, kind='stable')
+        tables = get_beam_geometry_tables(elevations_rad[order], ranges_km)
+        gates = np.arange(self.num_ranges, dtype=np.float64)
+
+        # Height of each beam above every output ground distance, and the gate it's at there
+        beam_heights_km = np.empty((len(order), self.num_ranges))
+        beam_gates = np.empty((len(order), self.num_ranges))
+        for (i, (ground_km, heights_km)) in enumerate(zip(tables.ground_ranges_km, tables.heights_km)):
+            beam_heights_km[i] = np.interp(ranges_km, ground_km, heights_km, left=np.nan, right=np.nan)
+            beam_gates[i] = np.interp(ranges_km, ground_km, gates, left=np.nan, right=np.nan)
+
+        # Highest beam at or below the height (beam heights increase with elevation at a fixed ground distance)
+        with np.errstate(invalid='ignore'):
+            lower = np.sum(beam_heights_km <= height_km, axis=0) - 1
+        upper = lower + 1
+        columns = np.flatnonzero((lower >= 0) & (upper < len(order)))
+        (lower, upper) = (lower[columns], upper[columns])
+        (lower_gates, upper_gates) = (beam_gates[lower, columns], beam_gates[upper, columns])
+        # Beams which run out of gates before reaching the ground distance can't be used
+        usable = ~(np.isnan(lower_gates) | np.isnan(upper_gates))
+        (columns, lower, upper, lower_gates, upper_gates) = (columns[usable], lower[usable], upper[usable], lower_gates[usable], upper_gates[usable])
+
+        (lower_heights, upper_heights) = (beam_heights_km[lower, columns], beam_heights_km[upper, columns])
+        weights = (height_km - lower_heights) / (upper_heights - lower_heights)
+        self.upper_weights = weights.astype(np.float32)[:, None]
+        self.lower_weights = (1.0 - weights).astype(np.float32)[:, None]
+
+        # Output ground distances covered, and the elevation and gate indices of their
+        # lower beams followed by their upper ones (so both are gathered at once)
+        self.columns = columns
+        self.num_columns = len(columns)
+        self.el_indices = np.concatenate((order[lower], order[upper]))
+        self.gate_indices = np.concatenate((np.rint(lower_gates), np.rint(upper_gates))).astype(np.intp)
+
+    def apply(self, product) -> np.ndarray:
+        """
+        Resample a product cube (ndarray or CompactProduct) into an (azimuth x ground
+        distance) float32 CAPPI.
+        """
+        num_azimuths = product.shape[1]
+        cappi = np.full((self.num_ranges, num_azimuths), np.nan, dtype=np.float32)
+        if self.num_columns:
+            # (2 * columns) x azimuth
+            samples = product[self.el_indices, :, self.gate_indices]
+            lower = samples[:self.num_columns]
+            upper = samples[self.num_columns:]
+            cappi[self.columns] = lower * self.lower_weights + upper * self.upper_weights
+        return cappi.T
+
+_interpolators = {}
+_interpolators_lock = threading.Lock()
+
+def get_cappi_interpolator(geometry, height_km) -> CappiInterpolator:
+    """
+    The (cached) CAPPI interpolator for a ScanGeometry and height.
+    """
+    key = (geometry.geometry_hash, float(height_km))
+    with _interpolators_lock:
+        interpolator = _interpolators.get(key)
+    if interpolator is None:
+        interpolator = CappiInterpolator(geometry.elevations_rad, geometry.ranges_km, height_km)
+        with _interpolators_lock:
+            interpolator = _interpolators.setdefault(key, interpolator)
+    return interpolator
+
+# Benchmark code: python cappi.py <volume.mat> [height_km]
+if __name__ == "__main__":
+    import sys
+    import time
+    from radar_volume import RadarVolume
+    volume = RadarVolume.build_radar_volume_from_matlab_file(sys.argv[1])
+    height_km = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+
+    start = time.perf_counter()
+    interpolator = get_cappi_interpolator(volume.geometry, height_km)
+    print(f'Interpolator for {height_km} km: {interpolator.num_columns}/{len(volume.ranges_km)} ground distances covered, built in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    num_repeats = 200
+    start = time.perf_counter()
+    for _ in range(num_repeats):
+        cappi = get_cappi_interpolator(volume.geometry, height_km).apply(volume.products['Z'])
+    cappi_ms = (time.perf_counter() - start) * 1000 / num_repeats
+    start = time.perf_counter()
+    for _ in range(num_repeats):
+        ppi = np.ascontiguousarray(volume.products['Z'][0, :, :])
+    ppi_ms = (time.perf_counter() - start) * 1000 / num_repeats
+    print(f'CAPPI {cappi.shape}: {cappi_ms:.3f} ms per volume, PPI slice: {ppi_ms:.3f} ms per volume')
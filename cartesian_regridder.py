@@ -0,0 +1,252 @@
+from app_config import get_cache_dir
+from beam_geometry import EFFECTIVE_EARTH_RADIUS_KM
+from radar_volume import RadarVolume
+import numpy as np
+import threading
+import hashlib
+import time
+
+# Bump when the way operators are built changes, so stale cached operators aren't used
+REGRID_OPERATOR_VERSION = 2
+
+class CartesianGrid(object):
+    """
+    A regular grid of points (z x y x x), in km east (x) and north (y) of the radar
+    and above it (z).
+    """
+    def __init__(self, x_km, y_km, z_km):
+        self.x_km = np.asarray(x_km, dtype=np.float64)
+        self.y_km = np.asarray(y_km, dtype=np.float64)
+        self.z_km = np.asarray(z_km, dtype=np.float64)
+        self.shape = (len(self.z_km), len(self.y_km), len(self.x_km))
+
+    @staticmethod
+    def regular(extent_km, spacing_km, heights_km):
+        """A square grid reaching `extent_km` from the radar in every direction, at the given heights."""
+        axis = np.arange(-extent_km, extent_km + spacing_km / 2, spacing_km)
+        return CartesianGrid(axis, axis, heights_km)
+
+    def get_hash(self) -> str:
+        digest = hashlib.sha1()
+        for axis in (self.x_km, self.y_km, self.z_km):
+            values = np.round(axis, 6)
+            digest.update(np.int64(len(values)).tobytes())
+            digest.update(values.tobytes())
+        return digest.hexdigest()[:16]
+
+def build_interpolation_operator(azimuths_rad, elevations_rad, ranges_km, x_km, y_km, z_km):
+    """
+    Build the sparse (points x gates) interpolation matrix from a flattened
+    (elevation x azimuth x range) cube to a set of points (km east, north and above
+    the radar). Each point blends the 8 surrounding gates: linearly in height between
+    the two bracketing beams, in azimuth between the two bracketing radials and in
+    slant range between the two bracketing gates (4/3 effective earth radius model).
+    Radials spanning the full circle wrap around (the last radial brackets with the
+    first). Points outside the scanned volume get an empty row.
+    """
+    import scipy.sparse
+    azimuths_rad = np.asarray(azimuths_rad, dtype=np.float64)
+    elevations_rad = np.asarray(elevations_rad, dtype=np.float64)
+    ranges_km = np.asarray(ranges_km, dtype=np.float64)
+    (num_el, num_az, num_ranges) = (len(elevations_rad), len(azimuths_rad), len(ranges_km))
+    re = EFFECTIVE_EARTH_RADIUS_KM
+
+    (x, y, z) = (np.ravel(x_km).astype(np.float64), np.ravel(y_km).astype(np.float64), np.ravel(z_km).astype(np.float64))
+    num_points = len(z)
+    ground_km = np.hypot(x, y)
+    # Azimuth clockwise from north
+    azimuth = np.arctan2(x, y)
+
+    # Height and slant range of every beam above each point's ground distance (el x points)
+    el_order = np.argsort(elevations_rad, kind='stable')
+    sorted_el = elevations_rad[el_order][:, None]
+    ground_angle = ground_km[None, :] / re
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beam_height_km = re * np.cos(sorted_el) / np.cos(sorted_el + ground_angle) - re
+        slant_range_km = (re + beam_height_km) * np.sin(ground_angle) / np.cos(sorted_el)
+    # Beams bent past the horizon can't reach the point
+    beam_height_km[np.cos(sorted_el + ground_angle) <= 0] = np.inf
+
+    # Bracketing beams and the blend between them
+    lower = np.sum(beam_height_km <= z[None, :], axis=0) - 1
+    valid = (lower >= 0) & (lower < num_el - 1)
+    lower = np.clip(lower, 0, max(num_el - 2, 0))
+    points = np.arange(num_points)
+    (h0, h1) = (beam_height_km[lower, points], beam_height_km[np.minimum(lower + 1, num_el - 1), points])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w_el = np.where(h1 > h0, (z - h0) / (h1 - h0), 0.0)
+
+    # Bracketing radials (azimuths are unwrapped relative to the first radial)
+    az_unwrapped = np.unwrap(azimuths_rad)
+    az_order = np.argsort(az_unwrapped, kind='stable')
+    az_sorted = az_unwrapped[az_order]
+    # A full circle (within a radial spacing and a half) also has the gap between its last and first radial
+    az_span = az_sorted[-1] - az_sorted[0]
+    cyclic = num_az > 1 and az_span + 1.5 * az_span / (num_az - 1) >= 2 * np.pi
+    if cyclic:
+        az_sorted = np.append(az_sorted, az_sorted[0] + 2 * np.pi)
+        az_order = np.append(az_order, az_order[0])
+    num_brackets = len(az_sorted) - 1
+    rel_azimuth = np.mod(azimuth - az_sorted[0], 2 * np.pi) + az_sorted[0]
+    az_lower = np.searchsorted(az_sorted, rel_azimuth, side='right') - 1
+    valid &= (az_lower >= 0) & (az_lower < num_brackets)
+    az_lower = np.clip(az_lower, 0, max(num_brackets - 1, 0))
+    (a0, a1) = (az_sorted[az_lower], az_sorted[np.minimum(az_lower + 1, num_brackets)])
+    w_az = np.where(a1 > a0, (rel_azimuth - a0) / np.where(a1 > a0, a1 - a0, 1.0), 0.0)
+
+    # Bracketing gates along each of the two beams
+    gate_spacing_km = (ranges_km[-1] - ranges_km[0]) / (num_ranges - 1) if num_ranges > 1 else 1.0
+    rows = []
+    cols = []
+    weights = []
+    for (beam, beam_weight) in ((lower, 1.0 - w_el), (np.minimum(lower + 1, num_el - 1), w_el)):
+        gate = (slant_range_km[beam, points] - ranges_km[0]) / gate_spacing_km
+        with np.errstate(invalid='ignore'):
+            beam_valid = (gate >= 0) & (gate <= num_ranges - 1)
+        gate = np.nan_to_num(gate, nan=0.0, posinf=0.0, neginf=0.0)
+        gate_lower = np.clip(np.floor(gate).astype(np.intp), 0, max(num_ranges - 2, 0))
+        w_gate = np.clip(gate - gate_lower, 0.0, 1.0)
+        valid &= beam_valid
+        for (radial, az_weight) in ((az_lower, 1.0 - w_az), (np.minimum(az_lower + 1, num_brackets), w_az)):
+            for (gate_index, gate_weight) in ((gate_lower, 1.0 - w_gate), (np.minimum(gate_lower + 1, num_ranges - 1), w_gate)):
+                rows.append(points)
+                cols.append((el_order[beam] * num_az + az_order[radial]) * num_ranges + gate_index)
+                weights.append(beam_weight * az_weight * gate_weight)
+
+    rows = np.concatenate(rows)
+    cols = np.concatenate(cols)
+    weights = np.concatenate(weights)
+    keep = np.tile(valid, 8) & (weights > 0)
+    operator = scipy.sparse.csr_matrix((weights[keep].astype(np.float32), (rows[keep], cols[keep])),
+                                       shape=(num_points, num_el * num_az * num_ranges))
+    operator.sum_duplicates()
+    return operator
+
+def build_regrid_operator(azimuths_rad, elevations_rad, ranges_km, grid: CartesianGrid):
+    """
+    Build the sparse (grid points x gates) interpolation matrix from a flattened
+    (elevation x azimuth x range) cube to a Cartesian grid.
+    """
+    (z, y, x) = np.meshgrid(grid.z_km, grid.y_km, grid.x_km, indexing='ij')
+    return build_interpolation_operator(azimuths_rad, elevations_rad, ranges_km, x, y, z)
+
+class SparseInterpolator(object):
+    """
+    Applies a sparse (points x gates) interpolation operator to product cubes and
+    shapes the result. Missing gates (NaN) are left out of the blend: the operator is
+    applied to both the NaN-filled data and its validity mask and the result is
+    normalized by the latter. Points without any valid gate are NaN.
+    """
+    def __init__(self, operator, shape):
+        self.shape = tuple(shape)
+        self.num_gates = operator.shape[1]
+        # Only points inside the scanned volume are computed, the rest are always NaN
+        self.covered_points = np.flatnonzero(np.diff(operator.indptr))
+        self.operator = operator[self.covered_points]
+
+    def interpolate(self, products: dict, names) -> dict:
+        """
+        Interpolate some of the (elevation x azimuth x range) cubes in `products`.
+        Returns {product: float32 array}. All products are interpolated in the same
+        sparse matrix product.
+        """
+        products = {name: products[name] for name in names if name in products}
+        if not products:
+            return {}
+        # Data columns for all products followed by their validity columns
+        num_products = len(products)
+        columns = np.empty((self.num_gates, 2 * num_products), dtype=np.float32)
+        for (i, product) in enumerate(products.values()):
+            data = np.asarray(product, dtype=np.float32).reshape(self.num_gates)
+            valid = ~np.isnan(data)
+            columns[:, i] = np.where(valid, data, np.float32(0.0))
+            columns[:, num_products + i] = valid
+        blended = self.operator @ columns
+
+        (values, coverage) = (blended[:, :num_products], blended[:, num_products:])
+        covered_values = np.full(values.shape, np.nan, dtype=np.float32)
+        np.divide(values, coverage, out=covered_values, where=coverage > 1e-6)
+
+        interpolated = {}
+        for (i, name) in enumerate(products):
+            result = np.full(int(np.prod(self.shape)), np.nan, dtype=np.float32)
+            result[self.covered_points] = covered_values[:, i]
+            interpolated[name] = result.reshape(self.shape)
+        return interpolated
+
+class CartesianRegridder(SparseInterpolator):
+    """
+    Grids product cubes of volumes sharing a scan geometry onto a Cartesian grid.
+    The interpolation operator is a sparse matrix built once per (scan geometry,
+    grid) and cached on disk, so gridding a volume is a single sparse matrix product.
+    """
+    def __init__(self, operator, grid: CartesianGrid):
+        super().__init__(operator, grid.shape)
+        self.grid = grid
+
+    def regrid(self, volume: RadarVolume, products=('Z',)) -> dict:
+        """
+        Grid some of a volume's products. Returns {product: (z x y x x) float32 array}.
+        """
+        return self.interpolate(volume.products, products)
+
+_regridders = {}
+_regridders_lock = threading.Lock()
+
+def get_regridder(volume: RadarVolume, grid: CartesianGrid) -> CartesianRegridder:
+    """
+    The regridder for a volume's scan geometry and a grid. Operators are kept in
+    memory and cached on disk (under the "regrid" cache folder), so they're only
+    ever built once per geometry and grid.
+    """
+    import scipy.sparse
+    key = f'{volume.geometry.geometry_hash}_{grid.get_hash()}_v{REGRID_OPERATOR_VERSION}'
+    with _regridders_lock:
+        regridder = _regridders.get(key)
+    if regridder is not None:
+        return regridder
+
+    cache_path = get_cache_dir('regrid') / f'{key}.npz'
+    operator = None
+    if cache_path.exists():
+        try:
+            operator = scipy.sparse.load_npz(cache_path).tocsr()
+        except (OSError, ValueError) as e:
+            print(f'Regridder: failed to load cached operator "{cache_path}", rebuilding: {e}')
+    if operator is None:
+        start = time.perf_counter()
+        operator = build_regrid_operator(volume.azimuths_rad, volume.elevations_rad, volume.ranges_km, grid)
+        print(f'Regridder: built {operator.shape[0]} x {operator.shape[1]} operator ({operator.nnz} weights) in {time.perf_counter() - start:.2f} s')
+        try:
+            scipy.sparse.save_npz(cache_path, operator)
+        except OSError as e:
+            print(f'Regridder: failed to cache operator "{cache_path}": {e}')
+
+    with _regridders_lock:
+        regridder = _regridders.setdefault(key, CartesianRegridder(operator, grid))
+    return regridder
+
+# Benchmark code: python cartesian_regridder.py <volume.mat> [<volume.mat> ...]
+if __name__ == "__main__":
+    import sys
+    volumes = [RadarVolume.build_radar_volume_from_matlab_file(path) for path in sys.argv[1:]]
+    max_range_km = max(volumes[0].ranges_km)
+    grid = CartesianGrid.regular(max_range_km, max_range_km / 100, np.arange(0.5, 10.5, 0.5))
+    print(f'Grid: {grid.shape} ({np.prod(grid.shape)} points), volume: {volumes[0].products["Z"].shape}')
+
+    start = time.perf_counter()
+    regridder = get_regridder(volumes[0], grid)
+    print(f'Operator ready in {time.perf_counter() - start:.3f} s')
+
+    products = list(volumes[0].products)
+    for (name, product_list) in (('Z', ['Z']), (f'{len(products)} products', products)):
+        num_volumes = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 2.0:
+            for volume in volumes:
+                gridded = regridder.regrid(volume, product_list)
+                num_volumes += 1
+        elapsed = time.perf_counter() - start
+        print(f'{name}: {num_volumes / elapsed:.1f} volumes/s ({elapsed / num_volumes * 1000:.2f} ms per volume)')
+    z = gridded['Z']
+    print(f'Z coverage {np.count_nonzero(~np.isnan(z)) / z.size * 100:.1f}%, range {np.nanmin(z):.1f} .. {np.nanmax(z):.1f}')
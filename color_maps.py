@@ -1,70 +1,188 @@
-import scipy.io as scio
-from vispy.color import Colormap
+from pathlib import Path
+from app_config import get_setting
+import numpy as np
+import os
+
+# Display limits (clims) for each product.
+PRODUCT_LIMITS = {
+    'Z': (-10, 70),
+    'V': (-24, 24),
+    'W': (-1, 8),
+    'D': (-2, 6),
+    'P': (20, 150),
+    'R': (0.8, 1.05),
+    'CREF': (-10, 70),
+    'ET': (0, 20),
+    'VIL': (0, 80),
+    'MAXZ': (-10, 70),
+    'ACC': (0, 50),
+    'LEX': (0, 60),
+}
+
+PRODUCT_UNITS = {
+    'Z': 'dB',
+    'V': 'm/s',
+    'W': 'σ(m/s)',
+    'D': 'dB',
+    'P': '',
+    'R': '°',
+    'CREF': 'dB',
+    'ET': 'km',
+    'VIL': 'kg/m²',
+    'MAXZ': 'dB',
+    'ACC': 'mm',
+    'LEX': 'min',
+}
+
+# Name of each product's colormap in the colormaps file.
+PRODUCT_COLORMAP_NAMES = {
+    'Z': 'reflectivity',
+    'V': 'velocity',
+    'W': 'width',
+    'D': 'zdr',
+    'P': 'phi',
+    'R': 'rho',
+    'CREF': 'reflectivity',
+    'ET': 'echo_tops',
+    'VIL': 'vil',
+    'MAXZ': 'reflectivity',
+    'ACC': 'accumulation',
+    'LEX': 'age',
+}
+
+# Built-in colormaps (control colors), used when the colormaps file isn't available.
+FALLBACK_COLORMAPS = {
+    'reflectivity': ['#646464', '#04e9e7', '#019ff4', '#0300f4', '#02fd02', '#01c501', '#008e00', '#fdf802',
+                     '#e5bc00', '#fd9500', '#fd0000', '#d40000', '#bc0000', '#f800fd', '#9854c6', '#fdfdfd'],
+    'velocity': ['#00e0ff', '#00b000', '#007000', '#304030', '#404040', '#503030', '#800000', '#d00000', '#ffa0a0'],
+    'width': ['#440154', '#3b528b', '#21918c', '#5ec962', '#fde725'],
+    'zdr': ['#404040', '#6060c0', '#40a0ff', '#60d060', '#ffff40', '#ff9020', '#ff2020', '#ff80ff'],
+    'phi': ['#202060', '#2060c0', '#20c0c0', '#60d060', '#e0e040', '#e08020', '#c02020'],
+    'rho': ['#202020', '#404090', '#4080ff', '#40c0a0', '#80e040', '#ffd020', '#ff6020', '#c00060'],
+    'echo_tops': ['#404040', '#2040a0', '#2090ff', '#20c060', '#f0f020', '#ff9020', '#ff2020', '#ff80ff'],
+    'vil': ['#404040', '#3060c0', '#20b0e0', '#30c030', '#f0f020', '#ff8000', '#e00000', '#a000c0', '#ffffff'],
+    'accumulation': ['#404040', '#a0e0a0', '#40c040', '#108010', '#2060ff', '#8040e0', '#e040e0', '#ff8080', '#ffffff'],
+    'age': ['#ffffff', '#ffff40', '#ffa020', '#ff2020', '#a00060', '#400060', '#202020'],
+}
+
+# Number of entries in each product's 1D lookup table.
+LUT_SIZE = 256
+
+# Environment variable which overrides the configured colormaps file.
+COLORMAPS_PATH_ENV = 'PARDATAVIZ_COLORMAPS'
+
+def get_default_colormaps_path() -> Path | None:
+    """
+    The colormaps file from (in order of precedence) the PARDATAVIZ_COLORMAPS environment
+    variable, the "colormaps_path" setting, or a colormaps.mat next to the application.
+    """
+    for path in (os.environ.get(COLORMAPS_PATH_ENV), get_setting('colormaps_path')):
+        if path:
+            return Path(path)
+    local_path = Path(__file__).parent / 'colormaps.mat'
+    return local_path if local_path.exists() else None
 
 class ColorMaps:
     """
     Reflectivity and Velocity Colormaps
+
+    A registry of the colormap for each product. The colormaps file is only read
+    the first time a colormap is needed (falling back on built-in colormaps if it
+    can't be read), and each product's VisPy Colormap and GPU-ready 1D lookup
+    table (LUT_SIZE x RGBA float32) are built once and cached.
     """
-    def __init__(self, path_to_maps) -> None:
+    def __init__(self, path_to_maps=None) -> None:
         self.path_to_maps = path_to_maps
-        self.maps_mat = scio.loadmat(self.path_to_maps)
-        # Products: ['Z', 'V', 'W', 'D', 'P', 'R']
-        self.maps_by_prod = {
-            'Z': (self.reflectivity(), self.reflectivity_lims()),
-            'V': (self.velocity(), self.velocity_lims()),
-            'W': (self.spectrum_width(), self.spectrum_width_lims()),
-            'D': (self.zdr(), self.zdr_lims()),
-            'P': (self.phi_dp(), self.phi_dp_lims()),
-            'R': (self.rho_hv(), self.rho_hv_lims())
-        }
-        self.units_by_prod = {
-            'Z': 'dB',
-            'V': 'm/s',
-            'W': 'σ(m/s)',
-            'D': 'dB',
-            'P': '',
-            'R': '°'
-        }
+        self.maps_mat = None
+        self.cmap_cache = {}
+        self.lut_cache = {}
+        self.units_by_prod = PRODUCT_UNITS
+
+    def _get_maps(self):
+        if self.maps_mat is None:
+            self.maps_mat = {}
+            if self.path_to_maps is not None:
+                try:
+                    import scipy.io as scio
+                    self.maps_mat = scio.loadmat(self.path_to_maps)
+                except Exception as e:
+                    print(f'Failed to load colormaps file "{self.path_to_maps}", using built-in colormaps: {e}')
+        return self.maps_mat
+
+    def _get_cmap(self, name):
+        if name not in self.cmap_cache:
+            from vispy.color import Colormap
+            maps = self._get_maps()
+            self.cmap_cache[name] = Colormap(maps[name] if name in maps else FALLBACK_COLORMAPS[name])
+        return self.cmap_cache[name]
 
     def get_cmap_and_clims_for_product(self, product):
-        return self.maps_by_prod[product]  
+        return (self._get_cmap(PRODUCT_COLORMAP_NAMES[product]), PRODUCT_LIMITS[product])
+
+    def get_lut_for_product(self, product) -> np.ndarray:
+        """
+        The product's colormap sampled into a (LUT_SIZE x 4) RGBA float32 lookup table,
+        spanning the product's display limits.
+        """
+        if product not in self.lut_cache:
+            (cmap, _) = self.get_cmap_and_clims_for_product(product)
+            self.lut_cache[product] = np.asarray(cmap.map(np.linspace(0.0, 1.0, LUT_SIZE)), dtype=np.float32)
+        return self.lut_cache[product]
 
     def get_units_for_product(self, product):
-        return self.units_by_prod[product]      
+        return self.units_by_prod[product]
 
     def reflectivity(self):
-        return Colormap(self.maps_mat['reflectivity'])
-    
+        return self._get_cmap('reflectivity')
+
     def reflectivity_lims(self):
-        return (-10, 70)
+        return PRODUCT_LIMITS['Z']
 
     def velocity(self):
-        return Colormap(self.maps_mat['velocity'])
-    
+        return self._get_cmap('velocity')
+
     def velocity_lims(self):
-        return (-24, 24)
-    
+        return PRODUCT_LIMITS['V']
+
     def phi_dp(self):
-        return Colormap(self.maps_mat['phi'])
-    
+        return self._get_cmap('phi')
+
     def phi_dp_lims(self):
-        return (20, 150)
-    
+        return PRODUCT_LIMITS['P']
+
     def spectrum_width(self):
-        return Colormap(self.maps_mat['width'])
-    
+        return self._get_cmap('width')
+
     def spectrum_width_lims(self):
-        return (-1, 8)
-    
+        return PRODUCT_LIMITS['W']
+
     def zdr(self):
-        return Colormap(self.maps_mat['zdr'])
-    
+        return self._get_cmap('zdr')
+
     def zdr_lims(self):
-        return (-2, 6)
-    
+        return PRODUCT_LIMITS['D']
+
     def rho_hv(self):
-        return Colormap(self.maps_mat['rho'])
-    
+        return self._get_cmap('rho')
+
     def rho_hv_lims(self):
-        return (0.8, 1.05)
-    
\ No newline at end of file
+        return PRODUCT_LIMITS['R']
+
+_color_maps = None
+
+def get_color_maps() -> ColorMaps:
+    """
+    The shared colormap registry, created on first use from the configured colormaps file.
+    """
+    global _color_maps
+    if _color_maps is None:
+        _color_maps = ColorMaps(get_default_colormaps_path())
+    return _color_maps
+
+def reload_color_maps() -> ColorMaps:
+    """
+    Discard the shared colormap registry (e.g. after the colormaps file setting changed).
+    """
+    global _color_maps
+    _color_maps = None
+    return get_color_maps()
@@ -0,0 +1,208 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from cartesian_regridder import SparseInterpolator, build_interpolation_operator
+from beam_geometry import beam_height_km
+from collections import OrderedDict
+from tracing import tracer
+import numpy as np
+import threading
+
+class CrossSectionLine(object):
+    """
+    A vertical cross-section line, from one point to another given in km east (x)
+    and north (y) of the radar.
+    """
+    def __init__(self, start_km, end_km):
+        self.start_km = (float(start_km[0]), float(start_km[1]))
+        self.end_km = (float(end_km[0]), float(end_km[1]))
+
+    def get_length_km(self) -> float:
+        return float(np.hypot(self.end_km[0] - self.start_km[0], self.end_km[1] - self.start_km[1]))
+
+    def get_key(self) -> tuple:
+        return self.start_km + self.end_km
+
+    def __eq__(self, other):
+        return isinstance(other, CrossSectionLine) and self.get_key() == other.get_key()
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def __repr__(self):
+        return f'CrossSectionLine(({self.start_km[0]:.2f}, {self.start_km[1]:.2f}) -> ({self.end_km[0]:.2f}, {self.end_km[1]:.2f}) km)'
+
+class CrossSectionSampler(SparseInterpolator):
+    """
+    Samples the vertical section along a line out of volumes sharing a scan
+    geometry, as a (height x distance along the line) image. The gates and weights
+    blended into each sample (see build_interpolation_operator()) only depend on the
+    line and the geometry, so they're computed once and every volume is then sampled
+    with a single sparse matrix product. A coarse sampler has COARSE_DECIMATION times
+    fewer samples along each axis.
+    """
+    def __init__(self, azimuths_rad, elevations_rad, ranges_km, line: CrossSectionLine, num_heights=100, coarse=False):
+        ranges_km = np.asarray(ranges_km, dtype=np.float64)
+        # Samples along the line about a gate apart (within reason), heights up to the top of the highest beam
+        gate_spacing_km = abs(ranges_km[-1] - ranges_km[0]) / max(len(ranges_km) - 1, 1)
+        num_samples = int(np.clip(line.get_length_km() / gate_spacing_km, 2, 1000))
+        if coarse:
+            num_samples = max(num_samples // COARSE_DECIMATION, 2)
+            num_heights = max(num_heights // COARSE_DECIMATION, 2)
+        self.coarse = coarse
+        top_km = float(beam_height_km(ranges_km[-1], np.max(elevations_rad)))
+        self.line = line
+        self.distances_km = np.linspace(0.0, line.get_length_km(), num_samples)
+        self.heights_km = np.linspace(0.0, max(top_km, 1.0), num_heights)
+
+        fraction = np.linspace(0.0, 1.0, num_samples)
+        x_km = line.start_km[0] + fraction * (line.end_km[0] - line.start_km[0])
+        y_km = line.start_km[1] + fraction * (line.end_km[1] - line.start_km[1])
+        (z, x) = np.meshgrid(self.heights_km, x_km, indexing='ij')
+        (_, y) = np.meshgrid(self.heights_km, y_km, indexing='ij')
+        operator = build_interpolation_operator(azimuths_rad, elevations_rad, ranges_km, x, y, z)
+        super().__init__(operator, (num_heights, num_samples))
+
+    def sample(self, products: dict, product: str) -> np.ndarray | None:
+        """The (height x distance) section of a product cube, or None if the product isn't available."""
+        return self.interpolate(products, (product,)).get(product)
+
+# Coarse samplers (shown while the full one of a line is being built) have this many times fewer samples along each axis
+COARSE_DECIMATION = 4
+
+_samplers = OrderedDict()
+_samplers_lock = threading.Lock()
+# Samplers of recent lines are kept, so going back and forth between sections (or animating one) is free
+MAX_CACHED_SAMPLERS = 32
+
+def get_sampler_key(volume, line: CrossSectionLine, coarse=False) -> tuple:
+    return (volume.geometry.geometry_hash, line.get_key(), coarse)
+
+def get_cached_cross_section_sampler(volume, line: CrossSectionLine, coarse=False) -> CrossSectionSampler | None:
+    """
+    The cross-section sampler for a volume's scan geometry and a line if it has
+    already been built, else None.
+    """
+    key = get_sampler_key(volume, line, coarse)
+    with _samplers_lock:
+        sampler = _samplers.get(key)
+        if sampler is not None:
+            _samplers.move_to_end(key)
+        return sampler
+
+def get_cross_section_sampler(volume, line: CrossSectionLine, coarse=False) -> CrossSectionSampler:
+    """
+    The (cached) cross-section sampler for a volume's scan geometry and a line,
+    built on the calling thread if needed.
+    """
+    sampler = get_cached_cross_section_sampler(volume, line, coarse)
+    if sampler is not None:
+        return sampler
+    key = get_sampler_key(volume, line, coarse)
+    sampler = CrossSectionSampler(volume.azimuths_rad, volume.elevations_rad, volume.ranges_km, line, coarse=coarse)
+    with _samplers_lock:
+        _samplers[key] = sampler
+        while len(_samplers) > MAX_CACHED_SAMPLERS:
+            _samplers.popitem(last=False)
+    return sampler
+
+class CrossSectionSamplerTask(QRunnable):
+    """
+    QRunnable task building the (coarse or full) sampler of a line.
+    """
+    def __init__(self, engine, volume, line, coarse):
+        super().__init__()
+        self.engine = engine
+        self.volume = volume
+        self.line = line
+        self.coarse = coarse
+
+    def run(self):
+        # The line may have moved on while this was queued (e.g. while a section is being dragged)
+        if self.line == self.engine.latest_line:
+            with tracer.span('build_sampler', 'xsec', coarse=self.coarse) as span:
+                try:
+                    get_cross_section_sampler(self.volume, self.line, self.coarse)
+                except Exception as e:
+                    print(f'Failed to build the cross-section sampler of {self.line}: {e}')
+                    span.set(error=type(e).__name__)
+        self.engine._on_task_finished(self.volume, self.line, self.coarse)
+
+class CrossSectionSamplerEngine(QObject):
+    """
+    Builds cross-section samplers on a worker pool, so drawing or animating a
+    section doesn't block the GUI. A coarse sampler of each line is built first
+    and stands in for the full one until it's ready. Only the most recently
+    requested line is built: lines which have been superseded before their
+    tasks started are skipped.
+    """
+    # Emitted (from the worker thread) with the line which has a new sampler available
+    sampler_ready = Signal(object)
+
+    def __init__(self, max_workers=2):
+        super().__init__()
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max_workers)
+        self.lock = threading.Lock()
+        # Sampler keys of the builds queued or running
+        self.pending = set()
+        self.latest_line = None
+
+    def get(self, volume, line: CrossSectionLine) -> CrossSectionSampler | None:
+        """
+        The best sampler built so far for a volume's scan geometry and a line: the
+        full one, else the coarse one, else None. Missing samplers are requested and
+        `sampler_ready` is emitted as each of them becomes available.
+        """
+        self.latest_line = line
+        sampler = get_cached_cross_section_sampler(volume, line)
+        if sampler is not None:
+            return sampler
+        self.request(volume, line, coarse=True)
+        self.request(volume, line, coarse=False)
+        return get_cached_cross_section_sampler(volume, line, coarse=True)
+
+    def request(self, volume, line: CrossSectionLine, coarse: bool):
+        if get_cached_cross_section_sampler(volume, line, coarse) is not None:
+            return
+        key = get_sampler_key(volume, line, coarse)
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        # Coarse samplers jump the queue
+        self.thread_pool.start(CrossSectionSamplerTask(self, volume, line, coarse), 1 if coarse else 0)
+
+    def _on_task_finished(self, volume, line, coarse):
+        with self.lock:
+            self.pending.discard(get_sampler_key(volume, line, coarse))
+        if get_cached_cross_section_sampler(volume, line, coarse) is not None:
+            self.sampler_ready.emit(line)
+
+_cross_section_sampler_engine = None
+
+def get_cross_section_sampler_engine() -> CrossSectionSamplerEngine:
+    """
+    The shared cross-section sampler engine, created on first use.
+    """
+    global _cross_section_sampler_engine
+    if _cross_section_sampler_engine is None:
+        _cross_section_sampler_engine = CrossSectionSamplerEngine()
+    return _cross_section_sampler_engine
+
+# Benchmark code: python cross_section.py <volume.mat>
+if __name__ == "__main__":
+    import sys
+    import time
+    from radar_volume import RadarVolume
+    volume = RadarVolume.build_radar_volume_from_matlab_file(sys.argv[1])
+    max_range_km = max(volume.ranges_km)
+    line = CrossSectionLine((-max_range_km / 2, max_range_km / 2), (max_range_km / 2, max_range_km / 2))
+
+    start = time.perf_counter()
+    sampler = get_cross_section_sampler(volume, line)
+    print(f'{line}: {sampler.shape} sampler built in {(time.perf_counter() - start) * 1000:.1f} ms')
+
+    num_repeats = 200
+    start = time.perf_counter()
+    for _ in range(num_repeats):
+        section = get_cross_section_sampler(volume, line).sample(volume.products, 'Z')
+    print(f'Sampling: {(time.perf_counter() - start) * 1000 / num_repeats:.3f} ms per volume, {np.count_nonzero(~np.isnan(section))} samples with data')
@@ -1,10 +1,18 @@
-from PySide6.QtCore import QObject, Signal, Slot
+from PySide6.QtCore import QObject, QTimer, Signal, Slot
 from scan_set import ScanSet
 from scan import Scan
 from pathlib import Path
 from radar_volume import RadarVolume
-from background_loader import BackgroundLoader
+from background_loader import BackgroundLoader, LoadResult
+from scrub_preview import ScrubPreviewCache
+from scan_index import ScanIndexBuilder
+from buffer_pool import BufferPool
+from product_statistics import ScanStatistics
+from qc_pipeline import QCEngine, QCPipeline
+from swath_accumulator import get_swath_engine
+from tracing import tracer
 import numpy as np
+import time
 
 class Data_Manager(QObject):
     """
@@ -14,32 +22,187 @@ class Data_Manager(QObject):
     num_volumes_changed = Signal(int)
     # volume_loaded = Signal(str, object)
     render_volume = Signal(RadarVolume)
+    # Emitted with a low-resolution (azimuth x range) thumbnail while the user scrubs the timeline
+    render_preview = Signal(object)
+    # Emitted with the time (datetime or None) of each volume in the selected scan
+    scan_times_changed = Signal(list)
+    # Emitted with the LoadResult of a file which has been quarantined after repeatedly failing to load
+    load_failed = Signal(object)
+    # Emitted with (index, state) whenever the state of a file changes (see reinitialize_file_list for the states)
+    file_state_changed = Signal(int, int)
+    # Emitted with a copy of the state of every file when the file list is replaced
+    file_states_reset = Signal(object)
+    # Emitted with the new number of volumes when files are appended to the selected scan (live mode)
+    num_volumes_appended = Signal(int)
+    # Emitted with the index to show when following the newest volume in live mode
+    follow_index = Signal(int)
+    # Emitted with the ScanStatistics of the selected scan whenever volumes are merged into it (or it's reset)
+    scan_statistics_updated = Signal(object)
 
-    def __init__(self, num_files_to_load=2):
+    # Number of times a file which failed to load is retried before it is quarantined
+    max_load_retries = 2
+    # Delay before the first retry, doubled for every further retry
+    retry_backoff_ms = 500
+
+    def __init__(self, num_files_to_load=2, storage_modes=None, qc_pipeline=None):
         super().__init__()
         self.selected_scan = None
         self.mat_files = []
+        # The same files, for fast membership tests (e.g. when files are appended in live mode)
+        self.mat_file_set = set()
         self.current_index = 0
         # Number of files "around" the current file to load, i.e. the total number of mat files loaded at a given time will be (2 * num_files_to_load + 1).
         # E.g. num_files_to_load = 2 -> matfiles loaded = (2 * 2 + 1) = 5
         self.num_files_to_load = num_files_to_load
         self.loaded_volumes = {}
-        self.loader = BackgroundLoader()
-        self.loader.volume_loaded.connect(self.on_volume_loaded)
+        # Product buffers of evicted volumes are recycled for new loads (scan geometry rarely changes within a scan).
+        self.buffer_pool = BufferPool(max_buffers_per_key=2 * num_files_to_load + 1)
+        # The volume most recently sent out for rendering. Its buffers can't be recycled while it's on screen.
+        self.displayed_volume = None
+        self.deferred_release = []
+        # Compact storage per product, e.g. {'*': 'float16', 'R': 'uint8'} (see product_storage.py)
+        self.storage_modes = storage_modes
+        self.loader = BackgroundLoader(self.buffer_pool, storage_modes)
+        self.loader.volumes_loaded.connect(self.on_volumes_loaded)
+        # Files which repeatedly failed to load (filename -> last LoadResult). Prefetching skips them.
+        self.quarantined_files = {}
+        self.preview_cache = ScrubPreviewCache()
+        self.scan_index = None
+        self.index_builder = ScanIndexBuilder()
+        self.index_builder.index_updated.connect(self.on_scan_index_updated)
+        # Live mode: jump to each new volume as it's appended (while the newest volume is being shown)
+        self.follow_latest = False
+        # Appended files waiting to be shown: filename -> IngestedFile (for measuring ingest latency)
+        self.ingested_files = {}
+        # Product histograms over the volumes of the selected scan loaded so far
+        self.scan_statistics = ScanStatistics()
+        # QC pipeline run on loaded volumes before they're rendered (see qc_pipeline.py). Processed
+        # copies are kept alongside the loaded volumes (filename -> processed volume) until either is
+        # evicted or the pipeline's configuration changes.
+        self.qc_pipeline = qc_pipeline if qc_pipeline is not None else QCPipeline()
+        self.qc_engine = QCEngine()
+        self.qc_engine.volume_processed.connect(self.on_volume_processed)
+        self.processed_volumes = {}
+
+    def set_storage_modes(self, storage_modes):
+        """
+        Change how products are stored (see product_storage.py). Only volumes loaded
+        from now on are affected.
+        """
+        self.storage_modes = storage_modes
+        self.loader.storage_modes = storage_modes
 
     def get_current_index(self):
         return self.current_index
 
     def set_current_index(self, index):
         print(f"Data Manger: Index {index} requested")
-        if 0 <= index <= len(self.mat_files):
-            self.current_index = index
-            # Remove files outside the range
-            self._cleanup_distant_files()
-            self._load_surrounding_files()
+        if 0 <= index < len(self.mat_files):
+            with tracer.span('set_current_index', 'data', index=index) as span:
+                self.current_index = index
+                # Remove files outside the range
+                self._cleanup_distant_files()
+                self._load_surrounding_files()
 
-            if self.mat_files[index] in self.loaded_volumes:
-                self.render_volume.emit(self.loaded_volumes[self.mat_files[index]])
+                resident = self.mat_files[index] in self.loaded_volumes
+                span.set(resident=resident)
+                if resident:
+                    r_volume = self._get_processed_volume(self.loaded_volumes[self.mat_files[index]])
+                    if r_volume is not None:
+                        self._render(r_volume)
+
+    def _get_processed_volume(self, r_volume: RadarVolume) -> RadarVolume | None:
+        """
+        The volume to display for a loaded volume: the volume itself when QC is off,
+        otherwise its processed copy, or None (after requesting it) if it hasn't been
+        processed with the current configuration yet.
+        """
+        if not self.qc_pipeline.is_enabled():
+            return r_volume
+        processed = self.processed_volumes.get(r_volume.filename)
+        if processed is not None and processed.raw_volume is r_volume and processed.qc_key == self.qc_pipeline.get_key():
+            return processed
+        # The volume on display goes ahead of the prefetched ones
+        is_current = self.current_index < len(self.mat_files) and self.mat_files[self.current_index] == r_volume.filename
+        self.qc_engine.request(r_volume, self.qc_pipeline, 1 if is_current else 0)
+        return None
+
+    @Slot(object, object)
+    def on_volume_processed(self, r_volume: RadarVolume, processed: RadarVolume | None):
+        """
+        Slot to handle a volume which has been through the QC pipeline. Results for
+        evicted volumes or a previous configuration are dropped. If QC failed the
+        loaded volume is displayed as is.
+        """
+        if self.loaded_volumes.get(r_volume.filename) is not r_volume:
+            return
+        if processed is None:
+            processed = r_volume
+        elif processed.qc_key != self.qc_pipeline.get_key():
+            return
+        else:
+            self.processed_volumes[r_volume.filename] = processed
+            timings = ', '.join(f'{name} {seconds * 1000:.1f} ms' for (name, seconds) in processed.qc_timings.items())
+            tracer.instant('processed', 'qc', file=r_volume.filename)
+            print(f'Data Manager: QC of "{Path(r_volume.filename).name}": {timings}')
+        if self.current_index < len(self.mat_files) and self.mat_files[self.current_index] == r_volume.filename:
+            self._render(processed)
+
+    def set_qc_pipeline(self, qc_pipeline: QCPipeline):
+        """
+        Change the QC pipeline's configuration. Loaded volumes are processed again
+        (the one on display first) only if the change affects the results.
+        """
+        changed = qc_pipeline.get_key() != self.qc_pipeline.get_key()
+        self.qc_pipeline = qc_pipeline.copy()
+        if not changed:
+            return
+        self.processed_volumes.clear()
+        if self.mat_files and self.mat_files[self.current_index] in self.loaded_volumes:
+            r_volume = self._get_processed_volume(self.loaded_volumes[self.mat_files[self.current_index]])
+            if r_volume is not None:
+                self._render(r_volume)
+        for r_volume in self.loaded_volumes.values():
+            self._get_processed_volume(r_volume)
+
+    def _render(self, r_volume: RadarVolume):
+        """
+        Request rendering of a volume. Buffers of evicted volumes which were still on
+        screen are returned to the pool once something else is displayed.
+        """
+        self.displayed_volume = r_volume
+        with tracer.span('render_volume', 'render', index=self.current_index):
+            self.render_volume.emit(r_volume)
+
+        ingested_file = self.ingested_files.pop(r_volume.filename, None)
+        if ingested_file is not None:
+            now = time.time()
+            print(f'Live ingest: index {self.current_index} rendered {now - ingested_file.mtime:.3f} s after it was written '
+                  f'({ingested_file.detected_at - ingested_file.mtime:.3f} s waiting for the write to settle, {now - ingested_file.detected_at:.3f} s loading and rendering)')
+
+        for evicted_volume in self.deferred_release:
+            if evicted_volume is not r_volume:
+                self.buffer_pool.release_products(evicted_volume.products)
+        self.deferred_release = [v for v in self.deferred_release if v is r_volume]
+
+    def _release_volume(self, r_volume: RadarVolume):
+        """
+        Give an evicted volume's product buffers back to the pool, unless it's still being displayed.
+        """
+        if r_volume is self.displayed_volume:
+            self.deferred_release.append(r_volume)
+        else:
+            self.buffer_pool.release_products(r_volume.products)
+
+    @Slot(int)
+    def preview_index(self, index):
+        """
+        Show a low-resolution preview of the volume at the given index without
+        loading it, e.g. while the timeline slider is being dragged.
+        """
+        thumbnail = self.preview_cache.get_thumbnail(index)
+        if thumbnail is not None:
+            self.render_preview.emit(thumbnail)
 
     def _load_surrounding_files(self):
         """
@@ -50,11 +213,24 @@ class Data_Manager(QObject):
 
         for i in range(start_index, end_index):
             filename = self.mat_files[i]
-            # Avoid reloading already loaded files
+            # Avoid reloading already loaded (or quarantined) files
             if filename not in self.loaded_volumes and self.files_state[i] == 0:
                 # Set the state tracker to loading
-                self.files_state[i] = 1 
-                self.loader.load_volume(filename)
+                self._set_file_state(i, 1)
+                tracer.instant('load requested', 'data', index=i)
+                self.loader.load_volume(filename, i)
+
+    def _set_file_state(self, index, state):
+        self.files_state[index] = state
+        self.file_state_changed.emit(index, state)
+
+    def get_resident_bytes(self) -> int:
+        """Memory used by the product cubes of every loaded volume (and their processed copies)."""
+        return (sum(r_volume.get_nbytes() for r_volume in self.loaded_volumes.values())
+                + sum(r_volume.get_nbytes() for r_volume in self.processed_volumes.values()))
+
+    def _is_within_window(self, index):
+        return abs(index - self.current_index) <= self.num_files_to_load
 
     def _cleanup_distant_files(self):
         """
@@ -67,34 +243,125 @@ class Data_Manager(QObject):
         # Identify and remove files that are not "nearby"
         files_to_remove = [filename for filename in self.loaded_volumes if filename not in nearby_files]
         for filename in files_to_remove:
-            index = self.mat_files.index(filename)
-            print(f'Data Manager: Unloaded index {self.mat_files.index(filename)} {filename}')
-            self.files_state[index] = 0
-            del self.loaded_volumes[filename]
+            # Files from a previously selected scan are no longer in the file list.
+            if filename in self.mat_files:
+                index = self.mat_files.index(filename)
+                print(f'Data Manager: Unloaded index {index} {filename}')
+                tracer.instant('unloaded', 'data', index=index)
+                self._set_file_state(index, 0)
+            self.processed_volumes.pop(filename, None)
+            self._release_volume(self.loaded_volumes.pop(filename))
 
-    @Slot(RadarVolume)
-    def on_volume_loaded(self, r_volume: RadarVolume):
+    @Slot(list)
+    def on_volumes_loaded(self, results: list[LoadResult]):
         """
-        Slot to handle when a volume is loaded.
+        Slot to handle a batch of volumes which have been loaded (or failed to load).
+        Only a volume for the current index triggers rendering, at most once per batch.
         """
-        index = self.mat_files.index(r_volume.filename)
+        volume_to_render = None
+        loaded_indices = []
+        statistics_updated = False
+        for result in results:
+            r_volume = self._on_volume_loaded(result)
+            if r_volume is not None:
+                loaded_indices.append(result.index)
+                if r_volume.statistics is not None and self.scan_statistics.add_volume(r_volume.statistics):
+                    statistics_updated = True
+                # This covers the case when a scan is first selected. The first volume will be loaded asynchronously but everyone will need to be notified when it is loaded.
+                is_current = self.mat_files[self.current_index] == r_volume.filename
+                # Prefetched volumes are processed by the QC pipeline right away too
+                processed = self._get_processed_volume(r_volume)
+                if is_current and processed is not None:
+                    volume_to_render = processed
+
+        if loaded_indices:
+            print(f"Data Manager: Loaded indices {loaded_indices}")
+            tracer.instant('loaded', 'data', indices=loaded_indices)
+
+        if statistics_updated:
+            self.scan_statistics_updated.emit(self.scan_statistics)
+
+        if volume_to_render is not None:
+            print(f"Just loaded volume for current index, requesting rendering! {volume_to_render.filename}")
+            self._render(volume_to_render)
+
+    def _on_volume_loaded(self, result: LoadResult) -> RadarVolume | None:
+        """
+        Handle a single load result. Returns the volume if it was added to the loaded volumes.
+        """
+        index = result.index
+        if index is None or index >= len(self.mat_files) or self.mat_files[index] != result.filename:
+            # A leftover from a previously selected scan.
+            if result.succeeded():
+                self._release_volume(result.volume)
+            return None
+
+        if not result.succeeded():
+            self._on_volume_load_failed(result)
+            return None
+
+        if not self._is_within_window(index):
+            # The user moved on while this file was loading.
+            self._set_file_state(index, 0)
+            self._release_volume(result.volume)
+            return None
+
+        r_volume = result.volume
+        self.quarantined_files.pop(r_volume.filename, None)
         self.loaded_volumes[r_volume.filename] = r_volume
-        print(f"Data Manager: Loaded index {index} {r_volume.filename} {r_volume.products['Z'].shape}")
-        # self.volume_loaded.emit(filename, r_volume)
         
         # Set the state tracker to loaded
-        self.files_state[index] = 2
+        self._set_file_state(index, 2)
 
-        # This covers the case when a scan is first selected. The first volume will be loaded asynchronously but everyone will need to be notified when it is loaded.
-        if self.mat_files[self.current_index] == r_volume.filename:
-            print(f"Just loaded volume for current index, requesting rendering! {r_volume.filename}")
-            self.render_volume.emit(r_volume)
+        # Every loaded volume gets a scrub preview thumbnail for free.
+        self.preview_cache.update_from_volume(index, r_volume)
+        return r_volume
+
+    def _on_volume_load_failed(self, result: LoadResult):
+        """
+        Retry a failed load with exponential backoff, quarantining the file once it has
+        failed too many times so that prefetching doesn't keep wasting workers on it.
+        """
+        print(f'Data Manager: Failed to load index {result.index}: {result}')
+        if result.attempt < self.max_load_retries:
+            delay_ms = self.retry_backoff_ms * (2 ** result.attempt)
+            QTimer.singleShot(delay_ms, lambda: self._retry_load(result))
+        else:
+            print(f'Data Manager: Quarantined index {result.index} after {result.attempt + 1} attempts "{result.filename}"')
+            self.quarantined_files[result.filename] = result
+            # Set the state tracker to failed
+            self._set_file_state(result.index, 3)
+            self.load_failed.emit(result)
+
+    def _retry_load(self, result: LoadResult):
+        index = result.index
+        # Only retry if the file is still part of the scan, still wanted and nobody loaded it in the meantime.
+        if index < len(self.mat_files) and self.mat_files[index] == result.filename and self.files_state[index] == 1:
+            if self._is_within_window(index):
+                self.loader.load_volume(result.filename, index, result.attempt + 1)
+            else:
+                self._set_file_state(index, 0)
+
+    def get_quarantined_files(self) -> list[LoadResult]:
+        return list(self.quarantined_files.values())
+
+    def clear_quarantine(self):
+        """
+        Give quarantined files another chance (e.g. after they have been repaired).
+        """
+        for result in self.quarantined_files.values():
+            if result.filename in self.mat_files:
+                self._set_file_state(self.mat_files.index(result.filename), 0)
+        self.quarantined_files.clear()
+        self._load_surrounding_files()
 
 
     @Slot(ScanSet)
     def on_scanset_load(self, scanset: ScanSet):
         print(f'Data manager now working with scanset "{scanset.get_name()}".')
         self.scanset = scanset
+        # Load the scanset's index and bring it up to date in the background
+        self.scan_index = self.index_builder.open_scanset(scanset)
         if len(self.scanset.get_scans()) > 0:
             self.on_scan_selected(self.scanset.get_scans()[0])
 
@@ -107,38 +374,112 @@ class Data_Manager(QObject):
     def reinitialize_file_list(self):
         if self.selected_scan is not None:
             self.mat_files.clear()
+            self.mat_file_set.clear()
+            self.processed_volumes.clear()
 
             # Working from the base directory for the scanset
             base_dir = self.scanset.get_base_dir()
             # Loop over all the files in the current scan
             for filename in self.selected_scan.get_scan_files():
-                
-                # Extract the time for each scan file
-                # timestamp = self.extract_timestamp_from_filename(filename)
-
-                # if timestamp is not None:
-
                 mat_file = base_dir / Path(filename)
-
-                # self.scan_times.append((timestamp, mat_file))
                 self.mat_files.append(mat_file)
+                self.mat_file_set.add(mat_file)
             
             # This 1-D numpy array tracks the current state of each file:
             #
             # 0 - unloaded
             # 1 - loading
             # 2 - loaded
+            # 3 - failed (quarantined, see _on_volume_load_failed)
             #
             # The data manager will use this array to avoid requesting to load the same file multiple times.
             self.files_state = np.zeros(len(self.mat_files))
+            for (i, mat_file) in enumerate(self.mat_files):
+                if mat_file in self.quarantined_files:
+                    self._set_file_state(i, 3)
+
+            # Start building scrub preview thumbnails for the new file list in the background.
+            self.preview_cache.reset(self.mat_files)
+            self.preview_cache.start_build()
+
+            # Swaths start over with the new scan (unless it starts with the same files)
+            get_swath_engine().set_files(self.mat_files)
+
+            # Statistics start over with the new scan
+            self.scan_statistics = ScanStatistics()
+            self.scan_statistics_updated.emit(self.scan_statistics)
             
             self.set_current_index(0)
+            self.file_states_reset.emit(self.files_state.copy())
             self.num_volumes_changed.emit(len(self.mat_files))
+            self._emit_scan_times()
+
+    def append_files(self, ingested_files):
+        """
+        Append new volume files (IngestedFiles, see live_ingest.py) to the selected scan
+        without resetting anything. If the newest volume is on screen and
+        `follow_latest` is set, move on to the newest appended volume.
+        """
+        if self.selected_scan is None or not ingested_files:
+            return
+        base_dir = self.scanset.get_base_dir()
+        new_files = []
+        for ingested_file in ingested_files:
+            mat_file = Path(ingested_file.path)
+            if mat_file not in self.mat_file_set:
+                self.mat_file_set.add(mat_file)
+                new_files.append(mat_file)
+        if not new_files:
+            return
+
+        was_at_latest = self.current_index >= len(self.mat_files) - 1
+        first_new_index = len(self.mat_files)
+        new_rel_filenames = []
+        for mat_file in new_files:
+            self.mat_files.append(mat_file)
+            try:
+                new_rel_filenames.append(mat_file.relative_to(base_dir).__str__())
+            except ValueError:
+                new_rel_filenames.append(mat_file.__str__())
+        self.selected_scan.get_scan_files().extend(new_rel_filenames)
+        self.files_state = np.concatenate([self.files_state, np.zeros(len(new_files))])
+        self.preview_cache.append_files(new_files)
+        # Swaths resume with the appended files
+        get_swath_engine().set_files(self.mat_files)
 
+        # Only the new files need their state announced (and indexing)
+        self.num_volumes_appended.emit(len(self.mat_files))
+        for index in range(first_new_index, len(self.mat_files)):
+            self.file_state_changed.emit(index, 0)
+        if self.scan_index is not None:
+            self.index_builder.update_files(new_rel_filenames)
 
-    # def extract_timestamp_from_filename(self, filename):
-    #     try:
-    #         timestamp_str = filename.split('_')[1] + filename.split('_')[2][:6]
-    #         return timestamp_str
-    #     except IndexError:
-    #         return None
\ No newline at end of file
+        if self.follow_latest and was_at_latest:
+            # Measure how long it takes the newest volume to make it on screen
+            newest = next(ingested_file for ingested_file in ingested_files if Path(ingested_file.path) == new_files[-1])
+            self.ingested_files = {new_files[-1]: newest}
+            self.follow_index.emit(len(self.mat_files) - 1)
+        else:
+            # Prefetch any new files which fall in the window around the current index
+            self._load_surrounding_files()
+
+    def _emit_scan_times(self):
+        """
+        Let everyone know the time of each volume in the selected scan. Uses the scan
+        index when it's available, otherwise the timestamps in the filenames.
+        """
+        if self.selected_scan is not None and self.scan_index is not None:
+            self.scan_times_changed.emit(self.scan_index.get_timestamps(self.selected_scan.get_scan_files()))
+
+    @Slot(object)
+    def on_scan_index_updated(self, scan_index):
+        if scan_index is self.scan_index:
+            self._emit_scan_times()
+
+    @Slot(int)
+    def on_scan_files_added(self, num_files: int):
+        """
+        Incrementally index files which were added to the scanset.
+        """
+        if self.scan_index is not None:
+            self.index_builder.update(self.scanset)
\ No newline at end of file
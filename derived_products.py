@@ -0,0 +1,158 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from beam_geometry import get_beam_geometry_tables
+from radar_volume import RadarVolume
+from tracing import tracer
+import numpy as np
+import threading
+import time
+
+# Reflectivity (dBZ) an echo has to reach to count towards the echo top
+ECHO_TOP_THRESHOLD_DBZ = 18.0
+
+# Reflectivity is capped before computing VIL so hail doesn't dominate the liquid water estimate
+VIL_MAX_DBZ = 56.0
+
+# Names of the derived products as shown in the product menus
+DERIVED_PRODUCT_NAMES = {
+    'CREF': 'Composite Reflectivity (CREF)',
+    'ET': 'Echo Tops (ET)',
+    'VIL': 'Vertically Integrated Liquid (VIL)',
+}
+
+def composite_reflectivity(z: np.ndarray) -> np.ndarray:
+    """
+    Column maximum reflectivity (dBZ, azimuth x range) of an (el x az x range)
+    reflectivity cube. Columns without any data are NaN.
+    """
+    return np.fmax.reduce(z, axis=0)
+
+def echo_tops(z: np.ndarray, heights_km: np.ndarray, threshold_dbz=ECHO_TOP_THRESHOLD_DBZ) -> np.ndarray:
+    """
+    Height (km above the radar, azimuth x range) of the highest beam at which the
+    reflectivity reaches `threshold_dbz`. `heights_km` is the (el x range) beam
+    height table. Columns which never reach the threshold are NaN.
+    """
+    with np.errstate(invalid='ignore'):
+        tops = np.where(z >= threshold_dbz, heights_km[:, None, :], -np.inf).max(axis=0)
+    tops[np.isneginf(tops)] = np.nan
+    return tops.astype(np.float32)
+
+def vertically_integrated_liquid(z: np.ndarray, heights_km: np.ndarray) -> np.ndarray:
+    """
+    Vertically integrated liquid (kg/m², azimuth x range) of an (el x az x range)
+    reflectivity cube, integrating 3.44e-6 Z^(4/7) between consecutive beams (Greene
+    and Clark, 1972). Elevations must be in ascending order. Missing data counts as
+    no liquid water, columns without any data are NaN.
+    """
+    zlin = np.power(np.float32(10.0), np.fmin(z, VIL_MAX_DBZ) / np.float32(10.0))
+    zlin[np.isnan(zlin)] = 0.0
+    # Layer averages between consecutive beams, weighted by the layer depth in meters
+    layer_z = 0.5 * (zlin[1:] + zlin[:-1])
+    layer_depth_m = 1000.0 * np.diff(heights_km, axis=0).astype(np.float32)
+    vil = np.float32(3.44e-6) * np.einsum('ear,er->ar', np.power(layer_z, np.float32(4.0 / 7.0)), layer_depth_m)
+    vil[np.isnan(z).all(axis=0)] = np.nan
+    return vil.astype(np.float32)
+
+def compute_derived_product(volume: RadarVolume, product: str) -> np.ndarray:
+    """
+    Compute a derived product (one of DERIVED_PRODUCT_NAMES) of a volume as an
+    (azimuth x range) float32 array.
+    """
+    if product not in DERIVED_PRODUCT_NAMES:
+        raise KeyError(f'Unknown derived product "{product}"')
+    z = np.asarray(volume.products['Z'], dtype=np.float32)
+    if product == 'CREF':
+        return composite_reflectivity(z)
+
+    # Beam heights are shared by every volume with the same scan geometry
+    elevations_rad = np.asarray(volume.elevations_rad, dtype=np.float64)
+    order = np.argsort(elevations_rad, kind='stable')
+    heights_km = get_beam_geometry_tables(elevations_rad[order], volume.ranges_km).heights_km
+    if not np.array_equal(order, np.arange(len(order))):
+        z = z[order]
+    if product == 'ET':
+        return echo_tops(z, heights_km)
+    return vertically_integrated_liquid(z, heights_km)
+
+class DerivedProductTask(QRunnable):
+    """
+    QRunnable task computing one derived product of a volume.
+    """
+    def __init__(self, engine, volume, product):
+        super().__init__()
+        self.engine = engine
+        self.volume = volume
+        self.product = product
+
+    def run(self):
+        with tracer.span('derive', 'derived', product=self.product, file=self.volume.filename) as span:
+            try:
+                self.volume.derived_products[self.product] = compute_derived_product(self.volume, self.product)
+            except Exception as e:
+                print(f'Failed to compute {self.product} for "{self.volume.filename}": {e}')
+                span.set(error=type(e).__name__)
+        self.engine._on_task_finished(self.volume, self.product)
+
+class DerivedProductEngine(QObject):
+    """
+    Computes derived products (column products such as composite reflectivity, echo
+    tops and VIL) on a worker pool, on demand. Results are cached in the volume's
+    `derived_products`, so each product is computed at most once per volume.
+    """
+    # Emitted (from the worker thread) with the volume and the product which is now available
+    derived_product_ready = Signal(object, str)
+
+    def __init__(self, max_workers=2):
+        super().__init__()
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max_workers)
+        self.lock = threading.Lock()
+        # (id(volume), product) of the computations queued or running
+        self.pending = set()
+
+    def get(self, volume: RadarVolume, product: str) -> np.ndarray | None:
+        """
+        The derived product of a volume if it has been computed. Otherwise its
+        computation is requested and `derived_product_ready` is emitted once it's done.
+        """
+        result = volume.derived_products.get(product)
+        if result is None:
+            self.request(volume, product)
+        return result
+
+    def request(self, volume: RadarVolume, product: str):
+        if product in volume.derived_products:
+            return
+        key = (id(volume), product)
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        self.thread_pool.start(DerivedProductTask(self, volume, product))
+
+    def _on_task_finished(self, volume, product):
+        with self.lock:
+            self.pending.discard((id(volume), product))
+        if product in volume.derived_products:
+            self.derived_product_ready.emit(volume, product)
+
+_derived_product_engine = None
+
+def get_derived_product_engine() -> DerivedProductEngine:
+    """
+    The shared derived product engine, created on first use.
+    """
+    global _derived_product_engine
+    if _derived_product_engine is None:
+        _derived_product_engine = DerivedProductEngine()
+    return _derived_product_engine
+
+# Benchmark code: python derived_products.py <volume.mat>
+if __name__ == "__main__":
+    import sys
+    volume = RadarVolume.build_radar_volume_from_matlab_file(sys.argv[1])
+    for product in DERIVED_PRODUCT_NAMES:
+        start = time.perf_counter()
+        result = compute_derived_product(volume, product)
+        print(f'{product}: {result.shape} in {(time.perf_counter() - start) * 1000:.1f} ms, '
+              f'range {np.nanmin(result):.2f} .. {np.nanmax(result):.2f} {np.count_nonzero(np.isnan(result))} NaN')
@@ -0,0 +1,159 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from pathlib import Path
+from scan import Scan
+from scan_index import timestamp_from_filename
+import threading
+import time
+import os
+
+def scan_directory(dir_path: str, extension: str) -> tuple[list, list]:
+    """
+    List a single directory with os.scandir. Returns (subdirectories, names of files with the extension).
+    """
+    subdirs = []
+    filenames = []
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith('.'):
+                            subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(extension):
+                        filenames.append(entry.name)
+                except OSError:
+                    continue
+    except OSError as e:
+        print(f'Directory crawler: failed to list "{dir_path}": {e}')
+    return (subdirs, filenames)
+
+def crawl_directory(base_dir, extension='.mat', max_workers=8, progress=None, cancel_flag=None) -> dict:
+    """
+    Walk a directory tree listing directories in parallel (listing is dominated by
+    filesystem latency, especially on network shares, so threads overlap nicely).
+    Returns {directory path: [file names]} for every directory containing files with
+    the extension. `progress(num_dirs_scanned, num_files_found)` is called as the
+    crawl proceeds.
+    """
+    files_by_dir = {}
+    num_dirs = 0
+    num_files = 0
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='crawler') as executor:
+        pending = {executor.submit(scan_directory, str(base_dir), extension): str(base_dir)}
+        while pending:
+            (done, _) = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                dir_path = pending.pop(future)
+                (subdirs, filenames) = future.result()
+                num_dirs += 1
+                if filenames:
+                    files_by_dir[dir_path] = filenames
+                    num_files += len(filenames)
+                if cancel_flag is not None and cancel_flag.is_set():
+                    continue
+                for subdir in subdirs:
+                    pending[executor.submit(scan_directory, subdir, extension)] = subdir
+            if progress is not None:
+                progress(num_dirs, num_files)
+            if cancel_flag is not None and cancel_flag.is_set():
+                for future in pending:
+                    future.cancel()
+                break
+    return files_by_dir
+
+def group_files_into_scans(base_dir, files_by_dir: dict, max_gap_s=None) -> list[Scan]:
+    """
+    Group crawled files into scans, one per directory, with files sorted by the time
+    in their filename (then by name). If `max_gap_s` is given, a directory is split
+    into several scans wherever consecutive volumes are further apart than that.
+    Scans are named after their directory (relative to the base directory) and
+    sorted by the time of their first volume.
+    """
+    base_dir = Path(base_dir)
+    scans = []
+    for (dir_path, filenames) in files_by_dir.items():
+        rel_dir = Path(dir_path).relative_to(base_dir)
+        timed = sorted(((timestamp_from_filename(filename) or datetime.min, filename) for filename in filenames))
+
+        # Split at gaps in time
+        groups = [[]]
+        for (i, (timestamp, filename)) in enumerate(timed):
+            if (max_gap_s is not None and i > 0 and timestamp != datetime.min and timed[i - 1][0] != datetime.min
+                    and (timestamp - timed[i - 1][0]).total_seconds() > max_gap_s):
+                groups.append([])
+            groups[-1].append((timestamp, filename))
+
+        scan_name = rel_dir.as_posix() if rel_dir.parts else base_dir.name
+        for (g, group) in enumerate(groups):
+            name = scan_name if len(groups) == 1 else f'{scan_name} ({g + 1})'
+            scan_files = [(rel_dir / filename).as_posix() for (_, filename) in group]
+            scans.append((group[0][0], name, Scan(name, scan_files)))
+
+    scans.sort(key=lambda scan: (scan[0], scan[1]))
+    return [scan for (_, _, scan) in scans]
+
+class DirectoryCrawlerTask(QRunnable):
+    """
+    QRunnable task crawling a directory tree (itself fanning out over a thread pool).
+    """
+    def __init__(self, crawler, base_dir, max_gap_s, cancel_flag):
+        super().__init__()
+        self.crawler = crawler
+        self.base_dir = base_dir
+        self.max_gap_s = max_gap_s
+        self.cancel_flag = cancel_flag
+        self.last_progress = 0.0
+
+    def run(self):
+        start = time.perf_counter()
+        files_by_dir = crawl_directory(self.base_dir, max_workers=self.crawler.max_workers, progress=self.on_progress, cancel_flag=self.cancel_flag)
+        if self.cancel_flag.is_set():
+            return
+        scans = group_files_into_scans(self.base_dir, files_by_dir, self.max_gap_s)
+        num_files = sum(len(scan.get_scan_files()) for scan in scans)
+        print(f'Directory crawler: found {num_files} files in {len(scans)} scans under "{self.base_dir}" in {time.perf_counter() - start:.2f} s')
+        self.crawler.scans_found.emit(scans)
+
+    def on_progress(self, num_dirs, num_files):
+        # Throttle progress updates, the GUI doesn't need thousands of them
+        now = time.perf_counter()
+        if now - self.last_progress > 0.1:
+            self.last_progress = now
+            self.crawler.progress.emit(num_dirs, num_files)
+
+class DirectoryCrawler(QObject):
+    """
+    Crawls a scanset's base directory in the background and groups the volume files
+    it finds into scans.
+    """
+    # Emitted (from the worker thread) with the number of directories scanned and files found so far
+    progress = Signal(int, int)
+    # Emitted with the list of Scans found
+    scans_found = Signal(list)
+
+    def __init__(self, max_workers=8):
+        super().__init__()
+        self.max_workers = max_workers
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
+        self.cancel_flag = threading.Event()
+
+    def crawl(self, base_dir, max_gap_s=None):
+        self.cancel()
+        self.cancel_flag = threading.Event()
+        self.thread_pool.start(DirectoryCrawlerTask(self, Path(base_dir), max_gap_s, self.cancel_flag))
+
+    def cancel(self):
+        self.cancel_flag.set()
+
+# Benchmark code: python directory_crawler.py <base_dir>
+if __name__ == "__main__":
+    import sys
+    base_dir = sys.argv[1] if len(sys.argv) > 1 else '.'
+    for max_workers in (1, 8):
+        start = time.perf_counter()
+        files_by_dir = crawl_directory(base_dir, max_workers=max_workers)
+        scans = group_files_into_scans(base_dir, files_by_dir)
+        print(f'{max_workers} workers: {sum(len(files) for files in files_by_dir.values())} files in {len(scans)} scans, {time.perf_counter() - start:.3f} s')
@@ -0,0 +1,142 @@
+from PySide6.QtCore import QObject, QFileSystemWatcher, QTimer, Signal, Slot
+from scan_index import timestamp_from_filename
+from datetime import datetime
+from pathlib import Path
+import time
+import os
+
+class IngestedFile(object):
+    """
+    A volume file which showed up in a watched directory and has finished being written.
+    """
+    def __init__(self, path: Path, mtime: float, size: int, detected_at: float):
+        self.path = path
+        # Last modification of the file (time.time()), i.e. roughly when the writer closed it
+        self.mtime = mtime
+        self.size = size
+        # time.time() at which the file was found to be complete
+        self.detected_at = detected_at
+
+    def __repr__(self):
+        return f'IngestedFile("{self.path}", {self.size} bytes, ready {self.detected_at - self.mtime:.3f} s after last write)'
+
+class LiveIngestWatcher(QObject):
+    """
+    Watches a directory for new volume files written by the radar. A QFileSystemWatcher
+    reacts to changes immediately where the platform supports it, and the directory
+    is also polled (e.g. for network filesystems which don't deliver change
+    notifications). A new file is only reported once it hasn't been written to for
+    `settle_ms` (judged by its modification time, or by its size and modification time
+    staying the same across checks if the file server's clock is off), so half-written
+    files are never loaded. Files moved into the directory after being written
+    elsewhere are reported straight away.
+    """
+    # Emitted with a list of IngestedFiles, sorted by time
+    files_ready = Signal(list)
+
+    def __init__(self, extension='.mat', poll_interval_ms=1000, settle_ms=300):
+        super().__init__()
+        self.extension = extension
+        self.settle_s = settle_ms / 1000.0
+        self.directory = None
+        self.known_files = set()
+        # Files which are (possibly) still being written: name -> (size, mtime, time.time() first seen with that size/mtime)
+        self.candidates = {}
+
+        self.fs_watcher = QFileSystemWatcher(self)
+        self.fs_watcher.directoryChanged.connect(self.on_directory_changed)
+
+        self.poll_timer = QTimer(self)
+        self.poll_timer.setInterval(poll_interval_ms)
+        self.poll_timer.timeout.connect(self.check_directory)
+
+        # Re-checks candidates once they should have settled
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.timeout.connect(self.check_directory)
+
+    def start(self, directory, known_files=()):
+        """
+        Start watching a directory. Files in `known_files` (names or paths) are ignored.
+        """
+        self.stop()
+        self.directory = Path(directory)
+        self.known_files = set(Path(filename).name for filename in known_files)
+        self.candidates = {}
+        self.fs_watcher.addPath(str(self.directory))
+        self.poll_timer.start()
+        self.check_directory()
+
+    def stop(self):
+        if self.directory is not None:
+            self.fs_watcher.removePath(str(self.directory))
+        self.poll_timer.stop()
+        self.settle_timer.stop()
+        self.directory = None
+
+    def is_watching(self) -> bool:
+        return self.directory is not None
+
+    @Slot(str)
+    def on_directory_changed(self, path):
+        self.check_directory()
+
+    @Slot()
+    def check_directory(self):
+        if self.directory is None:
+            return
+        now = time.time()
+        ready = []
+        next_check_s = None
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name in self.known_files or not entry.name.lower().endswith(self.extension):
+                        continue
+                    try:
+                        stat_result = entry.stat()
+                    except OSError:
+                        continue
+                    signature = (stat_result.st_size, stat_result.st_mtime)
+                    previous = self.candidates.get(entry.name)
+                    if previous is None or previous[:2] != signature:
+                        # New, or still growing
+                        previous = signature + (now,)
+                        self.candidates[entry.name] = previous
+                    quiet_s = max(now - stat_result.st_mtime, now - previous[2])
+                    if stat_result.st_size > 0 and quiet_s >= self.settle_s:
+                        ready.append(IngestedFile(Path(entry.path), stat_result.st_mtime, stat_result.st_size, now))
+                    else:
+                        wait_s = self.settle_s - quiet_s
+                        next_check_s = wait_s if next_check_s is None else min(next_check_s, wait_s)
+        except OSError as e:
+            print(f'Live ingest: failed to list "{self.directory}": {e}')
+            return
+
+        for ingested_file in ready:
+            self.known_files.add(ingested_file.path.name)
+            del self.candidates[ingested_file.path.name]
+
+        if next_check_s is not None:
+            # Come back as soon as the pending files could have settled rather than waiting for the next poll
+            self.settle_timer.start(max(10, int(next_check_s * 1000) + 5))
+
+        if ready:
+            ready.sort(key=lambda ingested_file: (timestamp_from_filename(ingested_file.path) or datetime.min, ingested_file.path.name))
+            self.files_ready.emit(ready)
+
+# Writer simulator for testing live mode: python live_ingest.py <source_dir> <live_dir> [seconds_between_volumes]
+if __name__ == "__main__":
+    import sys
+    (source_dir, live_dir) = (Path(sys.argv[1]), Path(sys.argv[2]))
+    interval_s = float(sys.argv[3]) if len(sys.argv) > 3 else 3.0
+    live_dir.mkdir(parents=True, exist_ok=True)
+    for source_file in sorted(source_dir.glob('*.mat')):
+        # Write in chunks like the radar does, so readers can observe partial files
+        with source_file.open('rb') as src, (live_dir / source_file.name).open('wb') as dst:
+            while chunk := src.read(1 << 20):
+                dst.write(chunk)
+                dst.flush()
+                time.sleep(0.05)
+        print(f'Wrote {source_file.name}')
+        time.sleep(interval_s)
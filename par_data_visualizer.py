@@ -1,28 +1,53 @@
+import time
+_launch_time = time.perf_counter()
+
 import os
 import sys
 import random
-import vispy.app
+from datetime import datetime
 from pathlib import Path
-from PySide6.QtWidgets import (QApplication, QMainWindow, QDockWidget, QFileDialog, QLabel)
+from PySide6.QtWidgets import (QApplication, QMainWindow, QDockWidget, QFileDialog, QLabel, QInputDialog)
 from PySide6.QtGui import QAction
-from PySide6.QtCore import Qt, Signal, Slot
+from PySide6.QtCore import Qt, Signal, Slot, QTimer
 from data_manager import Data_Manager
 from scan_set import ScanSet
-from scanset_builder import ScansetBuilder
-from volume_slice_selector import VolumeSliceSelector
+from scan import Scan
 from dynamic_dock_widget import DynamicDockWidget
 from timeline_controls import TimelineControls
-from slice_plot import SlicePlot
 from radar_volume import RadarVolume
+from color_maps import reload_color_maps
+from app_config import get_setting, set_setting
+from startup_profiler import startup_profiler
+from profiling import Profiler, HOT_PATHS
+from tracing import tracer
+from stall_watchdog import StallWatchdog, StallWatchdogWidget
+from performance_hud import PerformanceHud
+from live_ingest import LiveIngestWatcher
+from time_series import TimeSeriesPoint, get_time_series_extractor
+from swath_accumulator import get_swath_engine
+from qc_pipeline import QCPipeline
+
+# Heavy modules (VisPy scenes, the scanset builder and the volume slice selector) are
+# imported when they are first needed so the main window can show up quickly.
 
 class PARDataVisualizer(QMainWindow):
+    # Emitted when the colormap registry has been reloaded
+    color_maps_changed = Signal()
+    # Emitted with the CrossSectionLine most recently drawn on a plan view
+    cross_section_line_changed = Signal(object)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("PAR Data Visualizer")
         self.setGeometry(0, 0, 1600, 900)
 
-        # Volume data manager
-        self.data_manager = Data_Manager(num_files_to_load=10)
+        # Volume data manager. Products are stored at full precision (float32) unless compact
+        # storage is turned on in the settings, e.g. {'*': 'float16'}, which halves the memory
+        # used by each resident volume at the cost of slightly lossy values (see product_storage.py).
+        # Loaded volumes go through the QC pipeline configured in the settings.
+        self.data_manager = Data_Manager(num_files_to_load=10, storage_modes=get_setting('storage_modes'),
+                                         qc_pipeline=QCPipeline.from_dict(get_setting('qc_pipeline')))
+        startup_profiler.mark('Main window: data manager')
 
         # Menu bar and related actions
         menu_bar = self.menuBar()
@@ -36,6 +61,26 @@ class PARDataVisualizer(QMainWindow):
         load_scanset_action.triggered.connect(self.load_scanset)
         self.file_menu.addAction(load_scanset_action)
 
+        self.live_mode_action = QAction("Live mode...", self, checkable=True)
+        self.live_mode_action.setToolTip("Watch a directory and follow the newest volume as it's written")
+        self.live_mode_action.triggered.connect(self.on_live_mode_triggered)
+        self.file_menu.addAction(self.live_mode_action)
+
+        retry_quarantined_action = QAction("Retry quarantined files", self)
+        retry_quarantined_action.setToolTip("Give volumes which repeatedly failed to load another chance (e.g. after they've been repaired)")
+        retry_quarantined_action.triggered.connect(self.retry_quarantined_files)
+        self.file_menu.addAction(retry_quarantined_action)
+
+        self.compact_storage_action = QAction("Compact product storage (float16)", self, checkable=True)
+        self.compact_storage_action.setToolTip("Store loaded products as float16 (half the memory, slightly lossy values)")
+        self.compact_storage_action.setChecked(bool(self.data_manager.storage_modes))
+        self.compact_storage_action.toggled.connect(self.on_compact_storage_toggled)
+        self.file_menu.addAction(self.compact_storage_action)
+
+        colormaps_file_action = QAction("Colormaps file...", self)
+        colormaps_file_action.triggered.connect(self.choose_colormaps_file)
+        self.file_menu.addAction(colormaps_file_action)
+
         exit_action = QAction("Exit", self, shortcut="Ctrl+Q")
         exit_action.triggered.connect(self.close)
         self.file_menu.addAction(exit_action)
@@ -50,6 +95,18 @@ class PARDataVisualizer(QMainWindow):
         new_rhi_view_action.triggered.connect(lambda: self.create_new_dynamic_view(True, 'rhi'))
         self.view_menu.addAction(new_rhi_view_action)
 
+        new_cappi_view_action = QAction("New CAPPI View...", self)
+        new_cappi_view_action.triggered.connect(lambda: self.create_new_dynamic_view(True, 'cappi'))
+        self.view_menu.addAction(new_cappi_view_action)
+
+        new_xsec_view_action = QAction("New Cross Section View...", self)
+        new_xsec_view_action.triggered.connect(lambda: self.create_new_dynamic_view(True, 'xsec'))
+        self.view_menu.addAction(new_xsec_view_action)
+
+        time_series_action = QAction("Time Series at Lat/Lon...", self)
+        time_series_action.triggered.connect(self.request_time_series_at_lat_lon)
+        self.view_menu.addAction(time_series_action)
+
         # Sections (e.g. context_menu.addSection()) may be ignored depending on the
         # platform look and feel, so just add a disabled "action" and separator
         # to act as a label for a group of actions in the menu.
@@ -59,31 +116,41 @@ class PARDataVisualizer(QMainWindow):
         self.view_menu.addAction(self.toggle_views_action)
         self.view_menu.addSeparator()
 
+        # Live mode (watches a directory for new volumes)
+        self.live_watcher = LiveIngestWatcher()
+        self.live_watcher.files_ready.connect(self.data_manager.append_files)
+
+        # Built-in cProfile hooks
+        self.profiler = Profiler()
+        # Where the trace is written on exit (--trace)
+        self.trace_path = None
+        self.profiler.status_updated.connect(self.on_status_updated)
+        # Event loop stall watchdog (stalls are logged to ~/.pardataviz/logs/stalls.log)
+        self.stall_watchdog = StallWatchdog(threshold_ms=get_setting('stall_threshold_ms', 100))
+        self.stall_watchdog.stall_detected.connect(lambda stall: self.statusBar().showMessage(f'UI stalled for {stall.duration_s * 1000:.0f} ms in {stall.culprit}'))
+        self.create_profiling_menu(menu_bar)
+
+        startup_profiler.mark('Main window: menus')
+
         # Get wild with docking
         self.setDockNestingEnabled(True)
 
-        # Scanset Builder
+        # Scanset Builder (the builder itself is constructed when the dock is first shown)
         self.dockable_ssb = QDockWidget("Scan Set Builder", self)
         # self.dockable_ssb.setFloating(True) # Start as a floating window
         self.dockable_ssb.hide() # Don't show up at startup
         self.addDockWidget(Qt.DockWidgetArea.LeftDockWidgetArea, self.dockable_ssb)
         self.view_menu.addAction(self.dockable_ssb.toggleViewAction())
+        self.scanset_builder = None
+        self.dockable_ssb.visibilityChanged.connect(lambda visible: visible and self.get_scanset_builder())
 
-        self.scanset_builder = ScansetBuilder()
-        self.scanset_builder.status_updated.connect(self.on_status_updated)
-        self.scanset_builder.scanset_loaded.connect(self.data_manager.on_scanset_load)
-        self.dockable_ssb.setWidget(self.scanset_builder)
-
-        # Volume Slice Selector (separate but dockable dialog)
+        # Volume Slice Selector (separate but dockable dialog, constructed when first shown)
         self.dockable_vss = QDockWidget("Volume Slice Selector", self)
         self.dockable_vss.setFloating(True) # Start as a floating window
         self.dockable_vss.hide() # Don't show up at startup
         self.view_menu.addAction(self.dockable_vss.toggleViewAction())
-
-        self.volume_slice_selector = VolumeSliceSelector()
-        self.data_manager.render_volume.connect(lambda r_vol: self.volume_slice_selector.on_grid_updated(len(r_vol.elevations_rad), len(r_vol.azimuths_rad), 20, 20, 10))
-        # self.volume_slice_selector.on_grid_updated(1, 1, 20, 20, 10)
-        self.dockable_vss.setWidget(self.volume_slice_selector)
+        self.volume_slice_selector = None
+        self.dockable_vss.visibilityChanged.connect(lambda visible: visible and self.get_volume_slice_selector())
         
         # Timeline controls    
         self.dockable_timec = QDockWidget("Timeline Controls", self)
@@ -91,11 +158,48 @@ class PARDataVisualizer(QMainWindow):
         self.dockable_timec.hide()
         self.timeline_controls = TimelineControls()
         self.timeline_controls.timeline_index_changed.connect(lambda index: self.data_manager.set_current_index(index))
+        self.timeline_controls.timeline_index_previewed.connect(self.data_manager.preview_index)
         self.data_manager.num_volumes_changed.connect(self.timeline_controls.on_num_volumes_changed)
+        self.data_manager.scan_times_changed.connect(self.timeline_controls.on_scan_times_changed)
+        self.data_manager.file_state_changed.connect(self.timeline_controls.on_file_state_changed)
+        self.data_manager.file_states_reset.connect(self.timeline_controls.on_file_states_reset)
+        self.data_manager.num_volumes_appended.connect(self.timeline_controls.on_num_volumes_appended)
+        self.data_manager.follow_index.connect(self.timeline_controls.on_follow_index)
+        self.data_manager.load_failed.connect(lambda result: self.statusBar().showMessage(f'Failed to load volume {result.index} ({result.error_type}): "{result.filename}"'))
         self.dockable_timec.setWidget(self.timeline_controls)
         self.view_menu.addAction(self.dockable_timec.toggleViewAction())
         self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.dockable_timec)
 
+        # Stall watchdog report
+        self.dockable_stalls = QDockWidget("Stall Watchdog", self)
+        self.dockable_stalls.setFloating(True) # Start as a floating window
+        self.dockable_stalls.hide()
+        self.dockable_stalls.setWidget(StallWatchdogWidget(self.stall_watchdog))
+        self.view_menu.addAction(self.dockable_stalls.toggleViewAction())
+
+        # Performance HUD
+        self.dockable_hud = QDockWidget("Performance", self)
+        self.dockable_hud.setFloating(True) # Start as a floating window
+        self.dockable_hud.hide()
+        self.dockable_hud.setWidget(PerformanceHud(self.data_manager, lambda: list(self.dynamic_view_plots.values())))
+        self.view_menu.addAction(self.dockable_hud.toggleViewAction())
+
+        # Point time series (the plot and extractor are constructed when first needed)
+        self.dockable_time_series = QDockWidget("Time Series", self)
+        self.dockable_time_series.setFloating(True) # Start as a floating window
+        self.dockable_time_series.hide()
+        self.view_menu.addAction(self.dockable_time_series.toggleViewAction())
+        self.time_series_plot = None
+        self.dockable_time_series.visibilityChanged.connect(lambda visible: visible and self.get_time_series_plot())
+
+        # QC pipeline editor (constructed when first shown)
+        self.dockable_qc = QDockWidget("QC Pipeline", self)
+        self.dockable_qc.setFloating(True) # Start as a floating window
+        self.dockable_qc.hide()
+        self.view_menu.addAction(self.dockable_qc.toggleViewAction())
+        self.qc_pipeline_editor = None
+        self.dockable_qc.visibilityChanged.connect(lambda visible: visible and self.get_qc_pipeline_editor())
+
         # This is a bit of a hack to create a known position in the menu
         # before which we can insert new dynamic views.
         self.dummy_view_action = QAction("Dummy View Action", self)
@@ -105,7 +209,23 @@ class PARDataVisualizer(QMainWindow):
         
         self.dynamic_views = []
         self.dynamic_view_actions = {}
+        self.dynamic_view_plots = {}
         self.dynamic_view_count = 0
+        self.cross_section_line = None
+        startup_profiler.mark('Main window: docks')
+
+        self.happy_messages = ['Jolly good.', 'Happy hunting.', 'Best of luck.', 'I\'m rooting for you.']
+        self.ready_status_widget = QLabel('Ready to rock. 🎸 v0.1')
+        self.show()
+        self.statusBar().addPermanentWidget(self.ready_status_widget)
+        self.statusBar().showMessage(f'PAR Data Visualizer initialized! {random.choice(self.happy_messages)}')
+        startup_profiler.mark('Main window: show')
+
+        # The initial views are built once the (empty) window is on screen.
+        QTimer.singleShot(0, self.create_initial_views)
+
+    def create_initial_views(self):
+        startup_profiler.mark('First event loop iteration (window shown)')
 
         # Initial PPI Canvas
         initial_ppi = self.create_new_dynamic_view(False, 'ppi')
@@ -114,12 +234,202 @@ class PARDataVisualizer(QMainWindow):
         # Initial RHI Canvas
         initial_rhi = self.create_new_dynamic_view(False, 'rhi')
         self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, initial_rhi)
+        startup_profiler.mark('Initial PPI/RHI views')
+
+        if startup_profiler.enabled:
+            print(startup_profiler.report())
+
+    def create_profiling_menu(self, menu_bar):
+        self.profiling_menu = menu_bar.addMenu("Profiling")
+
+        self.profile_session_action = QAction("Profile GUI thread", self, checkable=True)
+        self.profile_session_action.toggled.connect(lambda checked: self.profiler.start_session() if checked else self.profiler.stop_session())
+        self.profiler.session_state_changed.connect(self.on_profile_session_state_changed)
+        self.profiling_menu.addAction(self.profile_session_action)
+
+        profile_30s_action = QAction("Profile next 30 seconds", self)
+        profile_30s_action.triggered.connect(lambda: self.profiler.profile_for(30))
+        self.profiling_menu.addAction(profile_30s_action)
+        self.profiling_menu.addSeparator()
+
+        # Hot paths are profiled on every thread they run on until unchecked, then saved.
+        hot_paths_label = QAction("Hot paths", self)
+        hot_paths_label.setEnabled(False)
+        self.profiling_menu.addAction(hot_paths_label)
+        self.hot_path_actions = {}
+        for name in HOT_PATHS:
+            action = QAction(name, self, checkable=True)
+            action.toggled.connect(lambda checked, name=name: self.profiler.enable_hot_path(name) if checked else self.profiler.disable_hot_path(name))
+            self.profiling_menu.addAction(action)
+            self.hot_path_actions[name] = action
+
+        save_hot_paths_action = QAction("Save hot path profiles", self)
+        save_hot_paths_action.triggered.connect(self.profiler.save_hot_paths)
+        self.profiling_menu.addAction(save_hot_paths_action)
+        self.profiling_menu.addSeparator()
+
+        # Span tracing across the loader workers, data manager and views (Chrome trace-event JSON)
+        self.trace_action = QAction("Record trace", self, checkable=True)
+        self.trace_action.toggled.connect(lambda checked: tracer.enable() if checked else tracer.disable())
+        self.profiling_menu.addAction(self.trace_action)
+
+        save_trace_action = QAction("Save trace...", self)
+        save_trace_action.triggered.connect(self.save_trace)
+        self.profiling_menu.addAction(save_trace_action)
+        self.profiling_menu.addSeparator()
+
+        self.stall_watchdog_action = QAction("Stall watchdog", self, checkable=True)
+        self.stall_watchdog_action.toggled.connect(self.on_stall_watchdog_toggled)
+        self.profiling_menu.addAction(self.stall_watchdog_action)
+        # Off unless turned on (it adds a heartbeat timer to the event loop it's measuring)
+        self.stall_watchdog_action.setChecked(get_setting('stall_watchdog', False))
+        self.profiling_menu.addSeparator()
+
+        profile_dir_action = QAction("Output directory...", self)
+        profile_dir_action.triggered.connect(self.choose_profile_dir)
+        self.profiling_menu.addAction(profile_dir_action)
+
+    @Slot(bool)
+    def on_stall_watchdog_toggled(self, checked: bool):
+        if checked:
+            self.stall_watchdog.start()
+        else:
+            self.stall_watchdog.stop()
+        set_setting('stall_watchdog', checked)
+
+    @Slot(bool)
+    def on_profile_session_state_changed(self, active: bool):
+        self.profile_session_action.blockSignals(True)
+        self.profile_session_action.setChecked(active)
+        self.profile_session_action.blockSignals(False)
+
+    def retry_quarantined_files(self):
+        num_quarantined = len(self.data_manager.get_quarantined_files())
+        self.data_manager.clear_quarantine()
+        self.statusBar().showMessage(f'Retrying {num_quarantined} quarantined files' if num_quarantined else 'No quarantined files')
+
+    @Slot(bool)
+    def on_compact_storage_toggled(self, checked: bool):
+        storage_modes = {'*': 'float16'} if checked else None
+        set_setting('storage_modes', storage_modes)
+        self.data_manager.set_storage_modes(storage_modes)
+        self.statusBar().showMessage(f'Volumes loaded from now on are stored as {"float16" if checked else "float32"}')
+
+    def choose_profile_dir(self):
+        out_dir = QFileDialog.getExistingDirectory(self, "Profile output directory...", str(self.profiler.out_dir))
+        if out_dir:
+            set_setting('profile_dir', out_dir)
+            self.profiler.set_output_dir(out_dir)
+            self.statusBar().showMessage(f'Writing profiles to "{out_dir}"')
+
+    def save_trace(self):
+        default_path = str(self.profiler.out_dir / f'trace_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+        (filename, selected_filter) = QFileDialog.getSaveFileName(self, "Save trace...", default_path, "Chrome trace files (*.json)")
+        if filename:
+            tracer.export_chrome_trace(filename)
+            self.statusBar().showMessage(f'Saved trace to "{filename}" (open it in chrome://tracing or ui.perfetto.dev)')
+
+    def get_scanset_builder(self):
+        """
+        The scanset builder, constructed the first time it's needed.
+        """
+        if self.scanset_builder is None:
+            from scanset_builder import ScansetBuilder
+            self.scanset_builder = ScansetBuilder()
+            self.scanset_builder.status_updated.connect(self.on_status_updated)
+            self.scanset_builder.scanset_loaded.connect(self.data_manager.on_scanset_load)
+            self.scanset_builder.scan_file_list_editor.scan_files_added.connect(self.data_manager.on_scan_files_added)
+            self.dockable_ssb.setWidget(self.scanset_builder)
+        return self.scanset_builder
+
+    def get_volume_slice_selector(self):
+        """
+        The volume slice selector, constructed the first time it's needed.
+        """
+        if self.volume_slice_selector is None:
+            from volume_slice_selector import VolumeSliceSelector
+            self.volume_slice_selector = VolumeSliceSelector()
+            self.data_manager.render_volume.connect(self.volume_slice_selector.on_render_volume)
+            self.dockable_vss.setWidget(self.volume_slice_selector)
+
+            for slice_plot in self.dynamic_view_plots.values():
+                self.connect_volume_slice_selector(slice_plot)
+
+            # Catch up with the volume on screen
+            r_vol = self.data_manager.displayed_volume
+            if r_vol is not None:
+                self.volume_slice_selector.on_render_volume(r_vol)
+        return self.volume_slice_selector
+
+    def get_time_series_plot(self):
+        """
+        The time series plot, constructed the first time it's needed.
+        """
+        if self.time_series_plot is None:
+            from time_series_plot import TimeSeriesPlot
+            self.time_series_plot = TimeSeriesPlot(get_time_series_extractor())
+            self.dockable_time_series.setWidget(self.time_series_plot)
+        return self.time_series_plot
+
+    def get_qc_pipeline_editor(self):
+        """
+        The QC pipeline editor, constructed the first time it's needed.
+        """
+        if self.qc_pipeline_editor is None:
+            from qc_pipeline_editor import QCPipelineEditor
+            self.qc_pipeline_editor = QCPipelineEditor(self.data_manager.qc_pipeline)
+            self.qc_pipeline_editor.pipeline_changed.connect(self.on_qc_pipeline_changed)
+            self.data_manager.render_volume.connect(self.qc_pipeline_editor.on_volume_rendered)
+            self.qc_pipeline_editor.on_volume_rendered(self.data_manager.displayed_volume)
+            self.dockable_qc.setWidget(self.qc_pipeline_editor)
+        return self.qc_pipeline_editor
+
+    @Slot(object)
+    def on_qc_pipeline_changed(self, qc_pipeline: QCPipeline):
+        set_setting('qc_pipeline', qc_pipeline.to_dict())
+        self.data_manager.set_qc_pipeline(qc_pipeline)
+        stages = ', '.join(stage.label for stage in qc_pipeline.get_enabled_stages())
+        self.statusBar().showMessage(f'QC pipeline: {stages}' if stages else 'QC pipeline off')
+
+    @Slot(object)
+    def on_time_series_requested(self, point: TimeSeriesPoint):
+        """
+        Extract the time series at a point through every volume of the selected scan.
+        """
+        if not self.data_manager.mat_files:
+            self.statusBar().showMessage('Select a scan to extract a time series from.')
+            return
+        self.get_time_series_plot()
+        self.dockable_time_series.show()
+        get_time_series_extractor().extract(self.data_manager.mat_files, point)
+        self.statusBar().showMessage(f'Extracting the time series at {point.description}...')
+
+    def request_time_series_at_lat_lon(self):
+        r_vol = self.data_manager.displayed_volume
+        if r_vol is None:
+            self.statusBar().showMessage('Select a scan to extract a time series from.')
+            return
+        (text, ok) = QInputDialog.getText(self, "Time Series at Lat/Lon", "Latitude, longitude (degrees), optionally followed by a tilt index:")
+        if not ok or not text.strip():
+            return
+        try:
+            fields = [field.strip() for field in text.split(',')]
+            (lat, lon) = (float(fields[0]), float(fields[1]))
+            el_idx = int(fields[2]) if len(fields) > 2 else 0
+            if not 0 <= el_idx < len(r_vol.elevations_rad):
+                raise ValueError(f'Tilt index {el_idx} is out of range')
+            point = TimeSeriesPoint.from_lat_lon(r_vol, lat, lon, el_idx)
+        except (ValueError, IndexError) as e:
+            self.statusBar().showMessage(f'No time series at "{text}": {e}')
+            return
+        self.on_time_series_requested(point)
+
+    def connect_volume_slice_selector(self, slice_plot):
+        # When the selected RHI/PPI slices change, update the plot
+        self.volume_slice_selector.selection_changed.connect(slice_plot.on_az_el_index_selection_changed)
 
-        self.happy_messages = ['Jolly good.', 'Happy hunting.', 'Best of luck.', 'I\'m rooting for you.']
-        self.ready_status_widget = QLabel('Ready to rock. 🎸 v0.1')
-        self.show()
-        self.statusBar().addPermanentWidget(self.ready_status_widget)
-        self.statusBar().showMessage(f'PAR Data Visualizer initialized! {random.choice(self.happy_messages)}')
+        # When the user hovers on RHI/PPI slices, update the plot
+        self.volume_slice_selector.slice_hovered.connect(slice_plot.on_az_el_slice_hovered)
         
     def closeEvent(self, event):
         """Ensure the viewer quits when the main window is closed. This is necessary
@@ -128,14 +438,20 @@ class PARDataVisualizer(QMainWindow):
         user shouldn't have to close all windows before exiting."""
         # Signal background loading tasks to stop.
         self.data_manager.loader.stop_flag.set()
+        self.data_manager.preview_cache.cancel()
+        self.stall_watchdog.stop()
+        get_swath_engine().stop()
+        if self.time_series_plot is not None:
+            get_time_series_extractor().shutdown()
+        # Don't lose profiles which are still being collected.
+        self.profiler.stop_all()
+        if self.trace_path is not None:
+            tracer.export_chrome_trace(self.trace_path)
         QApplication.instance().quit()
 
     def create_new_dynamic_view(self, floating, slice_type):
         self.dynamic_view_count = self.dynamic_view_count + 1
-        if slice_type == 'rhi':
-            view_title = f'View {self.dynamic_view_count} - RHI (Z)'
-        else:
-            view_title = f'View {self.dynamic_view_count} - PPI (Z)'
+        view_title = f'View {self.dynamic_view_count} - {slice_type.upper()} (Z)'
         dock_widget = DynamicDockWidget(view_title, self)
 
         if floating:
@@ -143,6 +459,7 @@ class PARDataVisualizer(QMainWindow):
             dock_widget.show()
         
         # Slice plot setup
+        from slice_plot import SlicePlot
         slice_plot = SlicePlot(self.dynamic_view_count, dock_widget, slice_type)
         dock_widget.setWidget(slice_plot.canvas.native)
         
@@ -151,12 +468,33 @@ class PARDataVisualizer(QMainWindow):
         # When the data manager requests, render a volume
         self.data_manager.render_volume.connect(slice_plot.on_radar_volume_updated)
 
-        # When the selected RHI/PPI slices change, update the plot
-        self.volume_slice_selector.selection_changed.connect(slice_plot.on_az_el_index_selection_changed)
+        # While scrubbing the timeline, show low-resolution previews
+        self.data_manager.render_preview.connect(slice_plot.on_preview_updated)
 
-        # When the user hovers on RHI/PPI slices, update the plot
-        self.volume_slice_selector.slice_hovered.connect(slice_plot.on_az_el_slice_hovered)
+        # When a different colormaps file is chosen, update the plot colors
+        self.color_maps_changed.connect(slice_plot.on_color_maps_changed)
+
+        # Automatic color limits can follow the statistics of the whole scan
+        self.data_manager.scan_statistics_updated.connect(slice_plot.on_scan_statistics_updated)
+        slice_plot.on_scan_statistics_updated(self.data_manager.scan_statistics)
+
+        # Right-clicking a gate extracts its time series
+        slice_plot.time_series_requested.connect(self.on_time_series_requested)
+
+        # Lines drawn on plan views drive the cross-section views
+        if slice_plot.is_plan_view():
+            slice_plot.cross_section_line_changed.connect(self.on_cross_section_line_changed)
+        elif slice_type == 'xsec':
+            self.cross_section_line_changed.connect(slice_plot.on_cross_section_line_changed)
+            if self.cross_section_line is not None:
+                slice_plot.on_cross_section_line_changed(self.cross_section_line)
 
+        if self.volume_slice_selector is not None:
+            self.connect_volume_slice_selector(slice_plot)
+
+        # Show the volume on screen right away (for views created after a scan was loaded)
+        if self.data_manager.displayed_volume is not None:
+            slice_plot.on_radar_volume_updated(self.data_manager.displayed_volume)
         
         # View menu action management
         toggle_view_action = dock_widget.toggleViewAction()
@@ -164,11 +502,17 @@ class PARDataVisualizer(QMainWindow):
         
         # Add an entry in the widget -> action mapping
         self.dynamic_view_actions[dock_widget] = toggle_view_action
+        self.dynamic_view_plots[dock_widget] = slice_plot
 
         self.dynamic_views.append(dock_widget)
         self.statusBar().showMessage(f'{dock_widget.windowTitle()} view created.')
         return dock_widget
 
+    @Slot(object)
+    def on_cross_section_line_changed(self, line):
+        self.cross_section_line = line
+        self.cross_section_line_changed.emit(line)
+
     def remove_dynamic_view(self, dock_widget):
         if dock_widget in self.dynamic_views:
             self.dynamic_views.remove(dock_widget)
@@ -177,21 +521,68 @@ class PARDataVisualizer(QMainWindow):
         if dock_widget in self.dynamic_view_actions:
             action = self.dynamic_view_actions.pop(dock_widget)
             self.view_menu.removeAction(action)
+        self.dynamic_view_plots.pop(dock_widget, None)
 
         self.statusBar().showMessage(f'{dock_widget.windowTitle()} view closed.')
         
     def new_scanset(self):
         self.dockable_ssb.setVisible(True)
         self.scanset = ScanSet("New scanset", base_dir=Path(os.path.expanduser("~")))
-        self.scanset_builder.on_scanset_loaded(self.scanset)
+        self.get_scanset_builder().on_scanset_loaded(self.scanset)
 
     def load_scanset(self):
         (filename, selected_filter) = QFileDialog.getOpenFileName(self, "Load scanset...", os.path.expanduser("~"), "JSON files (*.json)")
         if filename:
             self.scanset = ScanSet.load_scanset(Path(filename))
-            self.scanset_builder.on_scanset_loaded(self.scanset)
+            self.get_scanset_builder().on_scanset_loaded(self.scanset)
             self.statusBar().showMessage(f'Loaded scanset "{self.scanset.get_name()}" ✔️')
 
+    def on_live_mode_triggered(self, checked):
+        if not checked:
+            self.stop_live_mode()
+            return
+        directory = QFileDialog.getExistingDirectory(self, "Live mode directory...", get_setting('live_dir', os.path.expanduser("~")))
+        if directory:
+            set_setting('live_dir', directory)
+            self.start_live_mode(directory)
+        else:
+            self.live_mode_action.setChecked(False)
+
+    def start_live_mode(self, directory):
+        """
+        Show the volumes in a directory, then keep watching it and follow each new volume as it's written.
+        """
+        from directory_crawler import scan_directory, group_files_into_scans
+        directory = Path(directory)
+        (_, filenames) = scan_directory(str(directory), '.mat')
+        scans = group_files_into_scans(directory, {str(directory): filenames}) if filenames else [Scan(directory.name)]
+
+        self.scanset = ScanSet(f'Live ({directory.name})', base_dir=directory)
+        self.scanset.add_scan(scans[0])
+        self.data_manager.follow_latest = True
+        self.data_manager.on_scanset_load(self.scanset)
+        if filenames:
+            self.timeline_controls.on_follow_index(len(filenames) - 1)
+
+        self.live_watcher.start(directory, known_files=filenames)
+        self.live_mode_action.setChecked(True)
+        self.statusBar().showMessage(f'Live mode: watching "{directory}"')
+
+    def stop_live_mode(self):
+        self.live_watcher.stop()
+        self.data_manager.follow_latest = False
+        self.live_mode_action.setChecked(False)
+        self.statusBar().showMessage('Live mode stopped.')
+
+    def choose_colormaps_file(self):
+        start_dir = get_setting('colormaps_path', os.path.expanduser("~"))
+        (filename, selected_filter) = QFileDialog.getOpenFileName(self, "Colormaps file...", start_dir, "MATLAB files (*.mat)")
+        if filename:
+            set_setting('colormaps_path', filename)
+            reload_color_maps()
+            self.color_maps_changed.emit()
+            self.statusBar().showMessage(f'Using colormaps from "{filename}"')
+
     @Slot(str)
     def on_status_updated(self, status: str):
         self.statusBar().showMessage(status)
@@ -226,13 +617,39 @@ class PARDataVisualizer(QMainWindow):
     #         return timestamp_str
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="PAR Data Visualizer")
+    parser.add_argument("--profile-startup", action="store_true", help="Print a breakdown of the time to first window by phase.")
+    parser.add_argument("--profile", type=float, metavar="SECONDS", help="Profile the GUI thread for the first SECONDS seconds.")
+    parser.add_argument("--profile-hot-path", action="append", default=[], choices=list(HOT_PATHS), help="Profile every call to a hot path (saved on exit).")
+    parser.add_argument("--profile-dir", help="Directory profiles (.prof and flamegraph .svg) are written to.")
+    parser.add_argument("--live", metavar="DIR", help="Start in live mode, following new volumes written to DIR.")
+    parser.add_argument("--trace", metavar="PATH", help="Record a trace and write it (Chrome trace-event JSON) to PATH on exit.")
+    (args, qt_args) = parser.parse_known_args()
+    if args.profile_startup:
+        startup_profiler.enable(_launch_time)
+        startup_profiler.mark('Imports')
+
     # Solves issue with VisPy plots breaking when docks transition between floating and docked: 
     # https://github.com/vispy/vispy/issues/1759#issuecomment-724217682
     QApplication.setAttribute(Qt.ApplicationAttribute.AA_ShareOpenGLContexts)
 
     # VisPy + PySide6 application initialization
+    import vispy.app
     app = vispy.app.use_app("pyside6")
     app.create()
+    startup_profiler.mark('Application (Qt + VisPy backend)')
     window = PARDataVisualizer()
+    if args.profile_dir:
+        window.profiler.set_output_dir(args.profile_dir)
+    for name in args.profile_hot_path:
+        window.hot_path_actions[name].setChecked(True)
+    if args.profile:
+        window.profiler.profile_for(args.profile)
+    if args.live:
+        window.start_live_mode(args.live)
+    if args.trace:
+        window.trace_path = args.trace
+        window.trace_action.setChecked(True)
     window.show()
     sys.exit(app.run())
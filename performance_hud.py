@@ -0,0 +1,80 @@
+from PySide6.QtWidgets import QWidget, QFormLayout, QLabel
+from PySide6.QtCore import QTimer, Slot
+from collections import deque
+from buffer_pool import get_rss_bytes
+import numpy as np
+import time
+
+class PerformanceHud(QWidget):
+    """
+    Live performance readout: loader queue depth and busy workers, cache residency,
+    memory, per-view render times and the achieved playback rate. Only refreshed
+    (by polling) while it's visible.
+    """
+    # Window over which the playback rate is measured
+    fps_window_s = 3.0
+
+    def __init__(self, data_manager, get_slice_plots, refresh_ms=250):
+        """
+        `get_slice_plots` is called on every refresh for the SlicePlots to report on.
+        """
+        super().__init__()
+        self.data_manager = data_manager
+        self.get_slice_plots = get_slice_plots
+        self.render_times = deque()
+        self.data_manager.render_volume.connect(self.on_volume_rendered)
+
+        self.form_layout = QFormLayout(self)
+        self.loader_label = QLabel()
+        self.form_layout.addRow("Loader:", self.loader_label)
+        self.residency_label = QLabel()
+        self.form_layout.addRow("Residency:", self.residency_label)
+        self.memory_label = QLabel()
+        self.form_layout.addRow("Memory:", self.memory_label)
+        self.fps_label = QLabel()
+        self.form_layout.addRow("Playback:", self.fps_label)
+        self.render_label = QLabel()
+        self.form_layout.addRow("Render:", self.render_label)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(refresh_ms)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    @Slot(object)
+    def on_volume_rendered(self, r_volume):
+        self.render_times.append(time.perf_counter())
+
+    def get_playback_fps(self) -> float:
+        now = time.perf_counter()
+        while self.render_times and now - self.render_times[0] > self.fps_window_s:
+            self.render_times.popleft()
+        return len(self.render_times) / self.fps_window_s
+
+    @Slot()
+    def refresh(self):
+        loader = self.data_manager.loader
+        self.loader_label.setText(f'{loader.get_queue_depth()} queued, {loader.get_active_count()} / {loader.thread_pool.maxThreadCount()} workers busy')
+
+        files_state = getattr(self.data_manager, 'files_state', np.zeros(0))
+        counts = np.bincount(files_state.astype(np.int64), minlength=4) if len(files_state) else np.zeros(4, dtype=np.int64)
+        self.residency_label.setText(f'{counts[2]} loaded, {counts[1]} loading, {counts[3]} failed of {len(files_state)} '
+                                     f'({len(self.data_manager.loaded_volumes)} resident)')
+
+        pool = self.data_manager.buffer_pool
+        self.memory_label.setText(f'{self.data_manager.get_resident_bytes() / 2**20:.0f} MiB volumes, '
+                                  f'{pool.get_pooled_bytes() / 2**20:.0f} MiB pooled, {get_rss_bytes() / 2**20:.0f} MiB RSS')
+
+        self.fps_label.setText(f'{self.get_playback_fps():.1f} volumes/s')
+
+        render_times = [f'#{plot.id} {plot.slice_type.upper()} {plot.last_render_s * 1000:.1f} ms'
+                        for plot in self.get_slice_plots() if plot.last_render_s is not None]
+        self.render_label.setText('\n'.join(render_times) if render_times else '-')
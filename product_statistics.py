@@ -0,0 +1,159 @@
+import numpy as np
+
+# Fixed histogram bins for each product: (low, high, number of bins). Every histogram
+# of a product has the same bins, so histograms of volumes merge into histograms of
+# scans by adding counts. Values outside the range land in the first/last bin.
+HISTOGRAM_BINS = {
+    'Z': (-40.0, 90.0, 520),
+    'V': (-100.0, 100.0, 800),
+    'W': (0.0, 20.0, 400),
+    'D': (-10.0, 10.0, 400),
+    'P': (-180.0, 360.0, 1080),
+    'R': (0.0, 1.2, 480),
+}
+
+# Quantiles the automatic color limits span (the extreme tails are mostly clutter and noise)
+AUTO_CLIM_QUANTILES = (0.01, 0.99)
+# Products whose automatic color limits are centered on zero
+SYMMETRIC_PRODUCTS = {'V'}
+# Fewer samples than this and the automatic color limits aren't worth trusting
+MIN_AUTO_CLIM_SAMPLES = 1000
+
+class ProductHistogram(object):
+    """
+    A fixed-bin histogram of a product's (non-NaN) values, from which approximate
+    quantiles (to within a bin width) are read off without going back to the data.
+    """
+    def __init__(self, product, counts=None):
+        self.product = product
+        (self.low, self.high, self.num_bins) = HISTOGRAM_BINS[product]
+        self.counts = np.zeros(self.num_bins, dtype=np.int64) if counts is None else counts
+
+    def get_bin_edges(self) -> np.ndarray:
+        return np.linspace(self.low, self.high, self.num_bins + 1)
+
+    def get_count(self) -> int:
+        return int(self.counts.sum())
+
+    def add(self, values):
+        """Add an array of values (of any shape, NaNs are ignored)."""
+        values = np.asarray(values, dtype=np.float32).reshape(-1)
+        values = values[np.isfinite(values)]
+        bins = ((values - np.float32(self.low)) * np.float32(self.num_bins / (self.high - self.low))).astype(np.intp)
+        np.clip(bins, 0, self.num_bins - 1, out=bins)
+        self.counts += np.bincount(bins, minlength=self.num_bins)
+
+    def merge(self, other: 'ProductHistogram'):
+        """Add the counts of another histogram of the same product."""
+        self.counts += other.counts
+
+    def copy(self) -> 'ProductHistogram':
+        return ProductHistogram(self.product, self.counts.copy())
+
+    def get_quantiles(self, quantiles) -> np.ndarray | None:
+        """
+        Approximate quantiles, interpolating linearly within bins. None if the
+        histogram is empty.
+        """
+        cumulative = np.concatenate(([0], np.cumsum(self.counts)))
+        if cumulative[-1] == 0:
+            return None
+        return np.interp(np.asarray(quantiles, dtype=np.float64) * cumulative[-1], cumulative, self.get_bin_edges())
+
+class VolumeStatistics(object):
+    """
+    Histograms of every product of a single volume.
+    """
+    def __init__(self, filename, nyq_m_per_s, histograms: dict):
+        self.filename = filename
+        self.nyq_m_per_s = nyq_m_per_s
+        self.histograms = histograms
+
+def compute_volume_statistics(volume) -> VolumeStatistics:
+    """
+    Build the histograms of a volume's products, one tilt at a time (so compactly
+    stored products are only ever dequantized a tilt at a time).
+    """
+    histograms = {}
+    for (product, cube) in volume.products.items():
+        if product not in HISTOGRAM_BINS:
+            continue
+        histogram = ProductHistogram(product)
+        for el_idx in range(cube.shape[0]):
+            histogram.add(cube[el_idx])
+        histograms[product] = histogram
+    nyq_m_per_s = float(volume.nyq_m_per_s) if volume.nyq_m_per_s is not None else None
+    return VolumeStatistics(volume.filename, nyq_m_per_s, histograms)
+
+class ScanStatistics(object):
+    """
+    Histograms of every product over the volumes of a scan seen so far, merged as
+    volumes are loaded. A volume only counts once however many times it's loaded.
+    """
+    def __init__(self):
+        self.filenames = set()
+        self.histograms = {}
+        # Largest Nyquist velocity of the volumes seen so far
+        self.nyq_m_per_s = None
+
+    def get_num_volumes(self) -> int:
+        return len(self.filenames)
+
+    def add_volume(self, volume_statistics: VolumeStatistics) -> bool:
+        """Merge in a volume's statistics. Returns False if the volume was already counted."""
+        if volume_statistics.filename in self.filenames:
+            return False
+        self.filenames.add(volume_statistics.filename)
+        for (product, histogram) in volume_statistics.histograms.items():
+            if product in self.histograms:
+                self.histograms[product].merge(histogram)
+            else:
+                self.histograms[product] = histogram.copy()
+        if volume_statistics.nyq_m_per_s is not None:
+            self.nyq_m_per_s = max(self.nyq_m_per_s or 0.0, volume_statistics.nyq_m_per_s)
+        return True
+
+def round_clims(low, high) -> tuple[float, float]:
+    """Widen color limits out to round numbers (a tenth of the order of magnitude of their span)."""
+    magnitude = int(np.floor(np.log10(high - low))) - 1
+    step = 10.0 ** magnitude
+    digits = max(-magnitude, 0)
+    return (round(float(np.floor(low / step) * step), digits), round(float(np.ceil(high / step) * step), digits))
+
+def get_auto_clims(product, statistics) -> tuple[float, float] | None:
+    """
+    Data-driven color limits for a product from VolumeStatistics or ScanStatistics:
+    the Nyquist interval for velocity, otherwise the span of the bulk of the values.
+    None if there isn't enough data to go on.
+    """
+    if product == 'V' and statistics.nyq_m_per_s:
+        return (-statistics.nyq_m_per_s, statistics.nyq_m_per_s)
+
+    histogram = statistics.histograms.get(product)
+    if histogram is None or histogram.get_count() < MIN_AUTO_CLIM_SAMPLES:
+        return None
+    (low, high) = histogram.get_quantiles(AUTO_CLIM_QUANTILES)
+    if product in SYMMETRIC_PRODUCTS:
+        extent = max(abs(low), abs(high))
+        (low, high) = (-extent, extent)
+    if high <= low:
+        return None
+    return round_clims(low, high)
+
+# Benchmark code: python product_statistics.py <volume.mat> [<volume.mat> ...]
+if __name__ == "__main__":
+    import sys
+    import time
+    from radar_volume import RadarVolume
+    scan_statistics = ScanStatistics()
+    for file_path in sys.argv[1:]:
+        volume = RadarVolume.build_radar_volume_from_matlab_file(file_path)
+        start = time.perf_counter()
+        volume_statistics = compute_volume_statistics(volume)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        scan_statistics.add_volume(volume_statistics)
+        print(f'{file_path}: statistics in {elapsed_ms:.1f} ms')
+
+    for product in scan_statistics.histograms:
+        clims = get_auto_clims(product, scan_statistics)
+        print(f'{product}: {scan_statistics.histograms[product].get_count()} values, auto clims {clims}')
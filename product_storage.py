@@ -0,0 +1,96 @@
+from color_maps import PRODUCT_LIMITS
+import numpy as np
+
+# Storage modes for product cubes and the dtype each is stored as.
+STORAGE_DTYPES = {
+    'float32': np.float32,
+    'float16': np.float16,
+    'uint8': np.uint8,
+    'uint16': np.uint16,
+}
+
+def get_storage_mode(storage_modes, product):
+    """
+    Look up the storage mode for a product. The '*' key sets the mode for any
+    product which isn't listed explicitly. Defaults to full precision (float32).
+    """
+    if storage_modes is None:
+        return 'float32'
+    storage_mode = storage_modes.get(product, storage_modes.get('*', 'float32'))
+    # Quantizing needs display limits, fall back on float16 for products without them.
+    if storage_mode in ('uint8', 'uint16') and product not in PRODUCT_LIMITS:
+        return 'float16'
+    return storage_mode
+
+class CompactProduct(object):
+    """
+    A compactly stored (elevation x azimuth x range) product cube. Either float16, or
+    uint8/uint16 codes with a scale and offset derived from the product's display
+    limits (code 0 is reserved for NaN, values outside the limits are clipped).
+
+    Indexing it like an ndarray (e.g. `product[el_idx, :, :]`) dequantizes only the
+    requested slice into float32, so the full cube never has to be expanded just to
+    display a PPI/RHI or a tooltip.
+    """
+    def __init__(self, buffer: np.ndarray, product: str):
+        self.buffer = buffer
+        self.product = product
+        self.scale = None
+        self.offset = None
+
+        if np.issubdtype(buffer.dtype, np.integer):
+            (lo, hi) = PRODUCT_LIMITS[product]
+            max_code = np.iinfo(buffer.dtype).max
+            # Codes [1, max_code] span [lo, hi]
+            self.scale = (hi - lo) / (max_code - 1)
+            self.offset = lo - self.scale
+
+    @property
+    def shape(self):
+        return self.buffer.shape
+
+    @property
+    def ndim(self):
+        return self.buffer.ndim
+
+    @property
+    def dtype(self):
+        # The dtype slices are dequantized into.
+        return np.dtype(np.float32)
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes
+
+    def is_quantized(self):
+        return self.scale is not None
+
+    def store(self, key, values: np.ndarray):
+        """Quantize (if needed) and store full-precision values into part of the cube."""
+        if not self.is_quantized():
+            self.buffer[key] = values
+            return
+        max_code = np.iinfo(self.buffer.dtype).max
+        codes = np.rint((values - self.offset) / self.scale)
+        np.clip(codes, 1, max_code, out=codes)
+        codes[np.isnan(values)] = 0
+        self.buffer[key] = codes
+
+    def dequantize(self, codes: np.ndarray) -> np.ndarray:
+        if not self.is_quantized():
+            return codes.astype(np.float32)
+        values = codes.astype(np.float32) * np.float32(self.scale) + np.float32(self.offset)
+        return np.where(codes == 0, np.float32(np.nan), values)
+
+    def __getitem__(self, key):
+        codes = self.buffer[key]
+        if np.isscalar(codes) or np.ndim(codes) == 0:
+            return self.dequantize(np.asarray(codes))[()]
+        return self.dequantize(codes)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.dequantize(self.buffer)
+        return values if dtype is None else values.astype(dtype)
+
+    def __len__(self):
+        return len(self.buffer)
@@ -0,0 +1,234 @@
+from PySide6.QtCore import QObject, Signal, QTimer
+from app_config import get_app_dir, get_setting
+from datetime import datetime
+from pathlib import Path
+import functools
+import importlib
+import threading
+import cProfile
+import pstats
+
+# Hot paths which can be profiled on their own: name -> (module, class, method).
+HOT_PATHS = {
+    'build_radar_volume_from_matlab_file': ('radar_volume', 'RadarVolume', 'build_radar_volume_from_matlab_file'),
+    'SlicePlot.update_plot': ('slice_plot', 'SlicePlot', 'update_plot'),
+    'CircleScene.mouseMoveEvent': ('volume_slice_selector', 'CircleScene', 'mouseMoveEvent'),
+}
+
+def get_default_profile_dir() -> Path:
+    """
+    Folder profiles are written to, from the "profile_dir" setting or the application folder.
+    """
+    profile_dir = get_setting('profile_dir')
+    return Path(profile_dir) if profile_dir else get_app_dir() / 'profiles'
+
+def save_profile_stats(stats: pstats.Stats, out_dir: Path, name: str) -> list:
+    """
+    Write profile statistics to `<out_dir>/<timestamp>_<name>.prof` along with a
+    flamegraph (.svg) rendered by flameprof. Returns the paths written.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base_name = f'{datetime.now().strftime("%Y%m%d_%H%M%S")}_{name}'
+
+    prof_path = out_dir / f'{base_name}.prof'
+    stats.dump_stats(prof_path)
+    paths = [prof_path]
+
+    try:
+        import flameprof
+        svg_path = out_dir / f'{base_name}.svg'
+        with svg_path.open('w') as svg_file:
+            flameprof.render(stats.stats, svg_file)
+        paths.append(svg_path)
+    except ImportError:
+        print('Profiling: flameprof is not installed, skipping the flamegraph.')
+    except Exception as e:
+        print(f'Profiling: failed to render the flamegraph for "{name}": {e}')
+    return paths
+
+class Profiler(QObject):
+    """
+    Built-in cProfile hooks. Two kinds of profiles can be collected while the
+    application runs:
+
+    - A session profile of the GUI thread between start_session() and stop_session()
+      (or for a fixed number of seconds with profile_for()).
+    - Hot path profiles: while a hot path (see HOT_PATHS) is enabled, every call to it
+      is profiled on whatever thread it runs on (volumes are built on the loader's
+      worker threads) and the calls are merged into a single profile for that path.
+
+    cProfile only allows one active profiler per thread (and from Python 3.12, where
+    it's built on sys.monitoring, one for the whole interpreter), so calls made while
+    this thread is already being profiled (e.g. update_plot() called from a profiled
+    mouseMoveEvent, or anything on the GUI thread during a session) are only counted
+    in the outer profile, and calls which can't get a profiler of their own (e.g. a
+    hot path running on two loader threads at once on 3.12+) simply run unprofiled.
+    """
+    status_updated = Signal(str)
+    profile_saved = Signal(list)
+    session_state_changed = Signal(bool)
+
+    def __init__(self, out_dir=None):
+        super().__init__()
+        self.out_dir = Path(out_dir) if out_dir else get_default_profile_dir()
+
+        self.session = None
+        self.session_timer = QTimer(self)
+        self.session_timer.setSingleShot(True)
+        self.session_timer.timeout.connect(self.stop_session)
+
+        # Hot path name -> original function, and name -> merged pstats.Stats
+        self.originals = {}
+        self.hot_path_stats = {}
+        self.lock = threading.Lock()
+        self.thread_state = threading.local()
+
+    def set_output_dir(self, out_dir):
+        self.out_dir = Path(out_dir)
+
+    def is_session_active(self) -> bool:
+        return self.session is not None
+
+    def _is_thread_profiled(self) -> bool:
+        return getattr(self.thread_state, 'profiled', False)
+
+    def start_session(self):
+        if self.session is not None or self._is_thread_profiled():
+            return
+        session = cProfile.Profile()
+        try:
+            session.enable()
+        except ValueError as e:
+            # Another profiler is active (anywhere in the interpreter on Python 3.12+)
+            self.status_updated.emit(f'Profiling not started: {e}')
+            self.session_state_changed.emit(False)
+            return
+        self.session = session
+        self.thread_state.profiled = True
+        self.status_updated.emit('Profiling started...')
+        self.session_state_changed.emit(True)
+
+    def profile_for(self, seconds: float):
+        """Profile the GUI thread for the next `seconds` seconds, then save the profile."""
+        self.start_session()
+        if self.session is not None:
+            self.session_timer.start(int(seconds * 1000))
+            self.status_updated.emit(f'Profiling the next {seconds:g} seconds...')
+
+    def stop_session(self):
+        """Stop the session profile and save it. Returns the paths written."""
+        if self.session is None:
+            return []
+        self.session_timer.stop()
+        self.session.disable()
+        self.thread_state.profiled = False
+        session = self.session
+        self.session = None
+        self.session_state_changed.emit(False)
+        return self._save(pstats.Stats(session), 'session')
+
+    def is_hot_path_enabled(self, name) -> bool:
+        return name in self.originals
+
+    def enable_hot_path(self, name):
+        """Start profiling every call to a hot path."""
+        if name in self.originals:
+            return
+        (module_name, class_name, attr) = HOT_PATHS[name]
+        cls = getattr(importlib.import_module(module_name), class_name)
+        raw = cls.__dict__[attr]
+        self.originals[name] = (cls, attr, raw)
+
+        is_static = isinstance(raw, staticmethod)
+        wrapper = self._wrap(name, raw.__func__ if is_static else raw)
+        setattr(cls, attr, staticmethod(wrapper) if is_static else wrapper)
+        self.status_updated.emit(f'Profiling calls to {name}...')
+
+    def disable_hot_path(self, name, save=True):
+        """Stop profiling a hot path and (optionally) save what was collected. Returns the paths written."""
+        if name not in self.originals:
+            return []
+        (cls, attr, raw) = self.originals.pop(name)
+        setattr(cls, attr, raw)
+        if save:
+            return self.save_hot_path(name)
+        return []
+
+    def save_hot_path(self, name):
+        with self.lock:
+            stats = self.hot_path_stats.pop(name, None)
+        if stats is None:
+            self.status_updated.emit(f'No calls to {name} were profiled.')
+            return []
+        return self._save(stats, name.replace('.', '_'))
+
+    def save_hot_paths(self):
+        paths = []
+        for name in list(self.hot_path_stats):
+            paths += self.save_hot_path(name)
+        return paths
+
+    def stop_all(self, save=True):
+        """Stop every profile (e.g. when the application exits)."""
+        if self.session is not None:
+            if save:
+                self.stop_session()
+            else:
+                self.session.disable()
+                self.session = None
+        for name in list(self.originals):
+            self.disable_hot_path(name, save=save)
+
+    def _wrap(self, name, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self._is_thread_profiled():
+                return func(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is active (e.g. the same hot path on another thread, on Python 3.12+)
+                return func(*args, **kwargs)
+            self.thread_state.profiled = True
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.thread_state.profiled = False
+                self._merge(name, profile)
+        return wrapper
+
+    def _merge(self, name, profile):
+        try:
+            with self.lock:
+                if name in self.hot_path_stats:
+                    self.hot_path_stats[name].add(profile)
+                else:
+                    self.hot_path_stats[name] = pstats.Stats(profile)
+        except (TypeError, ValueError):
+            # Nothing was recorded (e.g. the call raised before any function was entered)
+            pass
+
+    def _save(self, stats, name):
+        try:
+            paths = save_profile_stats(stats, self.out_dir, name)
+        except OSError as e:
+            self.status_updated.emit(f'Failed to save the "{name}" profile: {e}')
+            return []
+        print('Profiling: wrote ' + ', '.join(str(path) for path in paths))
+        self.status_updated.emit(f'Saved profile to {paths[0]}')
+        self.profile_saved.emit(paths)
+        return paths
+
+# Profile the loader on its own: python profiling.py <file.mat> [<file.mat> ...]
+if __name__ == "__main__":
+    import sys
+    from radar_volume import RadarVolume
+    profiler = Profiler(out_dir=Path.cwd() / 'profiles')
+    profiler.enable_hot_path('build_radar_volume_from_matlab_file')
+    for file_path in sys.argv[1:]:
+        RadarVolume.build_radar_volume_from_matlab_file(file_path)
+    profiler.disable_hot_path('build_radar_volume_from_matlab_file')
@@ -0,0 +1,318 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from product_storage import CompactProduct
+from radar_volume import RadarVolume
+from tracing import tracer
+import numpy as np
+import threading
+import copy
+import time
+
+class QCStage(object):
+    """
+    A step of the QC pipeline. Stages work on one tilt at a time: `apply` gets every
+    product of the tilt as (azimuth x range) float32 planes (copies, so they can be
+    modified in place) and the volume they come from (for its metadata).
+
+    PARAMETERS maps each parameter to (label, default, minimum, maximum). Parameters
+    with a bool default are switches, int defaults are integers.
+    """
+    name = None
+    label = None
+    PARAMETERS = {}
+
+    def __init__(self, enabled=False, **params):
+        self.enabled = enabled
+        self.params = {name: default for (name, (_, default, _, _)) in self.PARAMETERS.items()}
+        for (name, value) in params.items():
+            if name in self.params:
+                self.params[name] = type(self.params[name])(value)
+
+    def get_key(self) -> tuple:
+        """Identifies what the stage does (its parameters), for caching its results."""
+        return (self.name,) + tuple(sorted(self.params.items()))
+
+    def apply(self, planes: dict, volume: RadarVolume):
+        raise NotImplementedError
+
+class ThresholdMaskStage(QCStage):
+    """
+    Masks (sets to NaN) every product at gates with a low correlation coefficient
+    (non-meteorological echoes such as clutter and biological targets) or a low
+    signal to noise ratio. The files don't carry SNR, so it's estimated from the
+    reflectivity and the range, given the reflectivity of the noise floor at 1 km.
+    """
+    name = 'threshold'
+    label = 'ρHV / SNR threshold mask'
+    PARAMETERS = {
+        'min_rhohv': ('Minimum ρHV', 0.8, 0.0, 1.0),
+        'min_snr_db': ('Minimum SNR (dB)', 3.0, -20.0, 40.0),
+        'noise_dbz_at_1km': ('Noise floor at 1 km (dBZ)', -20.0, -60.0, 20.0),
+    }
+
+    def apply(self, planes, volume):
+        with np.errstate(invalid='ignore'):
+            masked = np.zeros(next(iter(planes.values())).shape, dtype=bool)
+            if 'R' in planes:
+                masked |= planes['R'] < self.params['min_rhohv']
+            if 'Z' in planes:
+                ranges_km = np.maximum(np.asarray(volume.ranges_km, dtype=np.float32), np.float32(1e-3))
+                noise_dbz = np.float32(self.params['noise_dbz_at_1km']) + np.float32(20.0) * np.log10(ranges_km)
+                masked |= planes['Z'] - noise_dbz[None, :] < self.params['min_snr_db']
+        for plane in planes.values():
+            plane[masked] = np.nan
+
+class DespeckleStage(QCStage):
+    """
+    Removes isolated gates (with fewer than `min_neighbors` gates with data in the
+    window around them) from every product, and optionally replaces the remaining
+    gates of the smoothable products by the median of their window. Velocity and
+    differential phase wrap around, so they're never median filtered.
+    """
+    name = 'despeckle'
+    label = 'Median despeckle'
+    PARAMETERS = {
+        # Windows are (2 * half_window + 1) gates square, so they're centered on their gate
+        'half_window': ('Window radius (gates)', 1, 1, 4),
+        'min_neighbors': ('Minimum neighbors', 2, 0, 80),
+        'median_filter': ('Median filter', True, None, None),
+    }
+    SMOOTHED_PRODUCTS = ('Z', 'W', 'D', 'R')
+
+    def apply(self, planes, volume):
+        half = self.params['half_window']
+        for (product, plane) in planes.items():
+            # (azimuth x range x window²) neighborhoods, NaN beyond the edges of the tilt
+            padded = np.pad(plane, half, constant_values=np.nan)
+            windows = np.lib.stride_tricks.sliding_window_view(padded, (2 * half + 1, 2 * half + 1)).reshape(plane.shape + (-1,))
+            valid = ~np.isnan(plane)
+            counts = np.count_nonzero(~np.isnan(windows), axis=-1)
+            if self.params['median_filter'] and product in self.SMOOTHED_PRODUCTS:
+                # NaNs sort last, so the median of the n values with data is at (n - 1) // 2 and n // 2
+                ordered = np.sort(windows, axis=-1)
+                low = np.take_along_axis(ordered, np.maximum(counts - 1, 0)[..., None] // 2, axis=-1)[..., 0]
+                high = np.take_along_axis(ordered, (counts // 2)[..., None], axis=-1)[..., 0]
+                plane[valid] = (0.5 * (low + high))[valid]
+            # Don't count the gate itself
+            plane[valid & (counts - 1 < self.params['min_neighbors'])] = np.nan
+
+class DealiasStage(QCStage):
+    """
+    Unfolds aliased radial velocities (beyond the Nyquist velocity `nyq_m_per_s`)
+    assuming the wind field is continuous. Gates are never unwrapped against each
+    other, where a single noisy gate would shift everything after it. Instead each
+    gate is unfolded against a smooth reference: the circular mean of the gates
+    around it along the radial (which aliasing doesn't affect), unwrapped along the
+    radial across coherent stretches, aligned with the previous radial by whole
+    Nyquist intervals and anchored on the gates nearest the radar (where winds are
+    weakest). The reference never strays more than `max_folds` Nyquist intervals
+    from zero. Gates in incoherent (noisy) stretches are left as they are, gates
+    which don't agree with their reference are masked.
+    """
+    name = 'dealias'
+    label = 'Velocity dealiasing'
+    PARAMETERS = {
+        'half_window': ('Window radius (gates)', 4, 1, 15),
+        'min_coherence': ('Minimum coherence', 0.5, 0.0, 1.0),
+        'max_deviation': ('Maximum deviation (Nyquist)', 0.5, 0.05, 1.0),
+        'max_folds': ('Maximum folds', 2, 1, 5),
+        'azimuth_continuity': ('Align radials', True, None, None),
+    }
+
+    def get_reference(self, v, nyq) -> tuple[np.ndarray, np.ndarray]:
+        """
+        The (folded) running circular mean of each radial and whether it's coherent
+        (enough gates with data, pointing the same way).
+        """
+        half = self.params['half_window']
+        phase = v * np.float32(np.pi / nyq)
+        valid = ~np.isnan(v)
+        # Sums over the window along range, from cumulative sums (padded so every window is complete)
+        sums = []
+        for values in (np.where(valid, np.cos(phase), 0.0), np.where(valid, np.sin(phase), 0.0), valid.astype(np.float32)):
+            cumulative = np.cumsum(np.pad(values, ((0, 0), (half + 1, half))), axis=1)
+            sums.append(cumulative[:, 2 * half + 1:] - cumulative[:, :-2 * half - 1])
+        (cos_sum, sin_sum, counts) = sums
+        with np.errstate(invalid='ignore', divide='ignore'):
+            resultant = np.hypot(cos_sum, sin_sum) / counts
+        coherent = (counts >= 3) & (resultant >= self.params['min_coherence'])
+        return (np.arctan2(sin_sum, cos_sum) * np.float32(nyq / np.pi), coherent)
+
+    def apply(self, planes, volume):
+        if 'V' not in planes or not volume.nyq_m_per_s:
+            return
+        v = planes['V']
+        nyq = float(volume.nyq_m_per_s)
+        period = np.float32(2.0 * nyq)
+        (reference, coherent) = self.get_reference(v, nyq)
+        if not coherent.any():
+            return
+
+        # Unwrap the (smooth) reference along each radial, bridging incoherent stretches with the last coherent gate
+        (num_azimuths, num_ranges) = v.shape
+        last_coherent = np.maximum.accumulate(np.where(coherent, np.arange(num_ranges), 0), axis=1)
+        filled = np.where(coherent[np.arange(num_azimuths)[:, None], last_coherent], np.take_along_axis(reference, last_coherent, axis=1), 0.0)
+        reference = np.unwrap(filled, period=period, axis=1)
+
+        if self.params['azimuth_continuity']:
+            for az_idx in range(1, num_azimuths):
+                both = coherent[az_idx] & coherent[az_idx - 1]
+                if both.any():
+                    offset = np.median(reference[az_idx, both] - reference[az_idx - 1, both])
+                    reference[az_idx] -= np.round(offset / period) * period
+
+        has_data = coherent.any(axis=1)
+        nearest = reference[np.flatnonzero(has_data), np.argmax(coherent, axis=1)[has_data]]
+        reference -= np.round(np.median(nearest) / period) * period
+        max_folds = self.params['max_folds']
+        reference = np.clip(reference, -max_folds * period, max_folds * period)
+
+        # Unfold every gate with a coherent reference to within half a Nyquist interval of it
+        with np.errstate(invalid='ignore'):
+            unfolded = v - np.round((v - reference) / period) * period
+            inconsistent = np.abs(unfolded - reference) > self.params['max_deviation'] * nyq
+        v[coherent] = np.where(inconsistent, np.float32(np.nan), unfolded)[coherent]
+
+# Every stage, in the order they run in
+QC_STAGES = [ThresholdMaskStage, DespeckleStage, DealiasStage]
+
+class QCPipeline(object):
+    """
+    A configured chain of QC stages (see QC_STAGES), run in order on every tilt of a
+    volume. Processed volumes are copies of the loaded volumes with new cubes for
+    the products, so the loaded (raw) volumes can be processed again with a
+    different configuration.
+    """
+    def __init__(self, stages=None):
+        self.stages = stages if stages is not None else [stage_class() for stage_class in QC_STAGES]
+
+    def get_enabled_stages(self) -> list[QCStage]:
+        return [stage for stage in self.stages if stage.enabled]
+
+    def is_enabled(self) -> bool:
+        return bool(self.get_enabled_stages())
+
+    def get_key(self) -> tuple:
+        """
+        Identifies the results of the pipeline: the enabled stages and their
+        parameters. Changing a disabled stage doesn't change the key.
+        """
+        return tuple(stage.get_key() for stage in self.get_enabled_stages())
+
+    def copy(self) -> 'QCPipeline':
+        return QCPipeline.from_dict(self.to_dict())
+
+    def to_dict(self) -> dict:
+        """The configuration, as stored in the application settings."""
+        return {stage.name: dict(stage.params, enabled=stage.enabled) for stage in self.stages}
+
+    @staticmethod
+    def from_dict(config) -> 'QCPipeline':
+        stages = []
+        for stage_class in QC_STAGES:
+            params = dict((config or {}).get(stage_class.name, {}))
+            stages.append(stage_class(bool(params.pop('enabled', False)), **params))
+        return QCPipeline(stages)
+
+    def process(self, volume: RadarVolume) -> RadarVolume:
+        """
+        Run the enabled stages on a volume, one tilt at a time. Returns a processed
+        copy of the volume, with the time each stage took (over all the tilts) in
+        `qc_timings`.
+        """
+        stages = self.get_enabled_stages()
+        timings = {stage.name: 0.0 for stage in stages}
+        products = {}
+        for (product, cube) in volume.products.items():
+            # Compactly stored products stay compact (float16, the QC'd values may fall outside quantization limits)
+            products[product] = CompactProduct(np.empty(cube.shape, dtype=np.float16), product) if isinstance(cube, CompactProduct) else np.empty(cube.shape, dtype=np.float32)
+
+        num_elevations = len(volume.elevations_rad)
+        for el_idx in range(num_elevations):
+            planes = {product: np.array(cube[el_idx], dtype=np.float32) for (product, cube) in volume.products.items()}
+            for stage in stages:
+                start = time.perf_counter()
+                with tracer.span(stage.name, 'qc', el_idx=el_idx):
+                    stage.apply(planes, volume)
+                timings[stage.name] += time.perf_counter() - start
+            for (product, plane) in planes.items():
+                if isinstance(products[product], CompactProduct):
+                    products[product].store(el_idx, plane)
+                else:
+                    products[product][el_idx] = plane
+
+        processed = copy.copy(volume)
+        processed.products = products
+        processed.derived_products = {}
+        processed.raw_volume = volume
+        processed.qc_key = self.get_key()
+        processed.qc_timings = timings
+        return processed
+
+class QCTask(QRunnable):
+    """
+    QRunnable task running the QC pipeline on a volume.
+    """
+    def __init__(self, engine, volume, pipeline):
+        super().__init__()
+        self.engine = engine
+        self.volume = volume
+        self.pipeline = pipeline
+
+    def run(self):
+        processed = None
+        with tracer.span('qc', 'qc', file=self.volume.filename) as span:
+            try:
+                processed = self.pipeline.process(self.volume)
+            except Exception as e:
+                print(f'QC failed for "{self.volume.filename}": {e}')
+                span.set(error=type(e).__name__)
+        self.engine._on_task_finished(self.volume, self.pipeline, processed)
+
+class QCEngine(QObject):
+    """
+    Runs the QC pipeline on loaded volumes on a worker pool. A volume is processed
+    at most once (at a time) per pipeline configuration.
+    """
+    # Emitted (from the worker thread) with the loaded volume and its processed copy (None if QC failed)
+    volume_processed = Signal(object, object)
+
+    def __init__(self, max_workers=2):
+        super().__init__()
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max_workers)
+        self.lock = threading.Lock()
+        # (id(volume), pipeline key) of the volumes queued or running
+        self.pending = set()
+
+    def request(self, volume: RadarVolume, pipeline: QCPipeline, priority=0):
+        """
+        Process a volume with a pipeline. `volume_processed` is emitted once it's done.
+        Higher priority requests (e.g. the volume on display) are started first.
+        """
+        key = (id(volume), pipeline.get_key())
+        with self.lock:
+            if key in self.pending:
+                return
+            self.pending.add(key)
+        # The pipeline is copied so it can't change under the worker
+        self.thread_pool.start(QCTask(self, volume, pipeline.copy()), priority)
+
+    def _on_task_finished(self, volume, pipeline, processed):
+        with self.lock:
+            self.pending.discard((id(volume), pipeline.get_key()))
+        self.volume_processed.emit(volume, processed)
+
+# Benchmark code: python qc_pipeline.py <volume.mat>
+if __name__ == "__main__":
+    import sys
+    volume = RadarVolume.build_radar_volume_from_matlab_file(sys.argv[1], storage_modes={'*': 'float16'})
+    pipeline = QCPipeline([stage_class(True) for stage_class in QC_STAGES])
+    start = time.perf_counter()
+    processed = pipeline.process(volume)
+    print(f'QC in {(time.perf_counter() - start) * 1000:.1f} ms, nyquist {volume.nyq_m_per_s} m/s')
+    for (name, seconds) in processed.qc_timings.items():
+        print(f'  {name}: {seconds * 1000:.1f} ms')
+    for product in volume.products:
+        (raw, qc) = (np.asarray(volume.products[product]), np.asarray(processed.products[product]))
+        print(f'  {product}: {np.count_nonzero(~np.isnan(raw))} -> {np.count_nonzero(~np.isnan(qc))} gates with data, '
+              f'range {np.nanmin(raw):.2f} .. {np.nanmax(raw):.2f} -> {np.nanmin(qc):.2f} .. {np.nanmax(qc):.2f}')
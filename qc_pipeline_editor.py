@@ -0,0 +1,76 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QFormLayout, QGroupBox, QLabel, QCheckBox, QSpinBox, QDoubleSpinBox
+from PySide6.QtCore import QTimer, Signal, Slot
+from qc_pipeline import QCPipeline
+
+class QCPipelineEditor(QWidget):
+    """
+    Turns the stages of the QC pipeline on and off and edits their parameters, and
+    shows how long each stage took on the volume on display.
+    """
+    # Emitted with a new QCPipeline once the edits have settled
+    pipeline_changed = Signal(object)
+
+    # Edits are applied once nothing has changed for this long (so stepping through values doesn't reprocess every volume each time)
+    apply_delay_ms = 300
+
+    def __init__(self, pipeline: QCPipeline):
+        super().__init__()
+        self.pipeline = pipeline.copy()
+        self.layout = QVBoxLayout(self)
+        self.apply_timer = QTimer(self)
+        self.apply_timer.setSingleShot(True)
+        self.apply_timer.setInterval(self.apply_delay_ms)
+        self.apply_timer.timeout.connect(lambda: self.pipeline_changed.emit(self.pipeline.copy()))
+
+        # Stage name -> time label
+        self.timing_labels = {}
+        for stage in self.pipeline.stages:
+            group_box = QGroupBox(stage.label)
+            group_box.setCheckable(True)
+            group_box.setChecked(stage.enabled)
+            group_box.toggled.connect(lambda checked, stage=stage: self.on_stage_edited(stage, 'enabled', checked))
+            form_layout = QFormLayout(group_box)
+            for (name, (label, default, minimum, maximum)) in stage.PARAMETERS.items():
+                form_layout.addRow(label, self.create_parameter_widget(stage, name, default, minimum, maximum))
+            self.timing_labels[stage.name] = QLabel('-')
+            form_layout.addRow("Time:", self.timing_labels[stage.name])
+            self.layout.addWidget(group_box)
+
+        self.total_label = QLabel()
+        self.layout.addWidget(self.total_label)
+        self.layout.addStretch()
+        self.on_volume_rendered(None)
+
+    def create_parameter_widget(self, stage, name, default, minimum, maximum) -> QWidget:
+        value = stage.params[name]
+        if isinstance(default, bool):
+            widget = QCheckBox()
+            widget.setChecked(value)
+            widget.toggled.connect(lambda checked: self.on_stage_edited(stage, name, checked))
+        elif isinstance(default, int):
+            widget = QSpinBox()
+            widget.setRange(minimum, maximum)
+            widget.setValue(value)
+            widget.valueChanged.connect(lambda value: self.on_stage_edited(stage, name, value))
+        else:
+            widget = QDoubleSpinBox()
+            widget.setRange(minimum, maximum)
+            widget.setDecimals(2)
+            widget.setSingleStep(0.01 if maximum - minimum <= 1.0 else 0.5)
+            widget.setValue(value)
+            widget.valueChanged.connect(lambda value: self.on_stage_edited(stage, name, value))
+        return widget
+
+    def on_stage_edited(self, stage, name, value):
+        if name == 'enabled':
+            stage.enabled = value
+        else:
+            stage.params[name] = value
+        self.apply_timer.start()
+
+    @Slot(object)
+    def on_volume_rendered(self, r_volume):
+        timings = r_volume.qc_timings if r_volume is not None and r_volume.qc_timings is not None else {}
+        for (name, label) in self.timing_labels.items():
+            label.setText(f'{timings[name] * 1000:.1f} ms' if name in timings else '-')
+        self.total_label.setText(f'QC of the volume on display: {sum(timings.values()) * 1000:.1f} ms' if timings else 'QC of the volume on display: off')
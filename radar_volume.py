@@ -1,6 +1,13 @@
-import scipy.io as scio
 import numpy as np
 from datetime import datetime
+from product_storage import CompactProduct, STORAGE_DTYPES, get_storage_mode
+from scan_geometry import ScanGeometry, get_scan_geometry
+
+class VolumeLoadError(Exception):
+    """
+    Raised when a file can be read but doesn't contain a usable PAR volume.
+    """
+    pass
 
 class RadarVolume(object):
     """
@@ -9,7 +16,7 @@ class RadarVolume(object):
     def __init__(self, filename, radar, lat, lon, elev_m, height_m, lambda_m, prf_hz, nyq_m_per_s,
                  datestr, time, vcp, products, sclice_type, start_range_km, ranges_km,
                  doppler_resolution_km, azimuths_rad, azimuth_swath_rad, elevations_rad, 
-                 elevation_swath_rad):
+                 elevation_swath_rad, geometry: ScanGeometry = None):
         self.filename = filename
         self.radar = radar
         self.lat = lat
@@ -26,28 +33,147 @@ class RadarVolume(object):
         self.products = products
         self.sclice_type = sclice_type
         self.start_range_km = start_range_km
-        self.ranges_km = ranges_km
         self.doppler_resolution_km = doppler_resolution_km
-        self.azimuths_rad = azimuths_rad
         self.azimuth_swath_rad = azimuth_swath_rad
-        self.elevations_rad = elevations_rad
         self.elevation_swath_rad  = elevation_swath_rad
+        # Axes (read-only arrays) shared with every other volume with the same scan geometry
+        self.geometry = geometry if geometry is not None else get_scan_geometry(
+            azimuths_rad, elevations_rad, ranges_km, start_range_km, doppler_resolution_km)
+        self.ranges_km = self.geometry.ranges_km
+        self.azimuths_rad = self.geometry.azimuths_rad
+        self.elevations_rad = self.geometry.elevations_rad
+        # Derived products (e.g. 'CREF', 'ET', 'VIL') computed so far, as (azimuth x range) arrays
+        self.derived_products = {}
+        # Histograms of the products (see product_statistics.py), computed by the loader
+        self.statistics = None
+        # Set on copies processed by the QC pipeline (see qc_pipeline.py): the loaded volume they
+        # were processed from, the pipeline's key and the time each stage took
+        self.raw_volume = None
+        self.qc_key = None
+        self.qc_timings = None
+
+    def get_nbytes(self):
+        """Memory used by all the product cubes (and derived products) of this volume."""
+        return sum(product.nbytes for product in self.products.values()) + sum(product.nbytes for product in list(self.derived_products.values()))
     
     @staticmethod
-    def build_radar_volume_from_matlab_file(file_path):
+    def read_sweep_from_matlab_file(file_path, product='Z', el_idx=0, with_time=False):
+        """
+        Static method for reading a single sweep (tilt) of a single product from a MATLAB
+        data file. Returns an (azimuth x range) float32 ndarray, or None if the file or
+        product is unavailable. The whole file still has to be parsed, but none of the
+        other products or tilts are copied into 3-D blocks.
+
+        With `with_time`, returns (sweep, time) instead, the time being the sweep's
+        MATLAB datenum (or None if it doesn't have one).
+        """
+        import scipy.io as scio
+        try:
+            data = scio.loadmat(file_path, squeeze_me=True)
+            if 'volume' not in data:
+                return None
+
+            sweep = data['volume'][el_idx]
+            product_types = [entry['type'] for entry in sweep['prod']]
+            if product not in product_types:
+                return None
+
+            p_data = sweep['prod'][product_types.index(product)]['data']
+            if product == 'R':
+                p_data = np.abs(p_data)
+            if with_time:
+                return (p_data.astype(np.float32).T, float(sweep['time']) if 'time' in sweep.dtype.names else None)
+            return p_data.astype(np.float32).T
+
+        except:
+            print(f'Failed to read sweep {el_idx} ({product}) from .mat file: "{file_path}"')
+            return None
+
+    @staticmethod
+    def read_gate_from_matlab_file(file_path, el_idx, az_idx, gate_idx):
+        """
+        Static method for reading the value of every product at a single gate from a
+        MATLAB data file, along with the volume's time. Returns (time, {product: value}),
+        or None if the file could not be read or doesn't have the gate. Nothing else is
+        copied out of the parsed file.
+        """
+        import scipy.io as scio
+        try:
+            data = scio.loadmat(file_path, squeeze_me=True)
+            if 'volume' not in data:
+                return None
+
+            sweep = data['volume'][el_idx]
+            time = float(sweep['time']) if 'time' in sweep.dtype.names else None
+            values = {}
+            for entry in sweep['prod']:
+                # Stored as (range x azimuth)
+                value = float(entry['data'][gate_idx, az_idx])
+                values[str(entry['type'])] = abs(value) if entry['type'] == 'R' else value
+            return (time, values)
+
+        except:
+            print(f'Failed to read gate ({el_idx}, {az_idx}, {gate_idx}) from .mat file: "{file_path}"')
+            return None
+
+    @staticmethod
+    def read_metadata_from_matlab_file(file_path):
+        """
+        Static method for reading only the metadata of a volume from a MATLAB data file
+        (time, VCP, angles, range gates and products present). None of the product data
+        is copied. Returns a dictionary, or None if the file could not be read.
+        """
+        import scipy.io as scio
+        try:
+            data = scio.loadmat(file_path, squeeze_me=True)
+            if 'volume' not in data:
+                return None
+
+            volume = data['volume']
+            first_slice = volume[0]
+            start_range_km = float(first_slice['start_range_km'])
+            doppler_resolution_km = first_slice['prod'][0]['dr'] / 1000.0
+            num_ranges = first_slice['prod'][0]['data'].shape[0]
+
+            return {
+                'time': float(first_slice['time']) if 'time' in first_slice.dtype.names else None,
+                'vcp': int(first_slice['vcp']) if 'vcp' in first_slice.dtype.names else None,
+                'azimuths_rad': [float(az * np.pi / 180.0) for az in first_slice['az_deg']],
+                'elevations_rad': [float(entry['sweep_el_deg'] * np.pi / 180.0) for entry in volume],
+                'ranges_km': [float(start_range_km + (doppler_resolution_km * i)) for i in range(num_ranges)],
+                'products': [str(entry['type']) for entry in first_slice['prod']],
+            }
+
+        except:
+            print(f'Failed to read metadata from .mat file: "{file_path}"')
+            return None
+
+    @staticmethod
+    def build_radar_volume_from_matlab_file(file_path, buffer_pool=None, storage_modes=None):
         """
         Static method for reading in a MATLAB data file containing a volume of data
         from a PAR scan. Using the static method convention to indicate that construction
         of one of these objects is non-trivial and may take some time.
+
+        If a BufferPool is given, the product cubes are filled in place in recycled buffers
+        instead of being freshly allocated.
+
+        `storage_modes` optionally maps products to a compact storage mode ('float16',
+        'uint8' or 'uint16', see product_storage.py). Products are stored as float32 otherwise.
+
+        Raises an exception (VolumeLoadError, or whatever the failure was while parsing
+        the file) if the volume can't be loaded.
         """
+        # scipy is slow to import, so it's only imported once a file is actually read.
+        import scipy.io as scio
+        products = {}
         try:
             # Load the data.
             #   squeeze_me=True, collapse unit dimensions (no 1x1 ndarrays).    
             data = scio.loadmat(file_path, squeeze_me=True)
         
             if 'volume' not in data:
-                print("No 'volume' key found in the .mat file. Please check the data structure.")
-                return None
+                raise VolumeLoadError("No 'volume' key found in the .mat file. Please check the data structure.")
             
             # TODO: After this point, it is assumed the data is well-formed. This is probably a bad assumption.
 
@@ -56,10 +182,10 @@ class RadarVolume(object):
             first_slice = volume[0]
 
             # Extract metadata.
-            azimuths_rad = [(az * np.pi / 180.0) for az in first_slice['az_deg']]
+            azimuths_rad = np.asarray(first_slice['az_deg'], dtype=np.float64) * np.pi / 180.0
             azimuth_swath_rad = np.abs(azimuths_rad[-1] - azimuths_rad[0])
             num_azimuths = len(azimuths_rad)
-            elevations_rad = [(entry['sweep_el_deg'] * np.pi / 180.0) for entry in volume]
+            elevations_rad = np.array([entry['sweep_el_deg'] for entry in volume], dtype=np.float64) * np.pi / 180.0
             elevation_swath_rad = np.abs(elevations_rad[-1] - elevations_rad[0])
             num_elevations = len(elevations_rad)
             product_types = [entry['type'] for entry in first_slice['prod']]
@@ -69,24 +195,35 @@ class RadarVolume(object):
             
             # Build up the range bins
             num_ranges = first_slice['prod'][0]['data'].shape[0]
-            ranges_km = [(start_range_km + (doppler_resolution_km * i)) for i in range(num_ranges)]
+            ranges_km = start_range_km + doppler_resolution_km * np.arange(num_ranges, dtype=np.float64)
             range_swath_km = np.abs(ranges_km[-1] - ranges_km[0])
+
+            # Consecutive volumes almost always share their geometry, in which case they share its axes
+            geometry = get_scan_geometry(azimuths_rad, elevations_rad, ranges_km, start_range_km, doppler_resolution_km)
             
             # Transform the data from each product into a 3-dimensional ndarray and place it in the products dictionary
-            products = {}
             for p_type in product_types:
-                # Initialize the 3-D block of data for the current product (el x az x range)
-                products[p_type] = np.zeros((num_elevations, num_azimuths, num_ranges))
+                # Initialize the 3-D block of data for the current product (el x az x range).
+                # Every element is overwritten below, so a recycled buffer doesn't need to be cleared.
+                shape = (num_elevations, num_azimuths, num_ranges)
+                storage_mode = get_storage_mode(storage_modes, p_type)
+                dtype = STORAGE_DTYPES[storage_mode]
+                buffer = buffer_pool.acquire(shape, dtype) if buffer_pool is not None else np.zeros(shape, dtype=dtype)
+                if storage_mode == 'float32':
+                    products[p_type] = buffer
+                    store = buffer.__setitem__
+                else:
+                    products[p_type] = CompactProduct(buffer, p_type)
+                    store = products[p_type].store
 
                 # Transform the source data into the 3-D block for the current product.
-                p_data = products[p_type]
                 p_idx = product_types.index(p_type)
                 for el_idx in range(num_elevations):
                     prods = volume[el_idx]['prod']
                     if p_type == 'R':
-                        p_data[el_idx, :, :] = np.abs(prods[p_idx]['data']).astype(np.float32).T
+                        store(el_idx, np.abs(prods[p_idx]['data']).astype(np.float32).T)
                     else:
-                        p_data[el_idx, :, :] = prods[p_idx]['data'].astype(np.float32).T
+                        store(el_idx, prods[p_idx]['data'].astype(np.float32).T)
                     
 
             return RadarVolume(
@@ -112,9 +249,11 @@ class RadarVolume(object):
                 azimuths_rad=azimuths_rad,
                 azimuth_swath_rad=azimuth_swath_rad,
                 elevations_rad=elevations_rad,
-                elevation_swath_rad=elevation_swath_rad)
+                elevation_swath_rad=elevation_swath_rad,
+                geometry=geometry)
 
-        except:
-            # TODO: Hushing any volume loading errors down to a single print statement for now. In the future, this should write to a log or something so that it can be triaged.
-            print(f'Failed to load .mat file: "{file_path}"')
-            return None
\ No newline at end of file
+        except Exception:
+            # Don't leak the buffers of a partially built volume.
+            if buffer_pool is not None:
+                buffer_pool.release_products(products)
+            raise
\ No newline at end of file
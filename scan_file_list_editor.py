@@ -1,8 +1,9 @@
 import sys
-from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QListWidget, QHBoxLayout, QPushButton, QFileDialog
+from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QLabel, QLineEdit, QListView, QHBoxLayout, QPushButton, QFileDialog
 from PySide6.QtCore import Signal, Slot
 from scan_set import ScanSet
 from scan import Scan
+from scan_list_models import ScanFilesModel
 from pathlib import Path
 
 class ScanFileListEditor(QWidget):
@@ -27,8 +28,15 @@ class ScanFileListEditor(QWidget):
         self.scan_name_editor.textEdited.connect(self.on_scan_name_changed)
         self.main_layout.addWidget(self.scan_name_editor)
 
-        self.scan_files_list = QListWidget()
-        self.scan_files_list.setSelectionMode(QListWidget.SelectionMode.ExtendedSelection)
+        # Model/view list so that scans with many thousands of files stay responsive
+        self.scan_files_model = ScanFilesModel(self)
+        self.scan_files_list = QListView()
+        self.scan_files_list.setModel(self.scan_files_model)
+        self.scan_files_list.setUniformItemSizes(True)
+        # Lay items out in batches between events rather than all at once when a big scan is shown
+        self.scan_files_list.setLayoutMode(QListView.LayoutMode.Batched)
+        self.scan_files_list.setBatchSize(1000)
+        self.scan_files_list.setSelectionMode(QListView.SelectionMode.ExtendedSelection)
         self.scan_files_list.setEnabled(False)
         self.main_layout.addWidget(self.scan_files_list)
 
@@ -58,22 +66,20 @@ class ScanFileListEditor(QWidget):
     def add_scan_files_clicked(self):
         if self.selected_scan is not None:
             (filenames, selected_filter) = QFileDialog.getOpenFileNames(self, "Select Scan Files...", self.scanset.get_base_dir().__str__(), filter="MATLAB files (*.mat)")
-            for filename in filenames:
-                rel_filename = (Path(filename).relative_to(self.scanset.get_base_dir()).__str__())
-                self.selected_scan.get_scan_files().append(rel_filename)
-                self.scan_files_list.addItem(rel_filename)
+            base_dir = self.scanset.get_base_dir()
+            self.scan_files_model.append_files([Path(filename).relative_to(base_dir).__str__() for filename in filenames])
             self.status_updated.emit(f'Added {len(filenames)} files to {self.selected_scan.get_name()}.')
+            if len(filenames) > 0:
+                self.scan_files_added.emit(len(filenames))
 
     def remove_scan_files_clicked(self):
-        removals = []
-        for item in self.scan_files_list.selectedItems():
-            # print(item.text())
-            removals.append((next(file for file in self.selected_scan.get_scan_files() if file == item.text()), item))
-        
-        for file, item in removals:
-            self.selected_scan.get_scan_files().remove(file)
-            self.scan_files_list.takeItem(self.scan_files_list.row(item))
-        self.status_updated.emit(f'Removed {len(removals)} files from {self.selected_scan.get_name()}.')
+        if self.selected_scan is None:
+            return
+        # Walk the selection's ranges rather than creating an index per selected row
+        rows = [row for selection_range in self.scan_files_list.selectionModel().selection() for row in range(selection_range.top(), selection_range.bottom() + 1)]
+        self.scan_files_list.clearSelection()
+        num_removed = self.scan_files_model.remove_rows(rows)
+        self.status_updated.emit(f'Removed {num_removed} files from {self.selected_scan.get_name()}.')
 
     @Slot(ScanSet)
     def on_new_scanset(self, scanset: ScanSet):
@@ -90,9 +96,7 @@ class ScanFileListEditor(QWidget):
             self.scan_name_editor.setText(scan.get_name())
             self.scan_name_editor.setEnabled(True)
             
-            self.scan_files_list.clear()
-            for filename in scan.get_scan_files():
-                self.scan_files_list.addItem(filename)
+            self.scan_files_model.set_scan(scan)
             self.scan_files_list.setEnabled(True)
             
             self.add_files_button.setEnabled(True)
@@ -107,7 +111,7 @@ class ScanFileListEditor(QWidget):
         self.scan_name_editor.clear()
         self.scan_files_list.setEnabled(False)
         self.scan_files_list.clearSelection()
-        self.scan_files_list.clear()
+        self.scan_files_model.set_scan(None)
         self.add_files_button.setEnabled(False)
         self.remove_files_button.setEnabled(False)
         self.selected_scan = None
@@ -0,0 +1,128 @@
+from functools import cached_property
+from beam_geometry import get_beam_geometry_tables
+import numpy as np
+import threading
+import hashlib
+import weakref
+
+def compute_geometry_hash(azimuths_rad, elevations_rad, ranges_km) -> str:
+    """
+    Hash the scan geometry of a volume. Volumes with the same hash have identical
+    (elevation x azimuth x range) axes.
+    """
+    digest = hashlib.sha1()
+    for axis in (azimuths_rad, elevations_rad, ranges_km):
+        # Rounding keeps tiny floating point differences from splitting geometries.
+        values = np.round(np.asarray(axis, dtype=np.float64), 6)
+        digest.update(np.int64(len(values)).tobytes())
+        digest.update(values.tobytes())
+    return digest.hexdigest()[:16]
+
+class ScanGeometry(object):
+    """
+    The (elevation x azimuth x range) axes of a volume, as read-only float64 arrays.
+    Instances are interned (see get_scan_geometry()), so every volume with the same
+    geometry shares one, and `a is b` is a cheap "geometry unchanged" check.
+    Tables derived from the axes are computed the first time they're needed and
+    then shared as well.
+    """
+    def __init__(self, azimuths_rad, elevations_rad, ranges_km, start_range_km, doppler_resolution_km, geometry_hash=None):
+        self._azimuths_rad = _read_only(azimuths_rad)
+        self._elevations_rad = _read_only(elevations_rad)
+        self._ranges_km = _read_only(ranges_km)
+        self._start_range_km = float(start_range_km)
+        self._doppler_resolution_km = float(doppler_resolution_km)
+        self._geometry_hash = geometry_hash or compute_geometry_hash(azimuths_rad, elevations_rad, ranges_km)
+
+    azimuths_rad = property(lambda self: self._azimuths_rad)
+    elevations_rad = property(lambda self: self._elevations_rad)
+    ranges_km = property(lambda self: self._ranges_km)
+    start_range_km = property(lambda self: self._start_range_km)
+    doppler_resolution_km = property(lambda self: self._doppler_resolution_km)
+    geometry_hash = property(lambda self: self._geometry_hash)
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        """The (elevation x azimuth x range) shape of product cubes with this geometry."""
+        return (len(self._elevations_rad), len(self._azimuths_rad), len(self._ranges_km))
+
+    @cached_property
+    def azimuth_swath_rad(self) -> float:
+        return float(np.abs(self._azimuths_rad[-1] - self._azimuths_rad[0]))
+
+    @cached_property
+    def elevation_swath_rad(self) -> float:
+        return float(np.abs(self._elevations_rad[-1] - self._elevations_rad[0]))
+
+    @cached_property
+    def sin_azimuths(self) -> np.ndarray:
+        return _read_only(np.sin(self._azimuths_rad))
+
+    @cached_property
+    def cos_azimuths(self) -> np.ndarray:
+        return _read_only(np.cos(self._azimuths_rad))
+
+    @cached_property
+    def sin_elevations(self) -> np.ndarray:
+        return _read_only(np.sin(self._elevations_rad))
+
+    @cached_property
+    def cos_elevations(self) -> np.ndarray:
+        return _read_only(np.cos(self._elevations_rad))
+
+    @cached_property
+    def beam_heights_km(self) -> np.ndarray:
+        """(elevation x range) height of the beam center above the radar (4/3 effective earth radius model)."""
+        return _read_only(get_beam_geometry_tables(self._elevations_rad, self._ranges_km).heights_km)
+
+    @cached_property
+    def gate_x_km(self) -> np.ndarray:
+        """(azimuth x range) km east of the radar of each gate, taking slant range as ground distance like the plan views do."""
+        return _read_only(np.outer(self.sin_azimuths, self._ranges_km))
+
+    @cached_property
+    def gate_y_km(self) -> np.ndarray:
+        """(azimuth x range) km north of the radar of each gate, taking slant range as ground distance like the plan views do."""
+        return _read_only(np.outer(self.cos_azimuths, self._ranges_km))
+
+    def __setattr__(self, name, value):
+        if name.startswith('_') and name not in self.__dict__:
+            object.__setattr__(self, name, value)
+        else:
+            raise AttributeError(f'ScanGeometry is immutable (tried to set "{name}")')
+
+    def __hash__(self):
+        return hash(self._geometry_hash)
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return (isinstance(other, ScanGeometry) and self._geometry_hash == other._geometry_hash
+                and self._start_range_km == other._start_range_km and self._doppler_resolution_km == other._doppler_resolution_km)
+
+    def __repr__(self):
+        (num_el, num_az, num_ranges) = self.shape
+        return f'ScanGeometry({num_el} el x {num_az} az x {num_ranges} ranges, {self._geometry_hash})'
+
+def _read_only(values) -> np.ndarray:
+    array = np.array(values, dtype=np.float64)
+    array.flags.writeable = False
+    return array
+
+# Geometries in use by some volume (or anything else holding on to them)
+_geometries = weakref.WeakValueDictionary()
+_geometries_lock = threading.Lock()
+
+def get_scan_geometry(azimuths_rad, elevations_rad, ranges_km, start_range_km, doppler_resolution_km) -> ScanGeometry:
+    """
+    The shared ScanGeometry for a set of axes. Volumes loaded on any thread get the
+    same instance as long as one with the same geometry is still alive.
+    """
+    geometry_hash = compute_geometry_hash(azimuths_rad, elevations_rad, ranges_km)
+    key = (geometry_hash, round(float(start_range_km), 6), round(float(doppler_resolution_km), 9))
+    with _geometries_lock:
+        geometry = _geometries.get(key)
+        if geometry is None:
+            geometry = ScanGeometry(azimuths_rad, elevations_rad, ranges_km, start_range_km, doppler_resolution_km, geometry_hash)
+            _geometries[key] = geometry
+    return geometry
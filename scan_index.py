@@ -0,0 +1,301 @@
+# A scan index is a small JSON file (one per scanset) holding the metadata of
+# every volume file in the scanset, so questions like "what time is frame 300?"
+# or "which files share geometry?" can be answered without opening any .mat files.
+#
+# {
+#   "version": 1,
+#   "base_dir": "common_ancestor_dir",
+#   "entries": {
+#       "relative/path/to/file.mat": {
+#           "time": 739370.08,
+#           "timestamp": "2024-04-28T02:00:51",
+#           "vcp": 100,
+#           "num_elevations": 20,
+#           "num_azimuths": 44,
+#           "num_ranges": 1000,
+#           "products": ["Z", "V", ...],
+#           "size_bytes": 2552128,
+#           "mtime": 1714269651.0,
+#           "geometry_hash": "3f2a..."
+#       },
+#       ...
+#   }
+# }
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from datetime import datetime, timedelta
+from pathlib import Path
+from radar_volume import RadarVolume
+from scan_geometry import compute_geometry_hash
+from app_config import get_cache_dir
+import threading
+import hashlib
+import json
+import os
+
+INDEX_VERSION = 1
+INDEX_FILENAME = '.pardataviz_index.json'
+
+def timestamp_from_filename(filename) -> datetime | None:
+    """
+    Parse the volume time out of a PAR filename, e.g.
+    "HRUS_240428_020051000_100.mat" -> 2024-04-28 02:00:51.000
+    """
+    try:
+        parts = Path(filename).stem.split('_')
+        timestamp = datetime.strptime(parts[1] + parts[2][:6], "%y%m%d%H%M%S")
+        return timestamp + timedelta(milliseconds=int(parts[2][6:9] or 0))
+    except (IndexError, ValueError):
+        return None
+
+def timestamp_from_matlab_datenum(datenum) -> datetime | None:
+    """
+    Convert a MATLAB datenum (days since year 0) into a datetime.
+    """
+    try:
+        return datetime.fromordinal(int(datenum)) + timedelta(days=datenum % 1) - timedelta(days=366)
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+class ScanIndexEntry(object):
+    """
+    Metadata for a single volume file in a scan index.
+    """
+    def __init__(self, time=None, timestamp=None, vcp=None, num_elevations=0, num_azimuths=0,
+                 num_ranges=0, products=None, size_bytes=0, mtime=0.0, geometry_hash=None) -> None:
+        self.time = time
+        self.timestamp = timestamp
+        self.vcp = vcp
+        self.num_elevations = num_elevations
+        self.num_azimuths = num_azimuths
+        self.num_ranges = num_ranges
+        self.products = products if products is not None else []
+        self.size_bytes = size_bytes
+        self.mtime = mtime
+        self.geometry_hash = geometry_hash
+
+    def get_shape(self) -> tuple[int, int, int]:
+        """The (elevation x azimuth x range) shape of each product cube in the volume."""
+        return (self.num_elevations, self.num_azimuths, self.num_ranges)
+
+    def get_datetime(self) -> datetime | None:
+        return datetime.fromisoformat(self.timestamp) if self.timestamp else None
+
+    @staticmethod
+    def build_scan_index_entry(file_path: Path, rel_filename: str, stat_result=None):
+        """
+        Read the metadata for a single volume file. Returns None if the file can't be read.
+        """
+        stat_result = stat_result if stat_result is not None else os.stat(file_path)
+        metadata = RadarVolume.read_metadata_from_matlab_file(file_path)
+        if metadata is None:
+            return None
+
+        # Prefer the timestamp in the filename, it's what the operators go by.
+        timestamp = timestamp_from_filename(rel_filename)
+        if timestamp is None and metadata['time'] is not None:
+            timestamp = timestamp_from_matlab_datenum(metadata['time'])
+
+        return ScanIndexEntry(
+            time=metadata['time'],
+            timestamp=timestamp.isoformat() if timestamp is not None else None,
+            vcp=metadata['vcp'],
+            num_elevations=len(metadata['elevations_rad']),
+            num_azimuths=len(metadata['azimuths_rad']),
+            num_ranges=len(metadata['ranges_km']),
+            products=metadata['products'],
+            size_bytes=stat_result.st_size,
+            mtime=stat_result.st_mtime,
+            geometry_hash=compute_geometry_hash(metadata['azimuths_rad'], metadata['elevations_rad'], metadata['ranges_km']))
+
+class ScanIndex(object):
+    """
+    Per-scanset index of volume file metadata, keyed by the filename relative to
+    the scanset's base directory. Safe to update from a worker thread while the
+    GUI thread reads from it.
+    """
+    def __init__(self, base_dir: Path | str) -> None:
+        self.base_dir = base_dir.__str__()
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get_base_dir(self) -> Path:
+        return Path(self.base_dir)
+
+    def get_entry(self, rel_filename: str) -> ScanIndexEntry | None:
+        with self.lock:
+            return self.entries.get(rel_filename)
+
+    def set_entry(self, rel_filename: str, entry: ScanIndexEntry) -> None:
+        with self.lock:
+            self.entries[rel_filename] = entry
+
+    def remove_entry(self, rel_filename: str) -> None:
+        with self.lock:
+            self.entries.pop(rel_filename, None)
+
+    def is_entry_current(self, rel_filename: str, stat_result) -> bool:
+        """Check if a file's entry exists and the file hasn't changed since it was indexed."""
+        entry = self.get_entry(rel_filename)
+        return entry is not None and entry.size_bytes == stat_result.st_size and entry.mtime == stat_result.st_mtime
+
+    def get_timestamps(self, rel_filenames: list[str]) -> list[datetime | None]:
+        """Get the time of each file, falling back on the filename when a file hasn't been indexed (yet)."""
+        timestamps = []
+        for rel_filename in rel_filenames:
+            entry = self.get_entry(rel_filename)
+            if entry is not None and entry.timestamp is not None:
+                timestamps.append(entry.get_datetime())
+            else:
+                timestamps.append(timestamp_from_filename(rel_filename))
+        return timestamps
+
+    def get_files_sharing_geometry(self, geometry_hash: str) -> list[str]:
+        with self.lock:
+            return [filename for (filename, entry) in self.entries.items() if entry.geometry_hash == geometry_hash]
+
+    @staticmethod
+    def get_index_path(base_dir: Path) -> Path:
+        """
+        The index lives in the scanset's base directory when it is writable,
+        otherwise in the user's cache folder (keyed by the base directory).
+        """
+        base_dir = Path(base_dir)
+        if base_dir.is_dir() and os.access(base_dir, os.W_OK):
+            return base_dir / INDEX_FILENAME
+        key = hashlib.sha1(str(base_dir.resolve()).encode('utf-8')).hexdigest()[:16]
+        return get_cache_dir('index') / f'{key}.json'
+
+    @staticmethod
+    def load_scan_index(index_path: Path, base_dir: Path):
+        """
+        Load an index file. A missing, unreadable or out-of-date index file results
+        in an empty index (which will be rebuilt).
+        """
+        scan_index = ScanIndex(base_dir)
+        try:
+            with index_path.open("r") as index_file:
+                index_json = json.load(index_file)
+            if index_json.get("version") == INDEX_VERSION:
+                for (filename, entry_json) in index_json["entries"].items():
+                    scan_index.entries[filename] = ScanIndexEntry(**entry_json)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return scan_index
+
+    @staticmethod
+    def dump_scan_index(index_path: Path, scan_index):
+        with scan_index.lock:
+            index_json = {
+                "version": INDEX_VERSION,
+                "base_dir": scan_index.base_dir,
+                "entries": {filename: vars(entry) for (filename, entry) in scan_index.entries.items()}
+            }
+        # Write to a temporary file first so a crash never leaves a truncated index behind.
+        tmp_path = index_path.with_suffix('.tmp')
+        with tmp_path.open("w") as index_file:
+            json.dump(index_json, index_file)
+        os.replace(tmp_path, index_path)
+
+class ScanIndexBuilderTask(QRunnable):
+    """
+    QRunnable task which (re-)indexes any files which are new or have changed
+    since they were last indexed, periodically saving the index to disk.
+    """
+    def __init__(self, builder, scan_index, index_path, rel_filenames, cancel_flag, save_every=50):
+        super().__init__()
+        self.builder = builder
+        self.scan_index = scan_index
+        self.index_path = index_path
+        self.rel_filenames = rel_filenames
+        self.cancel_flag = cancel_flag
+        self.save_every = save_every
+
+    def run(self):
+        base_dir = self.scan_index.get_base_dir()
+        num_indexed = 0
+        for (i, rel_filename) in enumerate(self.rel_filenames):
+            if self.cancel_flag.is_set():
+                break
+
+            file_path = base_dir / rel_filename
+            try:
+                stat_result = os.stat(file_path)
+            except OSError:
+                # The file is gone, forget about it.
+                self.scan_index.remove_entry(rel_filename)
+                continue
+
+            if self.scan_index.is_entry_current(rel_filename, stat_result):
+                continue
+
+            entry = ScanIndexEntry.build_scan_index_entry(file_path, rel_filename, stat_result)
+            if entry is not None:
+                self.scan_index.set_entry(rel_filename, entry)
+                num_indexed += 1
+
+            if num_indexed > 0 and num_indexed % self.save_every == 0:
+                self.save()
+                self.builder.progress.emit(i + 1, len(self.rel_filenames))
+
+        if num_indexed > 0:
+            self.save()
+        if not self.cancel_flag.is_set():
+            print(f'Scan index: indexed {num_indexed} new or changed files ({len(self.rel_filenames)} total) "{self.index_path}"')
+            self.builder.index_updated.emit(self.scan_index)
+
+    def save(self):
+        try:
+            ScanIndex.dump_scan_index(self.index_path, self.scan_index)
+        except OSError as e:
+            print(f'Scan index: failed to save "{self.index_path}": {e}')
+
+class ScanIndexBuilder(QObject):
+    """
+    Builds and incrementally updates the scan index for a scanset in the background.
+    Only files which are new or have changed on disk since the index was saved are read.
+    """
+    # Emitted (from the worker thread) with the number of files processed so far and the total
+    progress = Signal(int, int)
+    # Emitted when the index has been brought up to date
+    index_updated = Signal(object)
+
+    def __init__(self):
+        super().__init__()
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
+        self.cancel_flag = threading.Event()
+        self.scan_index = None
+        self.index_path = None
+
+    def open_scanset(self, scanset) -> ScanIndex:
+        """
+        Load the existing index for a scanset (if any) and bring it up to date in the background.
+        """
+        self.cancel()
+        base_dir = scanset.get_base_dir()
+        self.index_path = ScanIndex.get_index_path(base_dir)
+        self.scan_index = ScanIndex.load_scan_index(self.index_path, base_dir)
+        self.update(scanset)
+        return self.scan_index
+
+    def update(self, scanset):
+        """
+        Incrementally index every file in every scan of the scanset.
+        """
+        if self.scan_index is None:
+            return
+        rel_filenames = list(dict.fromkeys(filename for scan in scanset.get_scans() for filename in scan.get_scan_files()))
+        self.cancel_flag = threading.Event()
+        self.thread_pool.start(ScanIndexBuilderTask(self, self.scan_index, self.index_path, rel_filenames, self.cancel_flag))
+
+    def update_files(self, rel_filenames):
+        """
+        Index just the given files (e.g. files appended to a scan in live mode),
+        without going over the rest of the scanset.
+        """
+        if self.scan_index is None or not rel_filenames:
+            return
+        self.thread_pool.start(ScanIndexBuilderTask(self, self.scan_index, self.index_path, list(rel_filenames), self.cancel_flag))
+
+    def cancel(self):
+        self.cancel_flag.set()
@@ -0,0 +1,120 @@
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex
+from scan import Scan
+
+def get_contiguous_ranges(rows) -> list[tuple[int, int]]:
+    """
+    Collapse row numbers into sorted (first, last) ranges, e.g. {1, 2, 3, 7} -> [(1, 3), (7, 7)].
+    """
+    ranges = []
+    for row in sorted(set(rows)):
+        if ranges and row == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], row)
+        else:
+            ranges.append((row, row))
+    return ranges
+
+class ScanFilesModel(QAbstractListModel):
+    """
+    List model over a scan's file list (Scan.scan_files). The model edits that list in
+    place, so everyone holding on to the scan sees the changes. Views only ask for the
+    rows they show, so even scans with 100k files open instantly.
+    """
+    # Removing more ranges than this resets the model instead of notifying each range
+    max_removal_ranges = 64
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.scan = None
+        self.scan_files = []
+
+    def set_scan(self, scan: Scan | None):
+        self.beginResetModel()
+        self.scan = scan
+        self.scan_files = scan.get_scan_files() if scan is not None else []
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.scan_files)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole) and 0 <= index.row() < len(self.scan_files):
+            return self.scan_files[index.row()]
+        return None
+
+    def append_files(self, filenames: list[str]):
+        """Append files to the scan with a single insert notification."""
+        if not filenames:
+            return
+        first = len(self.scan_files)
+        self.beginInsertRows(QModelIndex(), first, first + len(filenames) - 1)
+        self.scan_files.extend(filenames)
+        self.endInsertRows()
+
+    def remove_rows(self, rows) -> int:
+        """
+        Remove a set of rows in one pass (O(n) however many rows are removed). Returns
+        the number of files removed.
+        """
+        ranges = get_contiguous_ranges(row for row in rows if 0 <= row < len(self.scan_files))
+        num_removed = sum(last - first + 1 for (first, last) in ranges)
+        if len(ranges) > self.max_removal_ranges:
+            removed = set(rows)
+            self.beginResetModel()
+            self.scan_files[:] = [filename for (row, filename) in enumerate(self.scan_files) if row not in removed]
+            self.endResetModel()
+        else:
+            # Back to front so earlier ranges keep their row numbers
+            for (first, last) in reversed(ranges):
+                self.beginRemoveRows(QModelIndex(), first, last)
+                del self.scan_files[first:last + 1]
+                self.endRemoveRows()
+        return num_removed
+
+class ScansModel(QAbstractListModel):
+    """
+    List model over a scanset's scans (ScanSet.scans), showing each scan's name.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.scanset = None
+        self.scans = []
+
+    def set_scanset(self, scanset):
+        self.beginResetModel()
+        self.scanset = scanset
+        self.scans = scanset.get_scans() if scanset is not None else []
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.scans)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if 0 <= index.row() < len(self.scans):
+            scan = self.scans[index.row()]
+            if role == Qt.ItemDataRole.DisplayRole:
+                return scan.get_name()
+            if role == Qt.ItemDataRole.ToolTipRole:
+                return f'{scan.get_name()} ({len(scan.get_scan_files())} files)'
+        return None
+
+    def get_scan(self, row) -> Scan | None:
+        return self.scans[row] if 0 <= row < len(self.scans) else None
+
+    def append_scan(self, scan: Scan):
+        row = len(self.scans)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.scanset.add_scan(scan)
+        self.endInsertRows()
+
+    def remove_scan(self, row):
+        if 0 <= row < len(self.scans):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.scanset.remove_scan(self.scans[row])
+            self.endRemoveRows()
+
+    def rename_scan(self, row, name: str):
+        scan = self.get_scan(row)
+        if scan is not None:
+            scan.set_name(name)
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DisplayRole])
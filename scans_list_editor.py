@@ -1,8 +1,9 @@
 import sys
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QListWidget, QHBoxLayout, QPushButton, QListWidgetItem
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QListView, QHBoxLayout, QPushButton
 from PySide6.QtCore import Signal, Slot
 from scan_set import ScanSet
 from scan import Scan
+from scan_list_models import ScansModel
 
 class ScansListEditor(QWidget):
     """
@@ -21,9 +22,12 @@ class ScansListEditor(QWidget):
         self.scanset_scanslist_label = QLabel("Scans:")
         self.main_layout.addWidget(self.scanset_scanslist_label)
 
-        self.scans_list = QListWidget()
-        self.scans_list.setSelectionMode(QListWidget.SelectionMode.SingleSelection)
-        self.scans_list.itemSelectionChanged.connect(self.scan_selected)
+        self.scans_model = ScansModel(self)
+        self.scans_list = QListView()
+        self.scans_list.setModel(self.scans_model)
+        self.scans_list.setUniformItemSizes(True)
+        self.scans_list.setSelectionMode(QListView.SelectionMode.SingleSelection)
+        self.scans_list.selectionModel().selectionChanged.connect(self.scan_selected)
         self.main_layout.addWidget(self.scans_list)
 
         self.horizb_layout = QHBoxLayout()
@@ -42,10 +46,8 @@ class ScansListEditor(QWidget):
         self.scanset = scanset
         self.scan_count = len(scanset.get_scans())
 
-        # Clear the scan list and populate it with the new scanset's scans (if any).
-        self.scans_list.clear()
-        for scan in scanset.get_scans():
-            self.scans_list.addItem(scan.get_name())
+        # Show the new scanset's scans (if any).
+        self.scans_model.set_scanset(scanset)
 
     def scan_selected(self):
         (scan, _) = self.find_selected_scan()
@@ -55,19 +57,12 @@ class ScansListEditor(QWidget):
             self.selected_scan_changed.emit(scan)
             
     
-    def find_selected_scan(self) -> tuple[Scan, QListWidgetItem] | None:
-        if len(self.scans_list.selectedItems()) > 0:
-            scan_name = self.scans_list.selectedItems()[0].text()
-            
-            # Find the selection in the scanset.
-            matches = [scan for scan in self.scanset.get_scans() if scan.get_name() == scan_name]
-
-            # Get the first matching scan
-            if len(matches) > 0:
-                return (matches[0], self.scans_list.selectedItems()[0])
-            
-            # Found a QListWidgetItem but no matching scan...
-            return (None, self.scans_list.selectedItems()[0])
+    def find_selected_scan(self) -> tuple[Scan | None, int | None]:
+        """The selected scan and its row, or (None, None)."""
+        selected_rows = self.scans_list.selectionModel().selectedRows()
+        if len(selected_rows) > 0:
+            row = selected_rows[0].row()
+            return (self.scans_model.get_scan(row), row)
 
         # Didn't find anything!
         return (None, None)
@@ -79,38 +74,30 @@ class ScansListEditor(QWidget):
         scan_name = f'Scan {self.scan_count}'
 
         # Add a new scan to the scanset and to the scan list UI.
-        self.scanset.add_scan(Scan(name=scan_name))
-        self.scans_list.addItem(scan_name)
+        self.scans_model.append_scan(Scan(name=scan_name))
 
         self.status_updated.emit(f'Created scan: "{scan_name}"')
 
     def on_remove_scan_clicked(self):
-        (scan, item) = self.find_selected_scan()
+        (scan, row) = self.find_selected_scan()
         if scan is not None:
-            # Remove the scan from the scanset
-            self.scanset.remove_scan(scan)
+            # Remove the scan from the scanset and the scans list
+            self.scans_list.clearSelection()
+            self.scans_model.remove_scan(row)
 
             # Update internal state and emit status
             self.status_updated.emit(f'Removed scan: "{scan.get_name()}"')
-
-        if item is not None:
-            # Remove it from the scans list
-            self.scans_list.clearSelection()
-            self.scans_list.takeItem(self.scans_list.row(item))
         
-        # The QListWidget doesn't trigger an empty selection, so let everyone know we're out of scans.
+        # The list view doesn't trigger an empty selection, so let everyone know we're out of scans.
         if len(self.scanset.get_scans()) == 0:
             self.selected_scan_changed.emit(None)
 
     @Slot(str)
     def on_scan_name_changed(self, scan_name: str):
-        (scan, item) = self.find_selected_scan()
+        (scan, row) = self.find_selected_scan()
 
         if scan is not None:
-            scan.set_name(scan_name)
-        
-        if item is not None:
-            item.setText(scan_name)
+            self.scans_model.rename_scan(row, scan_name)
 
 
 if __name__ == "__main__":
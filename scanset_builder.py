@@ -6,6 +6,7 @@ from PySide6.QtCore import Slot, Signal
 from scan_set import ScanSet
 from scans_list_editor import ScansListEditor
 from scan_file_list_editor import ScanFileListEditor
+from directory_crawler import DirectoryCrawler
 
 class ScansetBuilder(QWidget):
     """
@@ -49,8 +50,18 @@ class ScansetBuilder(QWidget):
         self.scanset_dir_browse_button = QPushButton("Browse...")
         self.scanset_dir_browse_button.clicked.connect(self.scanset_editor_base_dir_browse_clicked)
         base_dir_layout.addWidget(self.scanset_dir_browse_button)
+
+        # Find every scan under the base directory in the background
+        self.crawl_button = QPushButton("Crawl")
+        self.crawl_button.setToolTip("Find the scans (folders of .mat files) under the base directory")
+        self.crawl_button.clicked.connect(self.crawl_button_clicked)
+        base_dir_layout.addWidget(self.crawl_button)
         main_layout.addLayout(base_dir_layout)
 
+        self.crawler = DirectoryCrawler()
+        self.crawler.progress.connect(self.on_crawl_progress)
+        self.crawler.scans_found.connect(self.on_crawl_scans_found)
+
         # Scans list editor
         self.scans_list_editor = ScansListEditor()
         self.scans_list_editor.status_updated.connect(self.on_status_updated)
@@ -108,6 +119,27 @@ class ScansetBuilder(QWidget):
             self.scanset.set_base_dir(dir)
             self.scanset_dir_editor.setText(dir)
 
+    def crawl_button_clicked(self):
+        self.crawl_button.setEnabled(False)
+        self.status_updated.emit(f'Crawling "{self.scanset.get_base_dir()}"...')
+        self.crawler.crawl(self.scanset.get_base_dir())
+
+    @Slot(int, int)
+    def on_crawl_progress(self, num_dirs, num_files):
+        self.status_updated.emit(f'Crawling "{self.scanset.get_base_dir()}": {num_files} files in {num_dirs} folders...')
+
+    @Slot(list)
+    def on_crawl_scans_found(self, scans):
+        self.crawl_button.setEnabled(True)
+        # Add the scans which aren't in the scanset yet
+        existing_names = set(scan.get_name() for scan in self.scanset.get_scans())
+        new_scans = [scan for scan in scans if scan.get_name() not in existing_names]
+        for scan in new_scans:
+            self.scanset.add_scan(scan)
+        self.status_updated.emit(f'Crawl found {len(scans)} scans ({len(new_scans)} new, {sum(len(scan.get_scan_files()) for scan in new_scans)} files).')
+        if new_scans:
+            self.on_scanset_loaded(self.scanset)
+
     def save_scanset_button_clicked(self):
         (filename, selected_filter) = QFileDialog.getSaveFileName(self, "Save scanset...", os.path.expanduser("~"), "JSON files (*.json)")
         if filename:
@@ -0,0 +1,160 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from radar_volume import RadarVolume
+import numpy as np
+import threading
+
+def coarse_to_fine_order(count):
+    """
+    Order the indices [0, count) so that the whole timeline is covered coarsely
+    first and then progressively refined, e.g. 0, 8, 16, ..., 4, 12, ..., 2, 6, ...
+    This way a user scrubbing early on sees a thumbnail "near" every position.
+    """
+    order = []
+    seen = np.zeros(count, dtype=bool)
+    stride = 1
+    while stride * 2 < count:
+        stride *= 2
+    while stride >= 1:
+        for i in range(0, count, stride):
+            if not seen[i]:
+                seen[i] = True
+                order.append(i)
+        stride //= 2
+    return order
+
+class ThumbnailBuilderTask(QRunnable):
+    """
+    QRunnable task which walks every file in a scan and stores a downsampled
+    thumbnail of a single sweep in the preview cache.
+    """
+    def __init__(self, preview_cache, mat_files, cancel_flag):
+        super().__init__()
+        self.preview_cache = preview_cache
+        self.mat_files = mat_files
+        self.cancel_flag = cancel_flag
+
+    def run(self):
+        for index in coarse_to_fine_order(len(self.mat_files)):
+            if self.cancel_flag.is_set():
+                return
+
+            # The volume may have been loaded in the foreground while we were busy.
+            if self.preview_cache.has_thumbnail(index):
+                continue
+
+            sweep = RadarVolume.read_sweep_from_matlab_file(self.mat_files[index], self.preview_cache.product, 0)
+            if sweep is not None and not self.cancel_flag.is_set():
+                self.preview_cache.store_sweep(index, sweep)
+
+        if not self.cancel_flag.is_set():
+            self.preview_cache.build_finished.emit()
+
+class ScrubPreviewCache(QObject):
+    """
+    Cache of low-resolution PPI thumbnails (by default, the lowest tilt of
+    reflectivity) for every volume in a scan. Thumbnails are built in the
+    background and kept in a single compact float16 array, so they can be shown
+    while the user drags the timeline slider. Full volumes are only loaded
+    once the slider is released.
+    """
+    build_finished = Signal()
+
+    def __init__(self, product='Z', max_azimuths=64, max_ranges=128):
+        super().__init__()
+        self.product = product
+        self.max_azimuths = max_azimuths
+        self.max_ranges = max_ranges
+
+        # Use a dedicated single-thread pool so that building thumbnails never
+        # competes with the foreground loader for worker slots.
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
+        self.cancel_flag = threading.Event()
+        self.lock = threading.Lock()
+
+        self.thumbnails = None
+        self.available = np.zeros(0, dtype=bool)
+        self.mat_files = []
+
+    def reset(self, mat_files):
+        """
+        Cancel any in-progress build and discard all thumbnails.
+        """
+        self.cancel()
+        with self.lock:
+            self.mat_files = list(mat_files)
+            # The thumbnail array is allocated lazily once the first sweep's shape is known.
+            self.thumbnails = None
+            self.available = np.zeros(len(self.mat_files), dtype=bool)
+
+    def append_files(self, mat_files):
+        """
+        Make room for files appended to the scan (e.g. in live mode). Their thumbnails
+        are filled in as the volumes get loaded.
+        """
+        with self.lock:
+            self.mat_files += list(mat_files)
+            self.available = np.concatenate([self.available, np.zeros(len(mat_files), dtype=bool)])
+            if self.thumbnails is not None:
+                padding = np.full((len(mat_files),) + self.thumbnails.shape[1:], np.nan, dtype=np.float16)
+                self.thumbnails = np.concatenate([self.thumbnails, padding])
+
+    def start_build(self):
+        """
+        Start building thumbnails for every file in the background.
+        """
+        self.cancel_flag = threading.Event()
+        task = ThumbnailBuilderTask(self, self.mat_files, self.cancel_flag)
+        self.thread_pool.start(task)
+
+    def cancel(self):
+        self.cancel_flag.set()
+
+    def has_thumbnail(self, index):
+        return 0 <= index < len(self.available) and bool(self.available[index])
+
+    def get_thumbnail(self, index):
+        """
+        Get the thumbnail (azimuth x range) for the given index, falling back to the
+        nearest index with a thumbnail. Returns None if no thumbnail is available yet.
+        """
+        with self.lock:
+            if self.thumbnails is None or not 0 <= index < len(self.available):
+                return None
+
+            if not self.available[index]:
+                built = np.flatnonzero(self.available)
+                if len(built) == 0:
+                    return None
+                index = built[np.argmin(np.abs(built - index))]
+
+            return self.thumbnails[index]
+
+    def store_sweep(self, index, sweep):
+        """
+        Downsample a full-resolution sweep (azimuth x range) and store it as the
+        thumbnail for the given index. Safe to call from worker threads.
+        """
+        with self.lock:
+            if index >= len(self.available):
+                # The cache was reset for a different scan in the meantime.
+                return
+
+            if self.thumbnails is None:
+                shape = (min(sweep.shape[0], self.max_azimuths), min(sweep.shape[1], self.max_ranges))
+                self.thumbnails = np.full((len(self.available),) + shape, np.nan, dtype=np.float16)
+
+            # Nearest-neighbour decimation onto the fixed thumbnail shape.
+            (_, t_azimuths, t_ranges) = self.thumbnails.shape
+            az_idx = np.linspace(0, sweep.shape[0] - 1, t_azimuths).round().astype(int)
+            range_idx = np.linspace(0, sweep.shape[1] - 1, t_ranges).round().astype(int)
+            self.thumbnails[index] = sweep[np.ix_(az_idx, range_idx)]
+            self.available[index] = True
+
+    def update_from_volume(self, index, r_volume: RadarVolume):
+        """
+        Build the thumbnail for a volume which was already loaded in full, saving
+        the background builder from reading the file again.
+        """
+        if not self.has_thumbnail(index) and self.product in r_volume.products:
+            self.store_sweep(index, r_volume.products[self.product][0, :, :])
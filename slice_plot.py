@@ -1,4 +1,3 @@
-import scipy.io as scio
 import numpy as np
 import sys
 import vispy.app
@@ -6,35 +5,98 @@ import time
 from vispy.scene import Label
 from vispy.scene import SceneCanvas, PanZoomCamera, AxisWidget, ColorBarWidget
 from vispy.visuals import TextVisual
-from vispy.scene.visuals import Image
+from vispy.scene.visuals import Image, Line
+from vispy.util import keys
 from vispy.plot import Fig, PlotWidget
 from vispy.color import Colormap
 from vispy.visuals.transforms import STTransform, PolarTransform
 from PySide6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QWidget, QDockWidget, QMenu, QToolTip
-from PySide6.QtCore import Qt, Slot, QObject, Signal, QPoint
+from PySide6.QtCore import Qt, Slot, QObject, Signal, QPoint, QTimer
 from PySide6.QtGui import QAction, QActionGroup, QPaintEvent
-from color_maps import ColorMaps
+from color_maps import get_color_maps
+from tracing import tracer
+from derived_products import DERIVED_PRODUCT_NAMES, get_derived_product_engine
+from swath_accumulator import SWATH_PRODUCT_NAMES, get_swath_engine
+from cappi import CAPPI_HEIGHTS_KM, get_cappi_interpolator
+from cross_section import CrossSectionLine, get_cross_section_sampler_engine
+from product_statistics import get_auto_clims
+from time_series import TimeSeriesPoint
 from radar_volume import RadarVolume
 from dynamic_dock_widget import DynamicDockWidget
 
+# Where the color limits of a view come from
+COLOR_LIMIT_MODES = {
+    'fixed': 'Product defaults',
+    'volume': 'Auto (volume on display)',
+    'scan': 'Auto (whole scan)',
+}
+
 class SlicePlot(QObject):
-    cmaps = ColorMaps('D:/cs5093/20240428/MATLAB Display Code/colormaps.mat')
+    # Emitted by plan views with the CrossSectionLine the user (shift+)dragged on them
+    cross_section_line_changed = Signal(object)
+    # Emitted with the TimeSeriesPoint of a gate the user asked for the time series of (right-click on PPI/RHI views)
+    time_series_requested = Signal(object)
+
+    # How often a cross-section line being dragged is announced
+    section_announce_interval_ms = 100
 
     def __init__(self, id, parent=None, slice_type='ppi'):
         super().__init__(parent=parent)
+
+        # Shared colormap registry (colormaps and LUTs are built once per product)
+        self.cmaps = get_color_maps()
         
         # Set this plot's id (used for window/dock-tab title)
         self.id = id
 
-        # The type of data slice to display ('ppi'/'rhi')
+        # The type of data slice to display ('ppi'/'rhi'/'cappi'/'xsec')
         self.slice_type = slice_type
 
+        # Height of the constant altitude plane shown by CAPPI views
+        self.cappi_height_km = 2.0
+
+        # Cross-section views show the vertical section along a line drawn on a plan view
+        self.cross_section_line = None
+        self.cross_section_sampler = None
+        self.displayed_sampler = None
+        # Plan views: scene position where the section being drawn starts, and its line visual
+        self.section_drag_start = None
+        self.section_line_visual = None
+        # While dragging, the line is announced at most once per interval (with wherever it ends by then)
+        self.section_drag_end = None
+        self.section_announce_timer = QTimer(self)
+        self.section_announce_timer.setSingleShot(True)
+        self.section_announce_timer.setInterval(self.section_announce_interval_ms)
+        self.section_announce_timer.timeout.connect(self.announce_cross_section_line)
+
+        # Volume on display, its scan geometry and its products (None until the first volume arrives)
+        self.volume = None
+        self.geometry = None
+        self.products = None
+
+        # Color limits: the product's defaults, or derived from the histograms of the volume or scan
+        self.color_limit_mode = 'fixed'
+        self.scan_statistics = None
+
+        # Derived (column) products are computed on demand in the background
+        self.derived_product_engine = get_derived_product_engine()
+        self.derived_product_engine.derived_product_ready.connect(self.on_derived_product_ready)
+        # Swath products are accumulated over the whole scan in the background
+        self.swath_engine = get_swath_engine()
+        self.swath_engine.swath_updated.connect(self.on_swath_updated)
+        # Cross-section samplers are built in the background (a coarse one first)
+        self.cross_section_sampler_engine = get_cross_section_sampler_engine()
+        self.cross_section_sampler_engine.sampler_ready.connect(self.on_cross_section_sampler_ready)
+
         # Current locations on the principle axes to slice the data.
         self.current_az = 0
         self.current_el = 0
 
         self.throttle = time.monotonic()
 
+        # Duration of the most recent update_plot() in seconds (shown in the performance HUD)
+        self.last_render_s = None
+
         # Group the product switching actions together to ensure mutual exclusivity
         # https://www.weather.gov/jan/dualpolupgrade-products
         self.action_group = QActionGroup(self)
@@ -61,11 +123,49 @@ class SlicePlot(QObject):
         self.action_group.addAction(self.width_mode_action)
         self.action_group.addAction(self.zdr_mode_action)
 
+        # Derived products are 2D (azimuth x range), so they're only offered in plan (PPI/CAPPI) views
+        self.derived_mode_actions = []
+        if self.is_plan_view():
+            for (product, name) in DERIVED_PRODUCT_NAMES.items():
+                action = QAction(name, self, checkable=True)
+                action.triggered.connect(lambda checked=False, product=product: self.set_product_display(product))
+                self.action_group.addAction(action)
+                self.derived_mode_actions.append(action)
+
+        # Swath products are accumulated on the lowest tilt (PPI views) or the CAPPI height (CAPPI views)
+        self.swath_mode_actions = []
+        if self.is_plan_view():
+            for (product, name) in SWATH_PRODUCT_NAMES.items():
+                action = QAction(name, self, checkable=True)
+                action.triggered.connect(lambda checked=False, product=product: self.set_product_display(product))
+                self.action_group.addAction(action)
+                self.swath_mode_actions.append(action)
+
+        # CAPPI height choices
+        self.cappi_height_actions = []
+        if self.slice_type == 'cappi':
+            self.cappi_height_group = QActionGroup(self)
+            for height_km in CAPPI_HEIGHTS_KM:
+                action = QAction(f'{height_km:g} km', self, checkable=True)
+                action.setChecked(height_km == self.cappi_height_km)
+                action.triggered.connect(lambda checked=False, height_km=height_km: self.set_cappi_height(height_km))
+                self.cappi_height_group.addAction(action)
+                self.cappi_height_actions.append(action)
+
+        # Color limit choices
+        self.color_limit_group = QActionGroup(self)
+        self.color_limit_actions = []
+        for (mode, name) in COLOR_LIMIT_MODES.items():
+            action = QAction(name, self, checkable=True)
+            action.setChecked(mode == self.color_limit_mode)
+            action.triggered.connect(lambda checked=False, mode=mode: self.set_color_limit_mode(mode))
+            self.color_limit_group.addAction(action)
+            self.color_limit_actions.append(action)
+
         # Show reflectivity by default
         self.reflectivity_mode_action.setChecked(True)
         self.product_to_display = 'Z'
-        self.cmap = self.cmaps.reflectivity()
-        self.clim = (-10, 70)
+        (self.cmap, self.clim) = self.cmaps.get_cmap_and_clims_for_product(self.product_to_display)
 
         # Scene setup
         #
@@ -94,12 +194,14 @@ class SlicePlot(QObject):
         self.canvas.events.mouse_press.connect(self.on_mouse_press)
         # Intercept mouse movement to display tooltip of data
         self.canvas.events.mouse_move.connect(self.on_mouse_move)
+        # Finish drawing cross-section lines
+        self.canvas.events.mouse_release.connect(self.on_mouse_release)
         self.canvas.native.setContextMenuPolicy(Qt.CustomContextMenu)
         self.grid = self.canvas.central_widget.add_grid(spacing=1.0, margin=10.0)
         
         # Cell (0,0) - Title
         self.title = Label(
-            f'RHI ({self.product_to_display})' if slice_type == 'rhi' else f'PPI ({self.product_to_display})', 
+            f'{self.get_view_name()} ({self.product_to_display})', 
             color='white')
         self.title.margin = 10.0
         self.title.height_max = 40.0
@@ -108,7 +210,7 @@ class SlicePlot(QObject):
         # Cell (1,0) - Y-Axis
         self.y_axis = AxisWidget(
             orientation="left", 
-            axis_label="Meridonal Distance (km)" if self.slice_type == 'ppi' else "Height (km)",
+            axis_label="Meridonal Distance (km)" if self.is_plan_view() else "Height (km)",
             axis_font_size=8,
             axis_label_margin=75.0,
             tick_label_margin=15.0)
@@ -143,7 +245,7 @@ class SlicePlot(QObject):
         # Cell (2,1) - X-Axis
         self.x_axis = AxisWidget(
             orientation="bottom", 
-            axis_label="Zonal Distance (km)" if self.slice_type == 'ppi' else "Range (km)",
+            axis_label="Zonal Distance (km)" if self.is_plan_view() else "Distance Along Section (km)" if self.slice_type == 'xsec' else "Range (km)",
             axis_font_size=8,
             axis_label_margin=75.0,
             tick_label_margin=45.0)
@@ -156,8 +258,38 @@ class SlicePlot(QObject):
 
         # self.update_plot()
 
+    def is_plan_view(self) -> bool:
+        """Whether the view shows a horizontal (azimuth x range) plane, i.e. a PPI or CAPPI."""
+        return self.slice_type in ('ppi', 'cappi')
+
+    def is_plan_product(self) -> bool:
+        """Whether the displayed product is a 2D (azimuth x range) product, i.e. a derived (column) or swath product."""
+        return self.product_to_display in DERIVED_PRODUCT_NAMES or self.product_to_display in SWATH_PRODUCT_NAMES
+
+    def depends_on_selection(self) -> bool:
+        """Whether the selected tilt/azimuth changes what's on display (CAPPIs, sections, column and swath products don't)."""
+        return self.slice_type in ('ppi', 'rhi') and not self.is_plan_product()
+
+    def get_swath_source(self) -> tuple:
+        """The plane swath products are accumulated on for this view (see swath_accumulator.py)."""
+        return ('cappi', self.cappi_height_km) if self.slice_type == 'cappi' else ('tilt', 0)
+
+    def get_view_name(self) -> str:
+        return self.slice_type.upper()
+
     def set_plot_title(self):
-        if self.slice_type == 'rhi':
+        if self.product_to_display in SWATH_PRODUCT_NAMES:
+            (num_folded, num_volumes) = self.swath_engine.get_progress(self.get_swath_source())
+            self.title.text = f'{self.get_view_name()} ({self.product_to_display}) - {num_folded}/{num_volumes} volumes'
+        elif self.product_to_display in DERIVED_PRODUCT_NAMES:
+            self.title.text = f'{self.get_view_name()} ({self.product_to_display})'
+        elif self.slice_type == 'cappi':
+            self.title.text = f'CAPPI ({self.product_to_display}) - {self.cappi_height_km:g} km'
+        elif self.slice_type == 'xsec':
+            self.title.text = f'XSEC ({self.product_to_display}) - {self.cross_section_line.get_length_km():.1f} km'
+            if self.cross_section_sampler.coarse:
+                self.title.text += ' (refining...)'
+        elif self.slice_type == 'rhi':
             self.title.text = f'RHI ({self.product_to_display}) - AZ {self.azimuths_rad[self.current_az] * 180.0 / np.pi:.2f}°'
         else:
             self.title.text = f'PPI ({self.product_to_display}) - EL (Tilt) {self.elevations_rad[self.current_el] * 180.0 / np.pi:.2f}°'
@@ -166,14 +298,59 @@ class SlicePlot(QObject):
         self.product_to_display = product
 
         # Set dock-tab/window title
-        if self.slice_type == 'rhi':
-            self.parent().setWindowTitle(f'View {self.id} - RHI ({product})')
-        else:
-            self.parent().setWindowTitle(f'View {self.id} - PPI ({product})')
+        self.parent().setWindowTitle(f'View {self.id} - {self.get_view_name()} ({product})')
+
+        self.apply_product_colors()
+        self.update_plot()
 
-        (cmap, clim) = self.cmaps.get_cmap_and_clims_for_product(self.product_to_display)
+    def set_cappi_height(self, height_km):
+        self.cappi_height_km = height_km
+        self.update_plot()
+
+    def set_color_limit_mode(self, mode):
+        self.color_limit_mode = mode
+        self.update_color_limits()
+        self.grid.update()
+
+    def get_clim(self) -> tuple:
+        """
+        The color limits for the displayed product: the product's defaults, or limits
+        derived from the histograms computed when volumes are loaded (falling back on
+        the defaults when there's nothing to derive them from, e.g. derived products).
+        """
+        statistics = None
+        if self.color_limit_mode == 'volume' and self.volume is not None:
+            statistics = self.volume.statistics
+        elif self.color_limit_mode == 'scan':
+            statistics = self.scan_statistics
+        auto_clim = get_auto_clims(self.product_to_display, statistics) if statistics is not None else None
+        if auto_clim is not None:
+            return auto_clim
+        (_, clim) = self.cmaps.get_cmap_and_clims_for_product(self.product_to_display)
+        return clim
+
+    def update_color_limits(self):
+        """Apply the current color limits, if they changed."""
+        clim = self.get_clim()
+        if clim != self.clim:
+            self.clim = clim
+            self.color_bar.clim = self.clim
+            self.image.clim = self.clim
+
+    @Slot(object)
+    def on_scan_statistics_updated(self, scan_statistics):
+        self.scan_statistics = scan_statistics
+        if self.color_limit_mode == 'scan':
+            self.update_color_limits()
+            self.grid.update()
+
+    def apply_product_colors(self):
+        """
+        Swap in the (cached) colormap and color limits of the displayed product.
+        """
+        (cmap, _) = self.cmaps.get_cmap_and_clims_for_product(self.product_to_display)
         self.cmap = cmap
-        self.clim = clim
+        self.clim = self.get_clim()
 
         # Update color bar
         self.color_bar.cmap = self.cmap
@@ -184,7 +361,15 @@ class SlicePlot(QObject):
         # Image color setup (depends on displayed product)
         self.image.cmap = self.cmap
         self.image.clim = self.clim
-        self.update_plot()
+
+    @Slot()
+    def on_color_maps_changed(self):
+        """
+        Pick up a reloaded colormap registry (e.g. a different colormaps file).
+        """
+        self.cmaps = get_color_maps()
+        self.apply_product_colors()
+        self.grid.update()
 
     def get_product_display(self):
         return self.product_to_display
@@ -195,6 +380,112 @@ class SlicePlot(QObject):
             # Check if the click is within the label
             if self.title.rect.contains(event.pos[0], event.pos[1]):
                 self.show_context_menu(event)
+        elif event.button == 1 and keys.SHIFT in event.modifiers and self.is_plan_view() and self.products is not None:
+            # Shift+drag draws a cross-section line (the camera doesn't pan while a modifier is held)
+            self.section_drag_start = self.canvas_to_scene(event.pos)
+
+    def on_mouse_release(self, event):
+        if self.section_drag_start is not None:
+            self.update_cross_section_line(event.pos, announce=True)
+            self.section_drag_start = None
+        elif event.button == 2 and event.press_event is not None and np.hypot(*(np.asarray(event.pos) - event.press_event.pos)) < 3:
+            # A right click which wasn't a (zooming) drag
+            if not self.title.rect.contains(event.pos[0], event.pos[1]):
+                self.show_gate_context_menu(event)
+
+    def canvas_to_scene(self, canvas_pos) -> np.ndarray:
+        """Map a canvas position into the view's scene (km)."""
+        return self.canvas.scene.node_transform(self.view.scene).map(canvas_pos)[:2]
+
+    def scene_to_image(self, scene_pos) -> tuple[float, float]:
+        """
+        Map a point in a PPI/RHI/CAPPI view's scene to (fractional) image column and
+        row by inverting the polar mapping the image is displayed with.
+        """
+        (num_radials, num_rows) = self.image.size
+        # The mapping is linear in angle and in radius, so a few probes pin it down
+        probes = self.image.transform.map(np.array([[0.0, num_rows], [1.0, num_rows], [0.0, num_rows - 1.0]]))[:, :2]
+        angles = np.arctan2(probes[:, 1], probes[:, 0])
+        radii = np.hypot(probes[:, 0], probes[:, 1])
+        angle_per_radial = np.angle(np.exp(1j * (angles[1] - angles[0])))
+        radius_per_row = radii[0] - radii[2]
+        u = np.angle(np.exp(1j * (np.arctan2(scene_pos[1], scene_pos[0]) - angles[0]))) / angle_per_radial
+        v = num_rows - (radii[0] - np.hypot(scene_pos[0], scene_pos[1])) / radius_per_row
+        return (u, v)
+
+    def scene_to_gate(self, scene_pos) -> TimeSeriesPoint | None:
+        """
+        The gate of a PPI/RHI view's data under a point in its scene, or None if
+        the point isn't on the data.
+        """
+        (u, v) = self.scene_to_image(scene_pos)
+        (num_radials, num_rows) = self.image.size
+        radials_rad = self.elevations_rad if self.slice_type == 'rhi' else self.azimuths_rad
+        radial_idx = int(np.floor(u * len(radials_rad) / num_radials))
+        gate_idx = int(np.floor(v * len(self.ranges_km) / num_rows))
+        if not (0 <= radial_idx < len(radials_rad) and 0 <= gate_idx < len(self.ranges_km)):
+            return None
+        (el_idx, az_idx) = (radial_idx, self.current_az) if self.slice_type == 'rhi' else (self.current_el, radial_idx)
+        description = (f'EL {np.degrees(self.elevations_rad[el_idx]):.1f}°, AZ {np.degrees(self.azimuths_rad[az_idx]):.1f}°, '
+                       f'R {self.ranges_km[gate_idx]:.2f} km')
+        return TimeSeriesPoint(el_idx, az_idx, gate_idx, description)
+
+    def scene_to_ground_km(self, scene_pos) -> tuple[float, float]:
+        """
+        Map a point in a plan view's scene to km east and north of the radar by
+        inverting the polar mapping the image is displayed with (taking slant range
+        as ground distance, as the plan view itself does).
+        """
+        (num_radials, num_rows) = self.image.size
+        (u, v) = self.scene_to_image(scene_pos)
+
+        # Image coordinates to (fractional) data indices, then to the azimuth and range they stand for
+        azimuth_idx = u * len(self.azimuths_rad) / num_radials - 0.5
+        gate_idx = v * len(self.ranges_km) / num_rows - 0.5
+        azimuth_rad = self.azimuths_rad[0] + azimuth_idx * (self.azimuths_rad[-1] - self.azimuths_rad[0]) / max(len(self.azimuths_rad) - 1, 1)
+        range_km = self.ranges_km[0] + gate_idx * (self.ranges_km[-1] - self.ranges_km[0]) / max(len(self.ranges_km) - 1, 1)
+        return (range_km * np.sin(azimuth_rad), range_km * np.cos(azimuth_rad))
+
+    def update_cross_section_line(self, canvas_pos, announce=False):
+        """
+        Redraw the cross-section line being dragged. Cross-section views follow it
+        while it's being dragged, but it's only announced every
+        `section_announce_interval_ms` (building samplers for every mouse move would
+        just queue up work for lines long gone), and right away with `announce`
+        once the drag is over.
+        """
+        end = self.canvas_to_scene(canvas_pos)
+        points = np.array([self.section_drag_start, end], dtype=np.float32)
+        if self.section_line_visual is None:
+            self.section_line_visual = Line(points, color='white', width=2, parent=self.view.scene)
+            # Draw over the image
+            self.section_line_visual.order = 1
+            self.section_line_visual.set_gl_state(depth_test=False)
+        else:
+            self.section_line_visual.set_data(points)
+        self.grid.update()
+
+        self.section_drag_end = end
+        if announce:
+            self.section_announce_timer.stop()
+            self.announce_cross_section_line()
+        elif not self.section_announce_timer.isActive():
+            self.section_announce_timer.start()
+
+    def announce_cross_section_line(self):
+        if self.section_drag_start is not None and np.hypot(*(self.section_drag_end - self.section_drag_start)) > 1e-3:
+            self.cross_section_line_changed.emit(CrossSectionLine(self.scene_to_ground_km(self.section_drag_start), self.scene_to_ground_km(self.section_drag_end)))
+
+    @Slot(object)
+    def on_cross_section_line_changed(self, line: CrossSectionLine):
+        if self.slice_type == 'xsec' and line != self.cross_section_line:
+            self.cross_section_line = line
+            self.update_plot()
+
+    @Slot(object)
+    def on_cross_section_sampler_ready(self, line: CrossSectionLine):
+        if self.slice_type == 'xsec' and line == self.cross_section_line:
+            self.update_plot()
     
     def on_mouse_move(self, event):
         """Handle mouse move events."""
@@ -203,8 +494,15 @@ class SlicePlot(QObject):
             return
         self.throttle = time.monotonic()
 
-        if event.pos is None:
-            # Ignore invalid positions
+        if event.pos is None or self.products is None:
+            # Ignore invalid positions (or no data to probe yet)
+            return
+
+        if self.section_drag_start is not None:
+            self.update_cross_section_line(event.pos)
+            return
+        if self.slice_type == 'xsec':
+            self.show_cross_section_tooltip(event)
             return
         
         # Calculate the inverse transform from local screen coords to image pixel space.
@@ -215,7 +513,7 @@ class SlicePlot(QObject):
         # FIXME: This is a hack to fix the transform to correctly index the input data.
         # I have no idea why this is necessary, but I was luck to notice that the inverse transform was correct in terms of shape, but there is some x-offset that is not accounted for.
         corrected_pos = np.floor(np.array([
-            44 - (canvas_pos[0] + 21.5) if self.slice_type == 'ppi' else 20 - (canvas_pos[0] - 42.6),
+            44 - (canvas_pos[0] + 21.5) if self.is_plan_view() else 20 - (canvas_pos[0] - 42.6),
             canvas_pos[1]]))
 
         x = int(corrected_pos[0])
@@ -224,13 +522,10 @@ class SlicePlot(QObject):
         # Debug print
         # print(f"Uncorrected coords: ({canvas_pos[0]:.2f}, {canvas_pos[1]:.2f})\tCorrected coords: ({x}, {y})")
 
-        prod = self.products[self.product_to_display]
-        if self.slice_type == 'rhi':
-            # RHI: elevation x range
-            slice = prod[:, self.current_az, :].T
-        else:
-            # PPI: azimuth x range.
-            slice = prod[self.current_el, :, :].T
+        slice = self.get_slice()
+        if slice is None:
+            return
+        derived = self.is_plan_product()
 
         # Check if coordinates are within the image bounds
         if 0 <= x < slice.shape[1] and 0 <= y < slice.shape[0]:
@@ -238,8 +533,12 @@ class SlicePlot(QObject):
             value = slice[y, x]  # Get the image value at the pixel
             # FIXME: There are probably better estimates for height.
             tooltip_text = f'''{self.product_to_display}: {value:.2f} {self.cmaps.get_units_for_product(self.product_to_display)}
-Range: {self.ranges_km[y]:.3f} km
-{"Azimuth: " if self.slice_type == "ppi" else "Elevation: "}{self.azimuths_rad[x] * 180.0 / np.pi if self.slice_type == 'ppi' else self.elevations_rad[x] * 180.0 / np.pi:.1f}°
+{"Ground range: " if self.slice_type == "cappi" else "Range: "}{self.ranges_km[y]:.3f} km
+{"Azimuth: " if self.is_plan_view() else "Elevation: "}{self.azimuths_rad[x] * 180.0 / np.pi if self.is_plan_view() else self.elevations_rad[x] * 180.0 / np.pi:.1f}°'''
+            if self.slice_type == 'cappi' and not derived:
+                tooltip_text += f'\nHeight: {self.cappi_height_km:.2f} km'
+            elif not derived:
+                tooltip_text += f'''
 Height: {self.ranges_km[y] * np.sin(self.elevations_rad[x] if self.slice_type == 'rhi' else self.elevations_rad[self.current_el]):.2f} km'''
         else:
             tooltip_text = ""
@@ -248,6 +547,32 @@ Height: {self.ranges_km[y] * np.sin(self.elevations_rad[x] if self.slice_type ==
         QToolTip.showText(self.canvas.native.mapToGlobal(QPoint(event.pos[0], event.pos[1])), tooltip_text, self.canvas.native)
 
 
+    def show_cross_section_tooltip(self, event):
+        slice = self.get_slice()
+        if slice is None:
+            return
+        (col, row) = np.floor(self.canvas.scene.node_transform(self.image).map(event.pos)[:2]).astype(int)
+        if 0 <= col < slice.shape[1] and 0 <= row < slice.shape[0]:
+            tooltip_text = f'''{self.product_to_display}: {slice[row, col]:.2f} {self.cmaps.get_units_for_product(self.product_to_display)}
+Distance: {self.cross_section_sampler.distances_km[col]:.2f} km
+Height: {self.cross_section_sampler.heights_km[row]:.2f} km'''
+        else:
+            tooltip_text = ""
+        QToolTip.showText(self.canvas.native.mapToGlobal(QPoint(event.pos[0], event.pos[1])), tooltip_text, self.canvas.native)
+
+    def show_gate_context_menu(self, event):
+        """Offer the time series of the gate under the mouse (PPI/RHI views)."""
+        if self.slice_type not in ('ppi', 'rhi') or self.products is None:
+            return
+        point = self.scene_to_gate(self.canvas_to_scene(event.pos))
+        if point is None:
+            return
+        context_menu = QMenu()
+        time_series_action = QAction(f'Time series at {point.description}', self)
+        time_series_action.triggered.connect(lambda: self.time_series_requested.emit(point))
+        context_menu.addAction(time_series_action)
+        context_menu.exec(self.canvas.native.mapToGlobal(QPoint(event.pos[0], event.pos[1])))
+
     def show_context_menu(self, event):
         """Show a context menu at the mouse position."""
         # Convert VisPy event position to global Qt position
@@ -267,60 +592,183 @@ Height: {self.ranges_km[y] * np.sin(self.elevations_rad[x] if self.slice_type ==
         context_menu.addAction(self.rho_mode_action)
         context_menu.addAction(self.width_mode_action)
         context_menu.addAction(self.zdr_mode_action)
+        if self.derived_mode_actions:
+            context_menu.addSeparator()
+            for action in self.derived_mode_actions:
+                context_menu.addAction(action)
+        if self.swath_mode_actions:
+            context_menu.addSeparator()
+            for action in self.swath_mode_actions:
+                context_menu.addAction(action)
+        if self.cappi_height_actions:
+            height_menu = context_menu.addMenu("CAPPI height")
+            for action in self.cappi_height_actions:
+                height_menu.addAction(action)
+        color_limit_menu = context_menu.addMenu("Color limits")
+        for action in self.color_limit_actions:
+            color_limit_menu.addAction(action)
 
         # Show it
         context_menu.exec(pos)
 
     @Slot(RadarVolume)
     def on_radar_volume_updated(self, volume: RadarVolume):
-        self.azimuths_rad = volume.azimuths_rad
-        self.elevations_rad = volume.elevations_rad
-        self.ranges_km = volume.ranges_km
+        self.volume = volume
         self.products = volume.products
 
-        # Because we transform into polar coordinates
-        # Width of the camera is range_start_km * 1000 / doppler_resolution + len(ranges)
-        self.y_start = np.floor(volume.start_range_km / volume.doppler_resolution_km) 
-        
-        # Calculate the radial extents of the slice
-        if self.slice_type == 'rhi':
-            self.radial_swath = volume.elevation_swath_rad
-        else:
-            self.radial_swath = volume.azimuth_swath_rad
-
+        # Volumes almost always share the previous one's (interned) geometry, so there's nothing to recompute
+        if volume.geometry is not self.geometry:
+            self.geometry = volume.geometry
+            self.azimuths_rad = volume.azimuths_rad
+            self.elevations_rad = volume.elevations_rad
+            self.ranges_km = volume.ranges_km
+
+            # Because we transform into polar coordinates
+            # Width of the camera is range_start_km * 1000 / doppler_resolution + len(ranges)
+            self.y_start = np.floor(volume.start_range_km / volume.doppler_resolution_km) 
+            
+            # Calculate the radial extents of the slice
+            if self.slice_type == 'rhi':
+                self.radial_swath = volume.elevation_swath_rad
+            else:
+                self.radial_swath = volume.azimuth_swath_rad
+
+        if self.color_limit_mode == 'volume':
+            self.update_color_limits()
         self.update_plot()
 
     @Slot(int, int)
     def on_az_el_index_selection_changed(self, el_idx, az_idx):
         self.current_az = az_idx
         self.current_el = el_idx
-        self.update_plot()
+        if self.depends_on_selection():
+            self.update_plot()
         
     @Slot(int, int)
     def on_az_el_slice_hovered(self, el_idx, az_idx):
         self.current_az = az_idx
         self.current_el = el_idx
-        self.update_plot()
+        if self.depends_on_selection():
+            self.update_plot()
+
+    @Slot(object, str)
+    def on_derived_product_ready(self, volume, product):
+        if volume is self.volume and product == self.product_to_display:
+            self.update_plot()
+
+    @Slot(object)
+    def on_swath_updated(self, source):
+        if self.product_to_display in SWATH_PRODUCT_NAMES and source == self.get_swath_source():
+            self.update_plot()
+
+    def get_slice(self) -> np.ndarray | None:
+        """
+        The 2D (range x radial) data currently on display, or None if it isn't
+        available (yet). Derived products which haven't been computed for the volume
+        are requested, and the plot is updated once they're ready.
+        """
+        if self.product_to_display in SWATH_PRODUCT_NAMES:
+            # Swath: azimuth x range, accumulated over the scan so far (whatever the volume on display)
+            swath = self.swath_engine.get(self.get_swath_source(), self.product_to_display)
+            return swath.T if swath is not None else None
+        if self.product_to_display in DERIVED_PRODUCT_NAMES:
+            # Derived: azimuth x range, whatever the current tilt
+            derived = self.derived_product_engine.get(self.volume, self.product_to_display)
+            return derived.T if derived is not None else None
 
-    def update_plot(self):
-        
         prod = self.products[self.product_to_display]
+        if self.slice_type == 'xsec':
+            # Section: height x distance along the line, sampled with the line's cached gates and weights
+            if self.cross_section_line is None:
+                return None
+            sampler = self.cross_section_sampler_engine.get(self.volume, self.cross_section_line)
+            if sampler is None:
+                return None
+            self.cross_section_sampler = sampler
+            return sampler.sample(self.products, self.product_to_display)
+        if self.slice_type == 'cappi':
+            # CAPPI: azimuth x ground range, resampled with the geometry's cached interpolation weights
+            return get_cappi_interpolator(self.geometry, self.cappi_height_km).apply(prod).T
         if self.slice_type == 'rhi':
             # RHI: elevation x range
-            slice = prod[:, self.current_az, :].T
-        else:
-            # PPI: azimuth x range.
-            slice = prod[self.current_el, :, :].T
+            return prod[:, self.current_az, :].T
+        # PPI: azimuth x range.
+        return prod[self.current_el, :, :].T
 
-        # Update the plot title
-        self.set_plot_title()
+    def update_plot(self):
+        if self.products is None:
+            # Nothing to show until a volume has been loaded
+            return
 
-        # FIXME: make locking the aspect ratio a setting?
-        # Enforce the aspect ratio to be 1
-        self.view.camera.aspect = 1
+        start = time.perf_counter()
+        with tracer.span('update_plot', 'render', view=self.id, slice=self.slice_type, product=self.product_to_display):
+            slice = self.get_slice()
+            if slice is None:
+                # Keep showing the previous image until the derived product is ready
+                if self.slice_type == 'xsec' and self.cross_section_line is None:
+                    self.title.text = f'XSEC ({self.product_to_display}) - Shift+drag on a PPI to draw a section'
+                else:
+                    self.title.text = f'{self.get_view_name()} ({self.product_to_display}) - Computing...'
+                self.grid.update()
+                return
+
+            # Update the plot title
+            self.set_plot_title()
+
+            # FIXME: make locking the aspect ratio a setting?
+            # Enforce the aspect ratio to be 1 (sections are stretched vertically to fill the view)
+            self.view.camera.aspect = None if self.slice_type == 'xsec' else 1
         
-        self.image.set_data(slice)
+            self.image.set_data(slice)
+            if self.slice_type == 'xsec':
+                self.image.transform = self.build_cross_section_transform()
+            else:
+                self.image.transform = self.build_polar_transform()
+
+            self.grid.update()
+        self.last_render_s = time.perf_counter() - start
+
+    @Slot(object)
+    def on_preview_updated(self, thumbnail):
+        """
+        Show a low-resolution (azimuth x range) thumbnail of the lowest reflectivity
+        tilt while the timeline is being scrubbed. The full volume replaces it once
+        it has been loaded.
+        """
+        # Previews only make sense for PPI reflectivity views which have already
+        # received a volume (the preview borrows its geometry).
+        if self.slice_type != 'ppi' or self.product_to_display != 'Z' or self.products is None:
+            return
 
+        self.title.text = f'PPI ({self.product_to_display}) - Preview'
+        self.image.set_data(np.asarray(thumbnail, dtype=np.float32).T)
+
+        # Stretch the thumbnail's range bins back over the full range extent.
+        self.image.transform = self.build_polar_transform(gate_scale=len(self.ranges_km) / thumbnail.shape[1])
+
+        self.grid.update()
+
+    def build_cross_section_transform(self):
+        """
+        Build the transform from image pixel space (distance sample x height sample)
+        into kilometers along the section and above the radar. The camera is fitted
+        to the section whenever a different one is shown.
+        """
+        sampler = self.cross_section_sampler
+        dx = sampler.distances_km[1] - sampler.distances_km[0]
+        dz = sampler.heights_km[1] - sampler.heights_km[0]
+        if sampler is not self.displayed_sampler:
+            self.displayed_sampler = sampler
+            self.view.camera.set_range((0, sampler.distances_km[-1]), (0, sampler.heights_km[-1]))
+        # Pixel centers land on the sample positions
+        return STTransform(scale=(dx, dz), translate=(-dx / 2, sampler.heights_km[0] - dz / 2))
+
+    def build_polar_transform(self, gate_scale=1.0):
+        """
+        Build the transform from image pixel space (radial x gate) into kilometers.
+        `gate_scale` is the number of range gates covered by each image row (1 for
+        full-resolution data).
+        """
         # Complicated method for transforming an image in cartesian coordinates into polar coordinates
         # Credit: https://stackoverflow.com/a/68390497/13542651
 
@@ -332,7 +780,7 @@ Height: {self.ranges_km[y] * np.sin(self.elevations_rad[x] if self.slice_type ==
         yoff = 0
 
         ori0 = 0 # Side of the image to collapse at origin (0 for top/1 for bottom)
-        loc0 = self.radial_swath if self.slice_type == 'ppi' else self.elevations_rad[0] # Location of zero (0, 2* np.pi) clockwise
+        loc0 = self.radial_swath if self.is_plan_view() else self.elevations_rad[0] # Location of zero (0, 2* np.pi) clockwise
         dir0 = 1 # Direction cw/ccw -1, 1
 
         transform = (
@@ -357,12 +805,14 @@ Height: {self.ranges_km[y] * np.sin(self.elevations_rad[x] if self.slice_type ==
 
             # 4
             # direction switch via inverting scale.x
-            *STTransform(scale=(-dir0 if self.slice_type == 'ppi' else dir0, 1.0))
+            *STTransform(scale=(-dir0 if self.is_plan_view() else dir0, 1.0))
 
             # 5
             # Shift the image up for the receive start (start_range_km * 1000 / doppler_resolution)
             *STTransform(translate=(0, self.y_start))
-        )
-        self.image.transform = transform
 
-        self.grid.update()
+            # 6
+            # Stretch downsampled images back over the full set of range gates
+            *STTransform(scale=(1.0, gate_scale))
+        )
+        return transform
@@ -0,0 +1,259 @@
+from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QListWidget, QPlainTextEdit, QPushButton
+from PySide6.QtCore import Qt, QObject, QTimer, Signal, Slot
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from app_config import get_app_dir
+import traceback
+import threading
+import time
+import sys
+
+# Upper edges (ms) of the stall duration histogram buckets
+STALL_BUCKETS_MS = [200, 500, 1000, 2000, 5000, float('inf')]
+
+APP_SOURCE_DIR = Path(__file__).resolve().parent
+
+def extract_stack(frame) -> traceback.StackSummary:
+    """
+    Like traceback.extract_stack(), but frames are named by their qualified name
+    (e.g. "SlicePlot.update_plot") so slots can be told apart.
+    """
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(traceback.FrameSummary(code.co_filename, frame.f_lineno, getattr(code, 'co_qualname', code.co_name), lookup_line=False))
+        frame = frame.f_back
+    frames.reverse()
+    return traceback.StackSummary.from_list(frames)
+
+def attribute_stack(frames: list) -> str:
+    """
+    Name the slot (or event handler) a main thread stack belongs to: the outermost
+    application function below the event loop, e.g. "Data_Manager.on_volumes_loaded".
+    Qt calls slots straight from the event loop, so that's the slot Qt invoked (or
+    the one a lambda connected to the signal forwards to).
+    """
+    for frame in frames:
+        if frame.name == '<module>' or frame.name.endswith('<lambda>'):
+            continue
+        if Path(frame.filename).resolve().parent == APP_SOURCE_DIR:
+            return frame.name
+    # Nothing from the application, e.g. VisPy drawing a canvas
+    return frames[-1].name if frames else '?'
+
+class Stall(object):
+    """
+    A single event loop stall on the main thread and the stacks sampled while it lasted.
+    """
+    def __init__(self, started_at: float, duration_s: float, stacks: list):
+        self.time = datetime.now()
+        self.started_at = started_at
+        self.duration_s = duration_s
+        # traceback.StackSummary of the main thread, outermost frame first
+        self.stacks = stacks
+        culprits = Counter(attribute_stack(stack) for stack in stacks)
+        self.culprit = culprits.most_common(1)[0][0] if culprits else 'unknown (no sample)'
+
+    def format(self) -> str:
+        lines = [f'{self.time.isoformat(timespec="milliseconds")} stalled {self.duration_s * 1000:.0f} ms in {self.culprit} ({len(self.stacks)} samples)']
+        if self.stacks:
+            lines += ['    ' + line for line in ''.join(traceback.format_list(self.stacks[0])).splitlines()]
+        return '\n'.join(lines)
+
+class StallWatchdog(QObject):
+    """
+    Watches the Qt main thread's event loop for stalls. A high-frequency heartbeat
+    timer on the main thread records when the loop last got a chance to run. A
+    sampler thread checks the heartbeat, and while it's overdue by more than
+    `threshold_ms` captures the main thread's Python stack (sys._current_frames()),
+    so a stall can be attributed to the slot that was running. Stalls are kept in
+    a histogram, emitted with `stall_detected` and appended to a log file.
+
+    The sampler needs the GIL, so a stall inside a long C call which holds it (e.g.
+    a big numpy operation) is sampled once the call returns to Python.
+    """
+    stall_detected = Signal(object)
+
+    def __init__(self, threshold_ms=100, heartbeat_ms=10, sample_interval_ms=25, log_path=None):
+        super().__init__()
+        self.threshold_s = threshold_ms / 1000.0
+        self.sample_interval_s = sample_interval_ms / 1000.0
+        self.log_path = Path(log_path) if log_path else get_app_dir() / 'logs' / 'stalls.log'
+
+        self.heartbeat_timer = QTimer(self)
+        self.heartbeat_timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.heartbeat_timer.setInterval(heartbeat_ms)
+        self.heartbeat_timer.timeout.connect(self.on_heartbeat)
+
+        self.main_thread_id = threading.main_thread().ident
+        self.last_beat = time.perf_counter()
+        self.lock = threading.Lock()
+        # Stacks sampled during the current stall (sampler thread -> main thread)
+        self.pending_stacks = []
+        self.stop_event = threading.Event()
+        self.sampler = None
+
+        self.stalls = []
+        self.histogram = [0] * len(STALL_BUCKETS_MS)
+        self.culprit_totals = Counter()
+        self.max_stalls = 500
+
+    def start(self):
+        if self.sampler is not None:
+            return
+        self.last_beat = time.perf_counter()
+        self.heartbeat_timer.start()
+        self.stop_event.clear()
+        self.sampler = threading.Thread(target=self._sample_main_thread, name='StallWatchdogSampler', daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        if self.sampler is None:
+            return
+        self.heartbeat_timer.stop()
+        self.stop_event.set()
+        self.sampler.join()
+        self.sampler = None
+
+    def is_running(self) -> bool:
+        return self.sampler is not None
+
+    @Slot()
+    def on_heartbeat(self):
+        now = time.perf_counter()
+        gap = now - self.last_beat
+        self.last_beat = now
+        if gap <= self.threshold_s:
+            return
+
+        with self.lock:
+            stacks = self.pending_stacks
+            self.pending_stacks = []
+        self._record(Stall(now - gap, gap, stacks))
+
+    def _sample_main_thread(self):
+        next_sample = 0.0
+        while not self.stop_event.wait(self.sample_interval_s / 2):
+            now = time.perf_counter()
+            if now - self.last_beat <= self.threshold_s or now < next_sample:
+                continue
+            frame = sys._current_frames().get(self.main_thread_id)
+            if frame is None:
+                continue
+            stack = extract_stack(frame)
+            with self.lock:
+                self.pending_stacks.append(stack)
+            next_sample = now + self.sample_interval_s
+
+    def _record(self, stall: Stall):
+        duration_ms = stall.duration_s * 1000
+        for (bucket, upper_ms) in enumerate(STALL_BUCKETS_MS):
+            if duration_ms <= upper_ms:
+                self.histogram[bucket] += 1
+                break
+        self.culprit_totals[stall.culprit] += stall.duration_s
+        self.stalls.append(stall)
+        del self.stalls[:-self.max_stalls]
+
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.log_path.open('a') as log_file:
+                log_file.write(stall.format() + '\n')
+        except OSError as e:
+            print(f'Stall watchdog: failed to write "{self.log_path}": {e}')
+
+        self.stall_detected.emit(stall)
+
+    def clear(self):
+        self.stalls.clear()
+        self.histogram = [0] * len(STALL_BUCKETS_MS)
+        self.culprit_totals.clear()
+
+class StallWatchdogWidget(QWidget):
+    """
+    Shows a watchdog's stall histogram, the slots which stalled the longest in total
+    and the stack of any recent stall.
+    """
+    def __init__(self, watchdog: StallWatchdog):
+        super().__init__()
+        self.watchdog = watchdog
+        self.watchdog.stall_detected.connect(self.on_stall_detected)
+
+        self.main_layout = QVBoxLayout(self)
+        self.summary_label = QLabel()
+        self.main_layout.addWidget(self.summary_label)
+        self.histogram_label = QLabel()
+        self.main_layout.addWidget(self.histogram_label)
+        self.culprits_label = QLabel()
+        self.main_layout.addWidget(self.culprits_label)
+
+        self.main_layout.addWidget(QLabel("Recent stalls:"))
+        self.stalls_list = QListWidget()
+        self.stalls_list.currentRowChanged.connect(self.on_stall_selected)
+        self.main_layout.addWidget(self.stalls_list)
+        self.stack_text = QPlainTextEdit()
+        self.stack_text.setReadOnly(True)
+        self.main_layout.addWidget(self.stack_text)
+
+        self.button_layout = QHBoxLayout()
+        self.log_label = QLabel(f'Log: {self.watchdog.log_path}')
+        self.log_label.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        self.button_layout.addWidget(self.log_label)
+        self.clear_button = QPushButton("Clear")
+        self.clear_button.clicked.connect(self.on_clear_clicked)
+        self.button_layout.addWidget(self.clear_button)
+        self.main_layout.addLayout(self.button_layout)
+
+        self.update_summary()
+
+    def update_summary(self):
+        stalls = self.watchdog.stalls
+        worst = max((stall.duration_s for stall in stalls), default=0.0)
+        self.summary_label.setText(f'Stalls over {self.watchdog.threshold_s * 1000:.0f} ms: {sum(self.watchdog.histogram)} (worst {worst * 1000:.0f} ms)')
+
+        edges = [f'≤{upper:.0f}' if upper != float('inf') else f'>{STALL_BUCKETS_MS[-2]:.0f}' for upper in STALL_BUCKETS_MS]
+        self.histogram_label.setText('Histogram (ms): ' + '  '.join(f'{edge}: {count}' for (edge, count) in zip(edges, self.watchdog.histogram)))
+
+        top = self.watchdog.culprit_totals.most_common(5)
+        self.culprits_label.setText('Top slots: ' + (', '.join(f'{name} {total * 1000:.0f} ms' for (name, total) in top) if top else '-'))
+
+    @Slot(object)
+    def on_stall_detected(self, stall: Stall):
+        self.stalls_list.insertItem(0, f'{stall.time.strftime("%H:%M:%S")}  {stall.duration_s * 1000:.0f} ms  {stall.culprit}')
+        # Keep the list in step with the watchdog's stall history (newest first)
+        while self.stalls_list.count() > len(self.watchdog.stalls):
+            self.stalls_list.takeItem(self.stalls_list.count() - 1)
+        self.update_summary()
+
+    @Slot(int)
+    def on_stall_selected(self, row):
+        if 0 <= row < len(self.watchdog.stalls):
+            self.stack_text.setPlainText(self.watchdog.stalls[-1 - row].format())
+
+    def on_clear_clicked(self):
+        self.watchdog.clear()
+        self.stalls_list.clear()
+        self.stack_text.clear()
+        self.update_summary()
+
+# Test code: stall the event loop every second for a growing amount of time.
+if __name__ == "__main__":
+    app = QApplication(sys.argv)
+    watchdog = StallWatchdog(log_path=Path.cwd() / 'stalls.log')
+    window = StallWatchdogWidget(watchdog)
+    window.setWindowTitle("Test Stall Watchdog")
+
+    stall_ms = [50]
+    def busy_slot():
+        end = time.perf_counter() + stall_ms[0] / 1000
+        while time.perf_counter() < end:
+            pass
+        stall_ms[0] = stall_ms[0] * 2 if stall_ms[0] < 1600 else 50
+
+    timer = QTimer()
+    timer.timeout.connect(busy_slot)
+    timer.start(1000)
+    watchdog.start()
+    window.show()
+    sys.exit(app.exec())
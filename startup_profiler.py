@@ -0,0 +1,35 @@
+import time
+
+class StartupProfiler(object):
+    """
+    Records how long each phase of application startup takes. Phases are marked
+    in order with `mark()`, each one measuring the time since the previous mark.
+    Marking is a no-op unless the profiler has been enabled (--profile-startup).
+    """
+    def __init__(self):
+        self.enabled = False
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.phases = []
+
+    def enable(self, start_time=None):
+        self.enabled = True
+        if start_time is not None:
+            self.start_time = start_time
+            self.last_time = start_time
+
+    def mark(self, phase: str):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last_time, now - self.start_time))
+        self.last_time = now
+
+    def report(self) -> str:
+        lines = ['Startup profile:', f'    {"Phase":<40} {"Duration":>10} {"Elapsed":>10}']
+        for (phase, duration, elapsed) in self.phases:
+            lines.append(f'    {phase:<40} {duration * 1000:>7.1f} ms {elapsed * 1000:>7.1f} ms')
+        return '\n'.join(lines)
+
+# Shared profiler for the application's startup sequence
+startup_profiler = StartupProfiler()
@@ -0,0 +1,261 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from radar_volume import RadarVolume
+from cappi import get_cappi_interpolator
+from tracing import tracer
+import numpy as np
+import threading
+import time
+
+# Products accumulated over the volumes of a scan, shown like derived products in plan views
+SWATH_PRODUCT_NAMES = {
+    'MAXZ': 'Max Reflectivity Swath (MAXZ)',
+    'ACC': 'Rainfall Accumulation (ACC)',
+    'LEX': 'Time Since Last Exceedance (LEX)',
+}
+
+# Reflectivity threshold (dBZ) whose last exceedance is tracked
+EXCEEDANCE_THRESHOLD_DBZ = 40.0
+# Marshall-Palmer Z-R relationship (Z = a * R^b), with reflectivity capped to keep hail from dominating
+ZR_A = 200.0
+ZR_B = 1.6
+MAX_RAIN_DBZ = 53.0
+# Longest interval between consecutive volumes rain is accumulated over (longer gaps are missing data)
+MAX_ACCUMULATION_GAP_S = 15 * 60
+
+def get_source_description(source) -> str:
+    """
+    Sources are ('tilt', el_idx) for a tilt of reflectivity, or ('cappi', height_km).
+    """
+    (kind, value) = source
+    return f'{value:g} km CAPPI' if kind == 'cappi' else f'tilt {value}'
+
+def rain_rate_mm_per_h(z_dbz: np.ndarray) -> np.ndarray:
+    """Rain rate from reflectivity (Marshall-Palmer). No data (NaN) is no rain."""
+    z_linear = 10.0 ** (np.minimum(np.nan_to_num(z_dbz, nan=-np.inf), MAX_RAIN_DBZ) / 10.0)
+    return (z_linear / ZR_A) ** (1.0 / ZR_B)
+
+class SwathAccumulator(object):
+    """
+    Running (azimuth x range) reductions of reflectivity over the volumes of a scan,
+    folded in one volume at a time in scan order: the maximum, the rainfall
+    accumulation (sum of rain rate over the time between volumes), the number of
+    volumes with data and the time of the last volume above EXCEEDANCE_THRESHOLD_DBZ.
+    Folding more volumes later (e.g. ones appended in live mode) picks up where it
+    left off.
+    """
+    def __init__(self, source):
+        self.source = source
+        self.lock = threading.Lock()
+        # Files folded in so far, in order (including those which couldn't be read)
+        self.file_paths = []
+        self.max_dbz = None
+        self.depth_mm = None
+        self.count = None
+        # Time (seconds, MATLAB datenum scale) of the last exceedance, NaN if never
+        self.last_exceedance_s = None
+        self.last_time_s = None
+
+    def get_num_folded(self) -> int:
+        return len(self.file_paths)
+
+    def fold(self, file_path, z_dbz: np.ndarray | None, time_s: float | None):
+        """
+        Fold in an (azimuth x range) reflectivity plane observed at `time_s` (seconds).
+        `z_dbz` is None for files which couldn't be read, which are just skipped over.
+        """
+        with self.lock:
+            self.file_paths.append(file_path)
+            if z_dbz is None:
+                return
+            if self.max_dbz is None:
+                self.max_dbz = np.full(z_dbz.shape, np.nan, dtype=np.float32)
+                self.depth_mm = np.zeros(z_dbz.shape, dtype=np.float32)
+                self.count = np.zeros(z_dbz.shape, dtype=np.int32)
+                self.last_exceedance_s = np.full(z_dbz.shape, np.nan, dtype=np.float64)
+            elif z_dbz.shape != self.max_dbz.shape:
+                print(f'Swath ({get_source_description(self.source)}): skipped "{file_path}", its geometry {z_dbz.shape} differs from {self.max_dbz.shape}')
+                return
+
+            np.fmax(self.max_dbz, z_dbz, out=self.max_dbz)
+            self.count += ~np.isnan(z_dbz)
+            if time_s is not None:
+                if self.last_time_s is not None:
+                    dt_s = min(max(time_s - self.last_time_s, 0.0), MAX_ACCUMULATION_GAP_S)
+                    self.depth_mm += (rain_rate_mm_per_h(z_dbz) * (dt_s / 3600.0)).astype(np.float32)
+                with np.errstate(invalid='ignore'):
+                    self.last_exceedance_s[z_dbz >= EXCEEDANCE_THRESHOLD_DBZ] = time_s
+                self.last_time_s = time_s
+
+    def get_product(self, product) -> np.ndarray | None:
+        """
+        An (azimuth x range) float32 snapshot of a swath product (see
+        SWATH_PRODUCT_NAMES), NaN where there has never been data. None until a
+        volume has been folded in.
+        """
+        with self.lock:
+            if self.max_dbz is None:
+                return None
+            if product == 'MAXZ':
+                return self.max_dbz.copy()
+            if product == 'ACC':
+                return np.where(self.count > 0, self.depth_mm, np.float32(np.nan))
+            if product == 'LEX':
+                # Minutes before the latest volume
+                if self.last_time_s is None:
+                    return np.full(self.max_dbz.shape, np.nan, dtype=np.float32)
+                return ((self.last_time_s - self.last_exceedance_s) / 60.0).astype(np.float32)
+        raise KeyError(f'Unknown swath product "{product}"')
+
+def read_reflectivity_plane(file_path, source) -> tuple[np.ndarray | None, float | None]:
+    """
+    Read the (azimuth x range) reflectivity plane of a source from a volume file,
+    and the volume's time in seconds. Only one volume is in memory at a time.
+    """
+    (kind, value) = source
+    if kind == 'cappi':
+        try:
+            volume = RadarVolume.build_radar_volume_from_matlab_file(file_path, storage_modes={'*': 'float16'})
+        except Exception as e:
+            print(f'Swath: failed to load "{file_path}": {e}')
+            return (None, None)
+        plane = get_cappi_interpolator(volume.geometry, value).apply(volume.products['Z']) if 'Z' in volume.products else None
+        datenum = float(volume.time) if volume.time is not None else None
+    else:
+        result = RadarVolume.read_sweep_from_matlab_file(file_path, 'Z', value, with_time=True)
+        (plane, datenum) = result if result is not None else (None, None)
+    return (plane, datenum * 86400.0 if datenum is not None else None)
+
+class SwathTask(QRunnable):
+    """
+    QRunnable task folding the files of the scan an accumulator hasn't seen yet into
+    it, one at a time and in order. Keeps going while files are being appended.
+    """
+    def __init__(self, engine, accumulator):
+        super().__init__()
+        self.engine = engine
+        self.accumulator = accumulator
+
+    def run(self):
+        last_update = time.perf_counter()
+        with tracer.span('swath', 'swath', source=str(self.accumulator.source)):
+            while True:
+                file_path = self.engine._get_next_file(self.accumulator)
+                if file_path is None:
+                    break
+                (plane, time_s) = read_reflectivity_plane(file_path, self.accumulator.source)
+                self.accumulator.fold(file_path, plane, time_s)
+                # Don't redraw the views for every volume
+                if time.perf_counter() - last_update > 0.5:
+                    last_update = time.perf_counter()
+                    self.engine.swath_updated.emit(self.accumulator.source)
+        self.engine._on_task_finished(self.accumulator)
+
+class SwathEngine(QObject):
+    """
+    Streams the volumes of the selected scan through swath accumulators, one per
+    source (a tilt or a CAPPI height), in the background. Accumulators are created
+    the first time one of their products is asked for. When files are appended to
+    the scan the accumulators resume from where they were; when the scan changes
+    they start over.
+    """
+    # Emitted (from the worker thread) with the source of an accumulator which has folded in more volumes
+    swath_updated = Signal(object)
+
+    def __init__(self, max_workers=1):
+        super().__init__()
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(max_workers)
+        self.lock = threading.Lock()
+        self.file_paths = []
+        # Accumulators by source. Tasks stop as soon as their accumulator is discarded.
+        self.accumulators = {}
+        # Sources of the accumulators with a task queued or running
+        self.running = set()
+
+    def set_files(self, file_paths):
+        """
+        Set the files of the selected scan. Accumulators carry on if the files they
+        have folded so far are still the first ones, otherwise they're discarded.
+        """
+        file_paths = [str(file_path) for file_path in file_paths]
+        with self.lock:
+            self.file_paths = file_paths
+            for (source, accumulator) in list(self.accumulators.items()):
+                if accumulator.file_paths != file_paths[:accumulator.get_num_folded()]:
+                    self.accumulators.pop(source)
+            sources = list(self.accumulators)
+        for source in sources:
+            self._start(self.accumulators[source])
+
+    def stop(self):
+        """Discard every accumulator (their tasks stop after the volume they're on)."""
+        with self.lock:
+            self.accumulators.clear()
+
+    def get_progress(self, source) -> tuple[int, int]:
+        """(volumes folded in, volumes in the scan) for a source."""
+        with self.lock:
+            accumulator = self.accumulators.get(source)
+            return (accumulator.get_num_folded() if accumulator is not None else 0, len(self.file_paths))
+
+    def get(self, source, product) -> np.ndarray | None:
+        """
+        A snapshot of a swath product of a source (see SwathAccumulator.get_product()),
+        starting its accumulation if needed. `swath_updated` is emitted as it progresses.
+        """
+        with self.lock:
+            accumulator = self.accumulators.get(source)
+            if accumulator is None:
+                accumulator = self.accumulators[source] = SwathAccumulator(source)
+        self._start(accumulator)
+        return accumulator.get_product(product)
+
+    def _start(self, accumulator):
+        with self.lock:
+            if accumulator.source in self.running or accumulator.get_num_folded() >= len(self.file_paths):
+                return
+            self.running.add(accumulator.source)
+        self.thread_pool.start(SwathTask(self, accumulator))
+
+    def _get_next_file(self, accumulator):
+        with self.lock:
+            if self.accumulators.get(accumulator.source) is not accumulator:
+                return None
+            num_folded = accumulator.get_num_folded()
+            return self.file_paths[num_folded] if num_folded < len(self.file_paths) else None
+
+    def _on_task_finished(self, accumulator):
+        with self.lock:
+            self.running.discard(accumulator.source)
+            current = self.accumulators.get(accumulator.source)
+        if current is accumulator:
+            self.swath_updated.emit(accumulator.source)
+        # Files may have been appended (or the scan replaced) while the task was finishing up
+        if current is not None:
+            self._start(current)
+
+_swath_engine = None
+
+def get_swath_engine() -> SwathEngine:
+    """
+    The shared swath engine, created on first use.
+    """
+    global _swath_engine
+    if _swath_engine is None:
+        _swath_engine = SwathEngine()
+    return _swath_engine
+
+# Benchmark code: python swath_accumulator.py <volume.mat> [<volume.mat> ...]
+if __name__ == "__main__":
+    import sys
+    for source in (('tilt', 0), ('cappi', 2.0)):
+        accumulator = SwathAccumulator(source)
+        start = time.perf_counter()
+        for file_path in sys.argv[1:]:
+            accumulator.fold(file_path, *read_reflectivity_plane(file_path, source))
+        elapsed_s = time.perf_counter() - start
+        print(f'{get_source_description(source)}: {accumulator.get_num_folded()} volumes in {elapsed_s:.2f} s '
+              f'({elapsed_s * 1000 / max(accumulator.get_num_folded(), 1):.1f} ms per volume)')
+        for product in SWATH_PRODUCT_NAMES:
+            values = accumulator.get_product(product)
+            print(f'  {product}: {np.nanmin(values):.2f} .. {np.nanmax(values):.2f}, {np.count_nonzero(~np.isnan(values))} gates with data')
@@ -0,0 +1,273 @@
+from PySide6.QtCore import QObject, QRunnable, QThreadPool, Signal
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from radar_volume import RadarVolume
+from scan_index import timestamp_from_matlab_datenum
+from tracing import tracer
+from pathlib import Path
+import multiprocessing
+import numpy as np
+import threading
+
+# Mean earth radius, for turning lat/lon offsets from the radar into km
+EARTH_RADIUS_KM = 6371.0
+
+class TimeSeriesPoint(object):
+    """
+    A single gate of a scan (tilt, azimuth and range gate indices) whose values are
+    followed through time.
+    """
+    def __init__(self, el_idx, az_idx, gate_idx, description=None):
+        self.el_idx = int(el_idx)
+        self.az_idx = int(az_idx)
+        self.gate_idx = int(gate_idx)
+        self.description = description or f'EL {self.el_idx}, AZ {self.az_idx}, gate {self.gate_idx}'
+
+    def get_key(self) -> tuple:
+        return (self.el_idx, self.az_idx, self.gate_idx)
+
+    def __repr__(self):
+        return f'TimeSeriesPoint({self.description})'
+
+    @staticmethod
+    def from_ground_km(geometry, x_km, y_km, el_idx=0) -> 'TimeSeriesPoint':
+        """
+        The gate of a tilt nearest to a point km east (x) and north (y) of the radar,
+        taking slant range as ground distance like the plan views do. Raises
+        ValueError if the point is outside the scan.
+        """
+        azimuths_rad = geometry.azimuths_rad
+        ranges_km = geometry.ranges_km
+        azimuth_rad = np.arctan2(x_km, y_km)
+        range_km = np.hypot(x_km, y_km)
+        az_idx = int(np.argmin(np.abs(np.angle(np.exp(1j * (azimuths_rad - azimuth_rad))))))
+        gate_idx = int(np.argmin(np.abs(ranges_km - range_km)))
+
+        # Allow half an azimuth/gate spacing beyond the outermost ones
+        az_spacing = geometry.azimuth_swath_rad / max(len(azimuths_rad) - 1, 1)
+        if abs(np.angle(np.exp(1j * (azimuths_rad[az_idx] - azimuth_rad)))) > az_spacing / 2 + 1e-9 and len(azimuths_rad) > 1:
+            raise ValueError(f'Azimuth {np.degrees(azimuth_rad):.1f}° is outside the scan')
+        if abs(ranges_km[gate_idx] - range_km) > geometry.doppler_resolution_km / 2 + 1e-9:
+            raise ValueError(f'Range {range_km:.2f} km is outside the scan')
+
+        description = (f'EL {np.degrees(geometry.elevations_rad[el_idx]):.1f}°, AZ {np.degrees(azimuths_rad[az_idx]):.1f}°, '
+                       f'R {ranges_km[gate_idx]:.2f} km')
+        return TimeSeriesPoint(el_idx, az_idx, gate_idx, description)
+
+    @staticmethod
+    def from_lat_lon(volume, lat, lon, el_idx=0) -> 'TimeSeriesPoint':
+        """
+        The gate of a tilt nearest to a latitude/longitude (degrees), from the radar's
+        location in the volume. Raises ValueError if the volume has no location or the
+        point is outside the scan.
+        """
+        if volume.lat is None or volume.lon is None:
+            raise ValueError('The volume has no radar location')
+        (radar_lat, radar_lon) = (float(volume.lat), float(volume.lon))
+        # Equirectangular approximation, plenty for the ranges of a single radar
+        x_km = EARTH_RADIUS_KM * np.radians(lon - radar_lon) * np.cos(np.radians(radar_lat))
+        y_km = EARTH_RADIUS_KM * np.radians(lat - radar_lat)
+        point = TimeSeriesPoint.from_ground_km(volume.geometry, x_km, y_km, el_idx)
+        point.description = f'{lat:.4f}, {lon:.4f} ({point.description})'
+        return point
+
+class TimeSeries(object):
+    """
+    The values of every product at a point for each volume of a scan, in order.
+    Volumes which couldn't be read are NaN (and have no time).
+    """
+    def __init__(self, point: TimeSeriesPoint, filenames, times, values: dict):
+        self.point = point
+        self.filenames = filenames
+        # datetime (or None) of each volume
+        self.times = times
+        # product -> float32 array with a value per volume
+        self.values = values
+
+    def get_products(self) -> list[str]:
+        return list(self.values)
+
+    def to_csv(self, path):
+        products = self.get_products()
+        with open(path, 'w') as csv_file:
+            csv_file.write(','.join(['index', 'time', 'filename'] + products) + '\n')
+            for (i, (filename, time)) in enumerate(zip(self.filenames, self.times)):
+                row = [str(i), time.isoformat(timespec='milliseconds') if time is not None else '', Path(filename).name]
+                row += ['' if np.isnan(self.values[product][i]) else f'{self.values[product][i]:g}' for product in products]
+                csv_file.write(','.join(row) + '\n')
+
+    def to_npz(self, path):
+        """Save as a NumPy .npz archive: 'time' (datetime64[ms], NaT if unknown) and one array per product."""
+        times = np.array([np.datetime64(time, 'ms') if time is not None else np.datetime64('NaT') for time in self.times], dtype='datetime64[ms]')
+        np.savez(path, time=times, filenames=np.array([str(filename) for filename in self.filenames]), **self.values)
+
+def read_gates(file_paths, el_idx, az_idx, gate_idx) -> list:
+    """
+    Read a gate from each of a chunk of files. Runs in a worker process, and only
+    the (time, values) of each file go back to the parent process.
+    """
+    return [RadarVolume.read_gate_from_matlab_file(file_path, el_idx, az_idx, gate_idx) for file_path in file_paths]
+
+class TimeSeriesTask(QRunnable):
+    """
+    QRunnable task extracting a time series. Files which haven't been read at the
+    point before are read in chunks by a pool of worker processes (parsing .mat
+    files is mostly pure Python, so threads wouldn't help).
+    """
+    def __init__(self, extractor, file_paths, point: TimeSeriesPoint, cancel_flag):
+        super().__init__()
+        self.extractor = extractor
+        self.file_paths = file_paths
+        self.point = point
+        self.cancel_flag = cancel_flag
+
+    def run(self):
+        point_key = self.point.get_key()
+        with tracer.span('time_series', 'time_series', files=len(self.file_paths), point=str(point_key)) as span:
+            missing = [str(path) for path in self.file_paths if self.extractor.get_cached(path, point_key) is None]
+            num_total = len(self.file_paths)
+            num_done = num_total - len(missing)
+            span.set(cached=num_done)
+            self.extractor.progress.emit(num_done, num_total)
+
+            if missing:
+                executor = self.extractor.get_executor()
+                # A few chunks per worker keeps them all busy without drowning in IPC
+                chunk_size = max(1, min(32, len(missing) // (4 * self.extractor.max_workers)))
+                futures = {executor.submit(read_gates, missing[i:i + chunk_size], *point_key): missing[i:i + chunk_size]
+                           for i in range(0, len(missing), chunk_size)}
+                for future in as_completed(futures):
+                    if self.cancel_flag.is_set():
+                        for pending in futures:
+                            pending.cancel()
+                        return
+                    chunk = futures[future]
+                    try:
+                        results = future.result()
+                    except Exception as e:
+                        print(f'Failed to read time series chunk ({len(chunk)} files): {e}')
+                        results = [None] * len(chunk)
+                    for (file_path, result) in zip(chunk, results):
+                        self.extractor.store(file_path, point_key, result)
+                    num_done += len(chunk)
+                    self.extractor.progress.emit(num_done, num_total)
+
+        if not self.cancel_flag.is_set():
+            self.extractor.series_ready.emit(self.extractor.assemble(self.file_paths, self.point))
+
+class TimeSeriesExtractor(QObject):
+    """
+    Extracts the values of every product at a point (see TimeSeriesPoint) from every
+    volume of a scan, in the background. Values read from each file are cached, so
+    extracting the same point again (e.g. after new volumes were appended in live
+    mode) only reads the files which haven't been read yet.
+    """
+    # Emitted (from the worker thread) with (files done, total files)
+    progress = Signal(int, int)
+    # Emitted (from the worker thread) with the finished TimeSeries
+    series_ready = Signal(object)
+
+    def __init__(self, max_workers=None):
+        super().__init__()
+        self.max_workers = max_workers or max(multiprocessing.cpu_count() - 1, 1)
+        # A single extraction at a time; starting a new one cancels the previous one
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(1)
+        self.cancel_flag = threading.Event()
+        self.executor = None
+        self.lock = threading.Lock()
+        # (file path, point key) -> (MATLAB datenum time, {product: value}). Files which couldn't be
+        # read aren't cached, so they're tried again next time (e.g. a live file which was still being written).
+        self.cache = {}
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        """The worker process pool, started the first time it's needed (and kept warm after that)."""
+        with self.lock:
+            if self.executor is None:
+                # Spawned (rather than forked) workers are safe to start from the GUI process
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return self.executor
+
+    def get_cached(self, file_path, point_key):
+        with self.lock:
+            return self.cache.get((str(file_path), point_key))
+
+    def store(self, file_path, point_key, result):
+        if result is not None:
+            with self.lock:
+                self.cache[(str(file_path), point_key)] = result
+
+    def extract(self, file_paths, point: TimeSeriesPoint):
+        """
+        Start extracting a time series. `series_ready` is emitted once it's done.
+        """
+        self.cancel()
+        self.cancel_flag = threading.Event()
+        self.thread_pool.start(TimeSeriesTask(self, list(file_paths), point, self.cancel_flag))
+
+    def cancel(self):
+        self.cancel_flag.set()
+
+    def shutdown(self):
+        self.cancel()
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+    def assemble(self, file_paths, point: TimeSeriesPoint) -> TimeSeries:
+        """Build a TimeSeries from the cached values of the files at the point."""
+        point_key = point.get_key()
+        results = [self.get_cached(file_path, point_key) for file_path in file_paths]
+        products = []
+        for result in results:
+            if result is not None:
+                products += [product for product in result[1] if product not in products]
+        values = {product: np.full(len(file_paths), np.nan, dtype=np.float32) for product in products}
+        times = []
+        for (i, result) in enumerate(results):
+            if result is None:
+                times.append(None)
+                continue
+            (time, volume_values) = result
+            times.append(timestamp_from_matlab_datenum(time) if time is not None else None)
+            for (product, value) in volume_values.items():
+                values[product][i] = value
+        return TimeSeries(point, list(file_paths), times, values)
+
+_time_series_extractor = None
+
+def get_time_series_extractor() -> TimeSeriesExtractor:
+    """
+    The shared time series extractor, created on first use.
+    """
+    global _time_series_extractor
+    if _time_series_extractor is None:
+        _time_series_extractor = TimeSeriesExtractor()
+    return _time_series_extractor
+
+# Benchmark code: python time_series.py <el_idx> <az_idx> <gate_idx> <volume.mat> [<volume.mat> ...]
+if __name__ == "__main__":
+    import sys
+    import time
+    from PySide6.QtCore import QCoreApplication
+    app = QCoreApplication(sys.argv)
+    point = TimeSeriesPoint(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]))
+    file_paths = sys.argv[4:]
+    extractor = get_time_series_extractor()
+    # Start time of each run: the first reads every file, the second is served from the cache
+    starts = [time.perf_counter()]
+
+    def on_series_ready(series):
+        print(f'{point}: {len(series.filenames)} volumes in {time.perf_counter() - starts[-1]:.2f} s')
+        if len(starts) == 1:
+            for product in series.get_products():
+                print(f'  {product}: {np.array2string(series.values[product][:8], precision=2)}{" ..." if len(file_paths) > 8 else ""}')
+            starts.append(time.perf_counter())
+            extractor.extract(file_paths, point)
+        else:
+            extractor.shutdown()
+            app.quit()
+
+    extractor.series_ready.connect(on_series_ready)
+    extractor.extract(file_paths, point)
+    app.exec()
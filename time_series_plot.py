@@ -0,0 +1,105 @@
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QPushButton, QFileDialog
+from PySide6.QtCore import Slot
+from color_maps import PRODUCT_UNITS
+from time_series import TimeSeries
+from pathlib import Path
+import numpy as np
+import os
+
+class TimeSeriesPlot(QWidget):
+    """
+    Plot of a product's values at a point through every volume of a scan (see
+    time_series.py), with CSV and NumPy export of all the products.
+    """
+    def __init__(self, extractor):
+        super().__init__()
+        # matplotlib is slow to import, so it's only imported once the plot is needed
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
+
+        self.extractor = extractor
+        self.extractor.progress.connect(self.on_progress)
+        self.extractor.series_ready.connect(self.on_series_ready)
+        self.series = None
+
+        self.layout = QVBoxLayout(self)
+        self.status_label = QLabel("Right-click a gate on a PPI/RHI view to extract its time series.")
+        self.layout.addWidget(self.status_label)
+
+        self.figure = Figure(figsize=(6, 3), layout='constrained')
+        self.axes = self.figure.add_subplot()
+        self.canvas = FigureCanvasQTAgg(self.figure)
+        self.layout.addWidget(self.canvas)
+
+        controls_layout = QHBoxLayout()
+        self.product_combo = QComboBox()
+        self.product_combo.currentTextChanged.connect(self.update_plot)
+        controls_layout.addWidget(QLabel("Product:"))
+        controls_layout.addWidget(self.product_combo)
+        controls_layout.addStretch()
+        self.export_csv_button = QPushButton("Export CSV...")
+        self.export_csv_button.clicked.connect(lambda: self.export('csv'))
+        controls_layout.addWidget(self.export_csv_button)
+        self.export_npz_button = QPushButton("Export NumPy...")
+        self.export_npz_button.clicked.connect(lambda: self.export('npz'))
+        controls_layout.addWidget(self.export_npz_button)
+        self.layout.addLayout(controls_layout)
+        self.set_export_enabled(False)
+
+    def set_export_enabled(self, enabled):
+        self.export_csv_button.setEnabled(enabled)
+        self.export_npz_button.setEnabled(enabled)
+
+    @Slot(int, int)
+    def on_progress(self, num_done, num_total):
+        self.status_label.setText(f'Extracting time series... {num_done}/{num_total} volumes')
+
+    @Slot(object)
+    def on_series_ready(self, series: TimeSeries):
+        self.series = series
+        num_missing = sum(time is None for time in series.times)
+        self.status_label.setText(f'{series.point.description}: {len(series.filenames)} volumes'
+                                  + (f' ({num_missing} unreadable)' if num_missing else ''))
+
+        # Keep showing the same product if the new series has it
+        product = self.product_combo.currentText()
+        self.product_combo.blockSignals(True)
+        self.product_combo.clear()
+        self.product_combo.addItems(series.get_products())
+        if product in series.get_products():
+            self.product_combo.setCurrentText(product)
+        self.product_combo.blockSignals(False)
+        self.set_export_enabled(True)
+        self.update_plot()
+
+    @Slot()
+    def update_plot(self):
+        self.axes.clear()
+        product = self.product_combo.currentText()
+        if self.series is not None and product in self.series.values:
+            values = self.series.values[product]
+            if all(time is not None for time in self.series.times):
+                self.axes.plot(self.series.times, values, marker='.', linewidth=1)
+                self.figure.autofmt_xdate()
+            else:
+                self.axes.plot(np.arange(len(values)), values, marker='.', linewidth=1)
+                self.axes.set_xlabel('Volume')
+            units = PRODUCT_UNITS.get(product, '')
+            self.axes.set_ylabel(f'{product} ({units})' if units else product)
+            self.axes.set_title(self.series.point.description, fontsize='medium')
+            self.axes.grid(True, alpha=0.3)
+        self.canvas.draw_idle()
+
+    def export(self, file_format):
+        if self.series is None:
+            return
+        (description, extension) = ('CSV files (*.csv)', '.csv') if file_format == 'csv' else ('NumPy archives (*.npz)', '.npz')
+        default_path = os.path.join(os.path.expanduser("~"), f'time_series_{"_".join(map(str, self.series.point.get_key()))}{extension}')
+        (filename, selected_filter) = QFileDialog.getSaveFileName(self, "Export time series...", default_path, description)
+        if not filename:
+            return
+        if file_format == 'csv':
+            self.series.to_csv(filename)
+        else:
+            self.series.to_npz(filename)
+        self.status_label.setText(f'Exported time series to "{Path(filename).name}"')
@@ -1,9 +1,73 @@
 from PySide6.QtWidgets import QApplication, QWidget, QSlider, QVBoxLayout, QHBoxLayout, QPushButton, QLabel, QSpacerItem, QSizePolicy
-from PySide6.QtCore import Qt, QSize, Slot, Signal, QTimer
-from PySide6.QtGui import QIcon
+from PySide6.QtCore import Qt, QSize, QRect, Slot, Signal, QTimer
+from PySide6.QtGui import QIcon, QPainter, QColor
+from tracing import tracer
+import numpy as np
+
+class ResidencyBar(QWidget):
+    """
+    A thin bar showing the state of every volume in the timeline (unloaded, loading,
+    loaded or failed), one cell per index. Changing a single index only repaints
+    that index's cell.
+    """
+    # Color for each Data_Manager file state
+    STATE_COLORS = {
+        0: QColor('#5a5a5a'), # unloaded
+        1: QColor('#e0a020'), # loading
+        2: QColor('#30b040'), # loaded
+        3: QColor('#d03030'), # failed
+    }
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.states = np.zeros(0, dtype=np.int8)
+        self.setFixedHeight(6)
+        self.setToolTip("Volume residency: unloaded (gray), loading (amber), loaded (green), failed (red)")
+
+    def set_states(self, states):
+        self.states = np.asarray(states, dtype=np.int8).copy()
+        self.update()
+
+    def set_count(self, count):
+        """Grow (or shrink) the number of volumes, new volumes starting out unloaded."""
+        if count != len(self.states):
+            states = np.zeros(count, dtype=np.int8)
+            states[:min(count, len(self.states))] = self.states[:count]
+            self.states = states
+            # Every cell's width changes with the number of volumes
+            self.update()
+
+    def set_state(self, index, state):
+        if 0 <= index < len(self.states) and self.states[index] != state:
+            self.states[index] = state
+            self.update(self.get_cell_rect(index))
+
+    def get_cell_edges(self, index):
+        # Integer pixel edges so neighbouring cells never overlap or leave gaps
+        width = self.width()
+        return (index * width // len(self.states), (index + 1) * width // len(self.states))
+
+    def get_cell_rect(self, index):
+        (left, right) = self.get_cell_edges(index)
+        return QRect(left, 0, max(1, right - left), self.height())
+
+    def paintEvent(self, event):
+        if len(self.states) == 0:
+            return
+        painter = QPainter(self)
+        # Only the cells intersecting the dirty region
+        width = self.width()
+        first = max(0, event.rect().left() * len(self.states) // width)
+        last = min(len(self.states) - 1, event.rect().right() * len(self.states) // width)
+        for index in range(first, last + 1):
+            (left, right) = self.get_cell_edges(index)
+            painter.fillRect(left, 0, max(1, right - left), self.height(), self.STATE_COLORS.get(int(self.states[index]), self.STATE_COLORS[0]))
+        painter.end()
 
 class TimelineControls(QWidget):
     timeline_index_changed = Signal(int)
+    # Emitted continuously while the slider is dragged (a full load only happens on release).
+    timeline_index_previewed = Signal(int)
 
     def __init__(self):
         super().__init__()
@@ -37,18 +101,31 @@ class TimelineControls(QWidget):
         self.timeline_slider.setSingleStep(1)
         self.timeline_slider.setPageStep(1)
         self.timeline_slider.valueChanged.connect(self.timeline_index_changed)
+        self.timeline_slider.valueChanged.connect(self.update_time_label)
         self.timeline_slider.setTickPosition(QSlider.TickPosition.TicksBelow)
         self.timeline_slider.setTickInterval(1)
         self.timeline_slider.setTracking(False) # Don't emit an updated value until the user stops dragging the slider.
+        self.timeline_slider.sliderMoved.connect(self.timeline_index_previewed) # But do request cheap previews while dragging.
+        self.timeline_slider.sliderMoved.connect(self.update_time_label)
         # self.timeline_slider.setEnabled(False)  # Disabled until data is loaded
 
+        # Volume residency under the slider
+        self.residency_bar = ResidencyBar()
+
         # Add the slider to the timeline layout
-        self.timeline_button_layout.addWidget(self.timeline_slider)
+        self.slider_layout = QVBoxLayout()
+        self.slider_layout.setSpacing(1)
+        self.slider_layout.addWidget(self.timeline_slider)
+        self.slider_layout.addWidget(self.residency_bar)
+        self.timeline_button_layout.addLayout(self.slider_layout)
         self.main_layout.addLayout(self.timeline_button_layout)
 
         self.timeline_label = QLabel("Selected Time:")
         self.main_layout.addWidget(self.timeline_label)
 
+        # Time of each volume in the scan (datetime or None), indexed by slider position
+        self.scan_times = []
+
         # Set up the timer
         self.timer = QTimer()
         self.timer.setInterval(1000)
@@ -58,27 +135,61 @@ class TimelineControls(QWidget):
     def on_forward_button_pressed(self):
         current_val = self.timeline_slider.value()
         new_val = current_val + 1
-        if new_val <= self.timeline_slider.maximum():
+        if new_val > self.timeline_slider.maximum():
+            new_val = 0
+        # Everything the new index triggers synchronously (eviction, prefetch, rendering) nests under this span.
+        with tracer.span('step forward', 'timeline', index=new_val, playing=self.timer.isActive()):
             self.timeline_slider.setValue(new_val)
-        else:
-            self.timeline_slider.setValue(0)
         
     @Slot()
     def on_back_button_pressed(self):
         current_val = self.timeline_slider.value()
         new_val = current_val - 1
-        if 0 <= new_val:
+        if new_val < 0:
+            new_val = self.timeline_slider.maximum()
+        with tracer.span('step back', 'timeline', index=new_val):
             self.timeline_slider.setValue(new_val)
-        else:
-            self.timeline_slider.setValue(self.timeline_slider.maximum())
 
     @Slot(int)
     def on_num_volumes_changed(self, num_vols: int):
         self.timeline_slider.setValue(0)
-        self.scan_times = num_vols
         print(f"Timeline Slider Updated Range: [{0}, {num_vols})")
         self.timeline_slider.setRange(0, num_vols - 1)
 
+    @Slot(int)
+    def on_num_volumes_appended(self, num_vols: int):
+        """Grow the range without moving the slider (volumes were appended to the scan)."""
+        self.timeline_slider.setMaximum(num_vols - 1)
+        self.residency_bar.set_count(num_vols)
+        self.update_time_label(self.timeline_slider.value())
+
+    @Slot(int)
+    def on_follow_index(self, index: int):
+        """Jump to a volume (e.g. the newest volume in live mode) unless the user is dragging the slider."""
+        if not self.timeline_slider.isSliderDown():
+            self.timeline_slider.setValue(index)
+
+    @Slot(int, int)
+    def on_file_state_changed(self, index: int, state: int):
+        self.residency_bar.set_state(index, state)
+
+    @Slot(object)
+    def on_file_states_reset(self, states):
+        self.residency_bar.set_states(states)
+
+    @Slot(list)
+    def on_scan_times_changed(self, scan_times: list):
+        self.scan_times = scan_times
+        self.update_time_label(self.timeline_slider.sliderPosition())
+
+    @Slot(int)
+    def update_time_label(self, index: int):
+        position = f'({index + 1} / {self.timeline_slider.maximum() + 1})'
+        if 0 <= index < len(self.scan_times) and self.scan_times[index] is not None:
+            self.timeline_label.setText(f'Selected Time: {self.scan_times[index].strftime("%m/%d/%Y %H:%M:%S")} {position}')
+        else:
+            self.timeline_label.setText(f'Selected Time: {position}')
+
     def toggle_play_pause(self):
         if self.timer.isActive():
             self.timer.stop()
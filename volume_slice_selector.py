@@ -2,6 +2,7 @@ from PySide6.QtWidgets import QApplication, QWidget, QGraphicsView, QGraphicsSce
 from PySide6.QtCore import Qt, Signal, QObject, Slot, QEvent
 from PySide6.QtGui import QBrush, QPen
 from radar_volume import RadarVolume
+from tracing import tracer
 
 class CircleItem(QObject, QGraphicsEllipseItem):
     """
@@ -139,7 +140,8 @@ class CircleScene(QGraphicsScene):
         if 0 <= row < self.rows and 0 <= col < self.cols:
             if self.last_hover_x != col or self.last_hover_y != row:
                 # print(f"New hover location! ({col}, {row})")
-                self.mouse_hovered.emit(row, col)
+                with tracer.span('hover', 'selector', el=row, az=col):
+                    self.mouse_hovered.emit(row, col)
             self.last_hover_x = col
             self.last_hover_y = row
         else: 
@@ -204,6 +206,8 @@ class VolumeSliceSelector(QWidget):
         self.x_spacing = 50
         self.y_spacing = 50
         self.radius = 20
+        # Scan geometry the grid was last built for
+        self.geometry = None
 
     @Slot(int, int, int, int)
     def on_grid_updated(self, rows, cols, x_spacing, y_spacing, radius):
@@ -214,25 +218,30 @@ class VolumeSliceSelector(QWidget):
         self.y_spacing = y_spacing
         self.radius = radius
 
-        # Clear the existing scene
-        self.scene.clear()
-        self.scene.circles = []
+        with tracer.span('on_grid_updated', 'selector', rows=rows, cols=cols):
+            # Clear the existing scene
+            self.scene.clear()
+            self.scene.circles = []
 
-        # Calculate the total height for flipping the y-axis
-        total_height = (rows - 1) * y_spacing
+            # Calculate the total height for flipping the y-axis
+            total_height = (rows - 1) * y_spacing
 
-        # Add updated grid
-        self.scene.add_labels(rows, cols, x_spacing, y_spacing, radius, total_height)
-        for i in range(rows):
-            for j in range(cols):
-                x = j * x_spacing
-                y = total_height - (i * y_spacing)
-                circle = CircleItem(i, j, x, y, radius)
-                # circle.mouse_hovered.connect(self.scene.highlight_row_and_column)
-                self.scene.addItem(circle)
+            # Add updated grid
+            self.scene.add_labels(rows, cols, x_spacing, y_spacing, radius, total_height)
+            for i in range(rows):
+                for j in range(cols):
+                    x = j * x_spacing
+                    y = total_height - (i * y_spacing)
+                    circle = CircleItem(i, j, x, y, radius)
+                    # circle.mouse_hovered.connect(self.scene.highlight_row_and_column)
+                    self.scene.addItem(circle)
 
     @Slot(RadarVolume)
     def on_render_volume(self, r_volume: RadarVolume):
+        # The grid only has to be rebuilt (losing the selection) when the scan geometry changes
+        if r_volume.geometry is self.geometry:
+            return
+        self.geometry = r_volume.geometry
         self.on_grid_updated(len(r_volume.elevations_rad), len(r_volume.azimuths_rad), 20, 20, 10)
 
     @Slot(int, int)